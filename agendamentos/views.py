@@ -1,15 +1,34 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import Http404, JsonResponse
 from django.contrib.auth.decorators import login_required
-from servicos.models import Agendamento, Servico, Profissional
+from servicos.models import Agendamento, AgendamentoListagem, Servico, Profissional
+from servicos.models_mongo import ClienteMongo
+from servicos import catalogo
 from datetime import datetime, timedelta
 
 def lista_agendamentos(request):
-    """Lista todos os agendamentos"""
+    """Lista os agendamentos de hoje em diante (ou de uma data), paginados por cursor"""
     try:
-        agendamentos = Agendamento.objects.all().order_by('-data_agendamento')
+        inicio = fim = None
+        data_filtro = request.GET.get('data', '')
+        if data_filtro:
+            try:
+                inicio = datetime.strptime(data_filtro, '%Y-%m-%d')
+                fim = inicio + timedelta(days=1)
+            except ValueError:
+                data_filtro = ''
+        
+        agendamentos, proximo_cursor = AgendamentoListagem.fila(
+            inicio=inicio,
+            fim=fim,
+            status=request.GET.get('status') or None,
+            profissional_id=request.GET.get('profissional') or None,
+            cursor=request.GET.get('cursor'),
+        )
         context = {
             'agendamentos': agendamentos,
+            'proximo_cursor': proximo_cursor,
+            'data_filtro': data_filtro,
             'page_title': 'Agendamentos'
         }
         return render(request, 'agendamentos/lista_agendamentos.html', context)
@@ -53,6 +72,11 @@ def criar_agendamento(request):
             
             agendamento.save()
             
+            try:
+                ClienteMongo.registrar_agendamento(cliente_telefone, cliente_nome)
+            except Exception as e:
+                print(f"⚠️ Erro ao atualizar cliente: {str(e)}")
+            
             return redirect('detalhe_agendamento', agendamento_id=str(agendamento.id))
             
         except Exception as e:
@@ -64,8 +88,8 @@ def criar_agendamento(request):
     
     # GET - mostrar formulário
     try:
-        servicos = Servico.objects(ativo=True).order_by('nome')
-        profissionais = Profissional.objects(ativo=True).order_by('nome_completo')
+        servicos = catalogo.servicos_disponiveis(ordem='nome')
+        profissionais = catalogo.profissionais_ativos()
         
         context = {
             'servicos': servicos,
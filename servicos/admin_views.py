@@ -5,14 +5,17 @@ from django.contrib.admin.views.decorators import staff_member_required as staff
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 from .models import (
-    Servico, Profissional, Agendamento, ConfiguracaoBarbearia, HorarioDisponivel,
-    ProdutoRoupa, CategoriaRoupa, VendaRoupa
+    Servico, Profissional, Agendamento, AgendamentoListagem, ConfiguracaoBarbearia, HorarioDisponivel,
+    ProdutoRoupa, CategoriaRoupa, VendaRoupa, ResumoVendasDia
 )
+from . import catalogo
+from .respostas import json_condicional
 from django.contrib.auth.decorators import login_required
 from django.http import Http404, JsonResponse
 from django.utils import timezone
 from datetime import datetime, timedelta
 from collections import Counter, defaultdict
+from bson import ObjectId
 import json
 
 @login_required
@@ -26,7 +29,7 @@ def estatisticas_dashboard(request):
         total_agendamentos = Agendamento.objects.count()
         
         # Agendamentos recentes
-        agendamentos_recentes = Agendamento.objects.order_by('-data_criacao')[:10]
+        agendamentos_recentes = AgendamentoListagem.objects.order_by('-data_criacao')[:10]
         
         # Agendamentos por status
         agendamentos_pendentes = Agendamento.objects(status='pendente').count()
@@ -38,9 +41,8 @@ def estatisticas_dashboard(request):
         produtos_estoque_baixo = ProdutoRoupa.produtos_estoque_baixo()
         total_vendas_roupa = VendaRoupa.objects.count()
         
-        # Vendas de hoje (roupas)
-        vendas_hoje_roupa = VendaRoupa.vendas_hoje()
-        total_hoje_roupa = sum(float(v.valor_total) for v in vendas_hoje_roupa)
+        # Vendas de hoje (roupas), lidas do resumo diário
+        total_hoje_roupa = ResumoVendasDia.fechamento()['valor_liquido']
         
         # Configuração da barbearia
         config = ConfiguracaoBarbearia.get_configuracao()
@@ -165,11 +167,43 @@ def servico_admin_delete(request, pk):
 @login_required
 @staff_required
 def agendamentos_fila(request):
-    """Lista agendamentos em fila"""
+    """Fila de atendimento: hoje e próximos dias, com filtros e paginação por cursor"""
     try:
-        agendamentos = Agendamento.objects.all().order_by('-data_agendamento')
+        status = request.GET.get('status', '')
+        profissional_id = request.GET.get('profissional', '')
+        data_filtro = request.GET.get('data', '')
+        
+        # Com data: só aquele dia; sem data: de hoje em diante
+        inicio = fim = None
+        if data_filtro:
+            try:
+                inicio = datetime.strptime(data_filtro, '%Y-%m-%d')
+                fim = inicio + timedelta(days=1)
+            except ValueError:
+                data_filtro = ''
+        
+        agendamentos, proximo_cursor = AgendamentoListagem.fila(
+            inicio=inicio,
+            fim=fim,
+            status=status or None,
+            profissional_id=profissional_id or None,
+            cursor=request.GET.get('cursor'),
+        )
+        
+        # Filtros atuais, para manter no link da próxima página
+        parametros = request.GET.copy()
+        parametros.pop('cursor', None)
+        
         context = {
             'agendamentos': agendamentos,
+            'proximo_cursor': proximo_cursor,
+            'pagina_seguinte': bool(request.GET.get('cursor')),
+            'parametros': parametros.urlencode(),
+            'profissionais': catalogo.profissionais_ativos(),
+            'status_opcoes': Agendamento._fields['status'].choices,
+            'status_filtro': status,
+            'profissional_filtro': profissional_id,
+            'data_filtro': data_filtro,
             'page_title': 'Agendamentos'
         }
         return render(request, 'servicos/admin/agendamentos_fila.html', context)
@@ -323,18 +357,14 @@ def historico_agendamentos(request):
         data_inicio = datetime.combine(data_obj, dt_time.min)
         data_fim = datetime.combine(data_obj + timedelta(days=1), dt_time.min)
         
-        agendamentos = Agendamento.objects(
+        agendamentos = AgendamentoListagem.objects(
             data_agendamento__gte=data_inicio,
             data_agendamento__lt=data_fim
         ).order_by('hora_agendamento')
         
         # Filtrar por serviço se selecionado
-        if servico_id:
-            try:
-                servico_filtro = Servico.objects.get(id=servico_id)
-                agendamentos = agendamentos.filter(servico=servico_filtro)
-            except:
-                pass
+        if servico_id and ObjectId.is_valid(servico_id):
+            agendamentos = agendamentos.filter(servico_id=ObjectId(servico_id))
         
         # Buscar todos os serviços para o filtro
         servicos = Servico.objects.all().order_by('nome')
@@ -447,9 +477,7 @@ def profissional_admin_form(request, pk=None):
 def toggle_status_barbearia(request):
     """Alterna status da barbearia (aberta/fechada)"""
     try:
-        config = ConfiguracaoBarbearia.get_configuracao()
-        config.aberta = not config.aberta
-        config.save()
+        config = ConfiguracaoBarbearia.alternar_aberta()
         
         status = "aberta" if config.aberta else "fechada"
         return JsonResponse({
@@ -476,41 +504,44 @@ def api_status_barbearia(request):
             'error': str(e)
         }, status=500)
 
+def _servicos_disponiveis_api(cat):
+    servicos = sorted(cat.disponiveis, key=lambda s: s.nome)
+    return {'servicos': [
+        {
+            'id': s.id,
+            'nome': s.nome,
+            'descricao': s.descricao,
+            'preco': s.preco,
+            'duracao_minutos': s.duracao_minutos
+        }
+        for s in servicos
+    ]}
+
 def api_servicos_disponiveis(request):
-    """API para listar serviços disponíveis"""
+    """API para listar serviços disponíveis (do catálogo em memória, com ETag)"""
     try:
-        servicos = Servico.objects(disponivel=True).order_by('nome')
-        servicos_data = []
-        for servico in servicos:
-            servicos_data.append({
-                'id': str(servico.id),
-                'nome': servico.nome,
-                'descricao': servico.descricao,
-                'preco': float(servico.preco),
-                'duracao_minutos': servico.duracao_minutos
-            })
-        return JsonResponse({
-            'servicos': servicos_data
-        })
+        corpo, etag = catalogo.obter_catalogo().serializado('api_servicos', _servicos_disponiveis_api)
+        return json_condicional(request, corpo, etag)
     except Exception as e:
         return JsonResponse({
             'error': str(e)
         }, status=500)
 
+def _profissionais_disponiveis_api(cat):
+    return {'profissionais': [
+        {
+            'id': p.id,
+            'nome': p.nome_completo,
+            'especialidades': list(p.especialidades)
+        }
+        for p in cat.ativos
+    ]}
+
 def api_profissionais_disponiveis(request):
-    """API para listar profissionais disponíveis"""
+    """API para listar profissionais disponíveis (do catálogo em memória, com ETag)"""
     try:
-        profissionais = Profissional.objects(ativo=True).order_by('nome_completo')
-        profissionais_data = []
-        for profissional in profissionais:
-            profissionais_data.append({
-                'id': str(profissional.id),
-                'nome': profissional.nome_completo,
-                'especialidades': profissional.especialidades
-            })
-        return JsonResponse({
-            'profissionais': profissionais_data
-        })
+        corpo, etag = catalogo.obter_catalogo().serializado('api_profissionais', _profissionais_disponiveis_api)
+        return json_condicional(request, corpo, etag)
     except Exception as e:
         return JsonResponse({
             'error': str(e)
@@ -849,4 +880,60 @@ def estatisticas_vendas_json(request):
         return JsonResponse({
             'success': False,
             'error': str(e)
-        }, status=500)
\ No newline at end of file
+        }, status=500)
+
+@login_required
+@staff_required
+def relatorio_margem_json(request):
+    """Relatório de margem das vendas de roupa (por produto, categoria, vendedor ou dia)"""
+    try:
+        agrupar_por = request.GET.get('agrupar', 'produto')
+        data_inicio_str = request.GET.get('data_inicio', '')
+        data_fim_str = request.GET.get('data_fim', '')
+        
+        if data_inicio_str and data_fim_str:
+            data_inicio = datetime.strptime(data_inicio_str, '%Y-%m-%d')
+            # Inclui o dia final inteiro
+            data_fim = datetime.strptime(data_fim_str, '%Y-%m-%d') + timedelta(days=1, microseconds=-1)
+        else:
+            # Parâmetro de período (padrão: últimos 30 dias)
+            try:
+                dias = int(request.GET.get('periodo', '30'))
+            except ValueError:
+                dias = 30
+            data_fim = timezone.now()
+            data_inicio = data_fim - timedelta(days=dias)
+        
+        relatorio = VendaRoupa.relatorio_margem(data_inicio, data_fim, agrupar_por=agrupar_por)
+        
+        totais = {
+            'receita': round(sum(linha['receita'] for linha in relatorio), 2),
+            'custo': round(sum(linha['custo'] for linha in relatorio), 2),
+            'lucro': round(sum(linha['lucro'] for linha in relatorio), 2),
+            'itens_sem_custo': sum(linha['itens_sem_custo'] for linha in relatorio),
+        }
+        
+        return JsonResponse({
+            'success': True,
+            'agrupar_por': agrupar_por,
+            'periodo': {
+                'data_inicio': data_inicio.isoformat(),
+                'data_fim': data_fim.isoformat()
+            },
+            'totais': totais,
+            'linhas': relatorio
+        })
+        
+    except ValueError as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+    except Exception as e:
+        print(f"❌ Erro ao gerar relatório de margem: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
@@ -0,0 +1,143 @@
+"""
+Normalização de texto para a busca de serviços
+
+Os termos são comparados sem acentos e em minúsculas ("degradê" == "degrade"),
+quebrados em palavras e sem as palavras curtas mais comuns do português.
+O autocompletar usa uma árvore de prefixos montada junto com o catálogo em
+memória (servicos.catalogo).
+"""
+import re
+import unicodedata
+
+# Palavras ignoradas na indexação e na busca
+PALAVRAS_IGNORADAS = frozenset({
+    'a', 'o', 'as', 'os', 'e', 'de', 'da', 'do', 'das', 'dos', 'em', 'no', 'na',
+    'nos', 'nas', 'um', 'uma', 'com', 'para', 'por', 'ou',
+})
+
+_SEPARADORES = re.compile(r'[^0-9a-z]+')
+
+
+def normalizar(texto):
+    """Remove acentos e converte para minúsculas ('Degradê' -> 'degrade')"""
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+
+def tokenizar(texto):
+    """Palavras normalizadas do texto, na ordem em que aparecem e sem repetição"""
+    termos = []
+    for termo in _SEPARADORES.split(normalizar(texto)):
+        if termo and termo not in PALAVRAS_IGNORADAS and termo not in termos:
+            termos.append(termo)
+    return termos
+
+
+def termos_consulta(texto):
+    """
+    Termos de uma busca digitada: a última palavra é tratada como prefixo ainda
+    incompleto, então é mantida mesmo que seja uma palavra ignorada ("de" -> "degradê").
+    """
+    termos = tokenizar(texto)
+    palavras = [p for p in _SEPARADORES.split(normalizar(texto)) if p]
+    if palavras and palavras[-1] in PALAVRAS_IGNORADAS and not (texto or '')[-1:].isspace():
+        if palavras[-1] not in termos:
+            termos.append(palavras[-1])
+    return termos
+
+
+# ---------------------------------------------------------------------------
+# Autocompletar: árvore de prefixos em memória com os nomes de serviços e categorias
+# ---------------------------------------------------------------------------
+
+class ArvorePrefixos:
+    """
+    Trie das palavras normalizadas dos nomes.
+
+    Cada nó guarda as posições das sugestões que têm alguma palavra começando
+    pelo prefixo até ali, então uma consulta custa o tamanho do prefixo.
+    """
+
+    def __init__(self, sugestoes):
+        self.sugestoes = sugestoes
+        self.raiz = {}
+        for posicao, sugestao in enumerate(sugestoes):
+            for palavra in sugestao['_termos']:
+                no = self.raiz
+                for letra in palavra:
+                    no = no.setdefault(letra, {})
+                    no.setdefault('', set()).add(posicao)
+
+    def _posicoes(self, prefixo):
+        no = self.raiz
+        for letra in prefixo:
+            no = no.get(letra)
+            if no is None:
+                return set()
+        return no.get('', set())
+
+    def buscar(self, texto, limite=10):
+        """Sugestões cujas palavras começam por todos os termos digitados, das mais relevantes para as menos"""
+        termos = termos_consulta(texto)
+        if not termos:
+            return []
+
+        posicoes = None
+        for termo in sorted(termos, key=len, reverse=True):
+            encontradas = self._posicoes(termo)
+            posicoes = encontradas if posicoes is None else posicoes & encontradas
+            if not posicoes:
+                return []
+
+        consulta = ' '.join(termos)
+        candidatas = [self.sugestoes[p] for p in posicoes]
+        candidatas.sort(key=lambda s: self._relevancia(s, termos, consulta))
+        return [{k: v for k, v in s.items() if not k.startswith('_')} for s in candidatas[:limite]]
+
+    @staticmethod
+    def _relevancia(sugestao, termos, consulta):
+        """Menor é melhor: nome começando pela busca, destaque, palavra inicial, nome curto"""
+        nome = sugestao['_nome']
+        return (
+            not nome.startswith(consulta),
+            not sugestao.get('destaque', False),
+            not sugestao['_termos'][0].startswith(termos[0]),
+            sugestao['tipo'] != 'servico',
+            len(nome),
+            nome,
+        )
+
+
+def _sugestao(tipo, nome, **dados):
+    """Entrada da árvore; campos com '_' são internos e não vão para a resposta"""
+    return dict(tipo=tipo, nome=nome, _nome=' '.join(tokenizar(nome)) or normalizar(nome),
+                _termos=tokenizar(nome) or [normalizar(nome)], **dados)
+
+
+def montar_arvore(servicos):
+    """Árvore a partir dos retratos dos serviços disponíveis (catalogo.ServicoCatalogo)"""
+    sugestoes = []
+    categorias = set()
+    for servico in servicos:
+        if not servico.nome:
+            continue
+        categoria = servico.categoria or 'Outros'
+        categorias.add(categoria)
+        sugestoes.append(_sugestao(
+            'servico', servico.nome,
+            id=servico.id,
+            descricao=servico.descricao,
+            preco=servico.preco,
+            categoria=categoria,
+            destaque=servico.destaque,
+        ))
+    for categoria in sorted(categorias):
+        sugestoes.append(_sugestao('categoria', categoria))
+    return ArvorePrefixos(sugestoes)
+
+
+def sugerir(texto, limite=10):
+    """Até 'limite' serviços e categorias que completam o texto digitado, sem consultar o banco"""
+    from .catalogo import obter_catalogo
+
+    return obter_catalogo().arvore.buscar(texto, limite)
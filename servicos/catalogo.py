@@ -0,0 +1,218 @@
+"""
+Cache do catálogo de serviços e profissionais (e da configuração da barbearia) por processo
+
+Os serviços e profissionais ficam em memória como retratos imutáveis (só os
+campos exibidos nas páginas públicas). Cada processo confere a versão do
+catálogo (ContadorSequencia 'catalogo_servicos', incrementado em toda escrita
+de Servico ou Profissional) no máximo a cada INTERVALO_VERIFICACAO segundos e
+só recarrega quando ela muda. A configuração da barbearia segue o mesmo
+esquema com o contador 'configuracao_barbearia'.
+"""
+import threading
+import time
+from collections import namedtuple
+
+# Segundos entre verificações da versão do catálogo no banco
+INTERVALO_VERIFICACAO = 5
+
+CAMPOS_PROFISSIONAL = ('nome_completo', 'telefone', 'email', 'foto', 'bio', 'especialidades',
+                       'experiencia_anos', 'ativo', 'avaliacao_media', 'total_avaliacoes')
+CAMPOS_SERVICO = ('nome', 'descricao', 'preco', 'categoria', 'imagem', 'disponivel', 'destaque',
+                  'tags', 'duracao_minutos', 'profissionais_habilitados')
+
+ProfissionalCatalogo = namedtuple('ProfissionalCatalogo', ('id',) + CAMPOS_PROFISSIONAL)
+ServicoCatalogo = namedtuple('ServicoCatalogo', ('id',) + CAMPOS_SERVICO)
+
+
+class CacheVersionado:
+    """Valor montado a partir do banco e mantido em memória enquanto a versão do contador não muda"""
+
+    def __init__(self, contador, carregar):
+        self.contador = contador
+        self.carregar = carregar
+        self.valor = None
+        self.versao = None
+        self.verificado_em = 0.0
+        self.trava = threading.Lock()
+
+    def _valido(self):
+        return self.valor is not None and time.monotonic() - self.verificado_em < INTERVALO_VERIFICACAO
+
+    def invalidar(self):
+        """Força a verificação da versão na próxima leitura"""
+        self.versao = None
+        self.verificado_em = 0.0
+
+    def obter(self):
+        if self._valido():
+            return self.valor
+
+        with self.trava:
+            if self._valido():
+                return self.valor
+
+            from .models import ContadorSequencia
+
+            # Lê a versão antes dos dados: uma alteração no meio do caminho gera nova carga
+            versao = ContadorSequencia.valor_atual(self.contador)
+            if self.valor is None or versao != self.versao:
+                self.valor = self.carregar()
+                self.versao = versao
+            self.verificado_em = time.monotonic()
+
+        return self.valor
+
+
+def _retrato_profissional(dados):
+    return ProfissionalCatalogo(
+        id=str(dados['_id']),
+        nome_completo=dados.get('nome_completo') or '',
+        telefone=dados.get('telefone') or '',
+        email=dados.get('email') or '',
+        foto=dados.get('foto') or '',
+        bio=dados.get('bio') or '',
+        especialidades=tuple(dados.get('especialidades') or ()),
+        experiencia_anos=dados.get('experiencia_anos') or 0,
+        ativo=dados.get('ativo', True),
+        avaliacao_media=dados.get('avaliacao_media') or 0.0,
+        total_avaliacoes=dados.get('total_avaliacoes') or 0,
+    )
+
+
+def _retrato_servico(dados, profissionais):
+    # Referências gravadas como ObjectId (ou DBRef, em documentos antigos)
+    referencias = dados.get('profissionais_habilitados') or ()
+    habilitados = (profissionais.get(str(getattr(ref, 'id', ref))) for ref in referencias)
+    return ServicoCatalogo(
+        id=str(dados['_id']),
+        nome=dados.get('nome') or '',
+        descricao=dados.get('descricao') or '',
+        preco=float(str(dados.get('preco') or 0)),
+        categoria=dados.get('categoria') or '',
+        imagem=dados.get('imagem') or '',
+        disponivel=dados.get('disponivel', True),
+        destaque=dados.get('destaque', False),
+        tags=tuple(dados.get('tags') or ()),
+        duracao_minutos=dados.get('duracao_minutos') or 0,
+        profissionais_habilitados=tuple(p for p in habilitados if p is not None),
+    )
+
+
+class Catalogo:
+    """Retrato do catálogo numa versão: serviços, profissionais, resumo e árvore do autocompletar"""
+
+    def __init__(self, servicos, profissionais):
+        from .busca import montar_arvore
+
+        self.profissionais = {p.id: p for p in profissionais}
+        self.servicos = {s.id: s for s in servicos}
+        self.disponiveis = tuple(s for s in servicos if s.disponivel)
+        self.ativos = tuple(sorted((p for p in profissionais if p.ativo), key=lambda p: p.nome_completo))
+
+        por_categoria = {}
+        for servico in self.disponiveis:
+            por_categoria[servico.categoria] = por_categoria.get(servico.categoria, 0) + 1
+        self.resumo = {
+            'total': len(self.disponiveis),
+            'categorias': sorted(c for c in por_categoria if c),
+            'por_categoria': por_categoria,
+        }
+        self.arvore = montar_arvore(self.disponiveis)
+        self._serializados = {}
+
+    def serializado(self, chave, montar):
+        """
+        (corpo JSON em bytes, ETag) de dados derivados deste retrato, montados uma
+        única vez por versão do catálogo. montar recebe o próprio Catalogo.
+        """
+        from .respostas import etag, serializar
+
+        if chave not in self._serializados:
+            corpo = serializar(montar(self))
+            self._serializados[chave] = (corpo, etag(corpo))
+        return self._serializados[chave]
+
+    @classmethod
+    def carregar(cls):
+        """Duas consultas projetadas: todos os profissionais e todos os serviços"""
+        from .models import Profissional, Servico
+
+        profissionais = [
+            _retrato_profissional(dados)
+            for dados in Profissional._get_collection().find({}, dict.fromkeys(CAMPOS_PROFISSIONAL, 1))
+        ]
+        por_id = {p.id: p for p in profissionais}
+        servicos = [
+            _retrato_servico(dados, por_id)
+            for dados in Servico._get_collection().find({}, dict.fromkeys(CAMPOS_SERVICO, 1)).sort(
+                [('categoria', 1), ('nome', 1)])
+        ]
+        return cls(servicos, profissionais)
+
+
+# Mesmo contador de Servico.CONTADOR_VERSAO
+_catalogo = CacheVersionado('catalogo_servicos', Catalogo.carregar)
+
+
+def obter_catalogo():
+    return _catalogo.obter()
+
+
+def invalidar():
+    """Chamado quando este processo altera o catálogo"""
+    _catalogo.invalidar()
+
+
+def resumo_servicos():
+    """{'total', 'categorias', 'por_categoria'} dos serviços disponíveis"""
+    return obter_catalogo().resumo
+
+
+def servico(servico_id):
+    """Retrato do serviço ou None"""
+    return obter_catalogo().servicos.get(str(servico_id))
+
+
+def profissional(profissional_id):
+    """Retrato do profissional ou None"""
+    return obter_catalogo().profissionais.get(str(profissional_id))
+
+
+def servicos_disponiveis(categoria=None, ordem='categoria'):
+    """Serviços disponíveis (opcionalmente de uma categoria), por categoria e nome ou só por nome"""
+    servicos = obter_catalogo().disponiveis
+    if categoria:
+        servicos = tuple(s for s in servicos if s.categoria == categoria)
+    if ordem == 'nome':
+        servicos = tuple(sorted(servicos, key=lambda s: s.nome))
+    return servicos
+
+
+def profissionais_ativos():
+    """Profissionais ativos, por nome"""
+    return obter_catalogo().ativos
+
+
+def profissionais_do_servico(servico):
+    """Profissionais habilitados para o serviço; todos os ativos se nenhum foi definido"""
+    return servico.profissionais_habilitados or profissionais_ativos()
+
+
+def _carregar_configuracao():
+    from .models import ConfiguracaoBarbearia
+
+    return ConfiguracaoBarbearia.carregar()
+
+
+# Mesmo contador de ConfiguracaoBarbearia.CONTADOR_VERSAO
+_configuracao = CacheVersionado('configuracao_barbearia', _carregar_configuracao)
+
+
+def configuracao():
+    """Configuração ativa da barbearia (instância compartilhada, somente leitura)"""
+    return _configuracao.obter()
+
+
+def invalidar_configuracao():
+    """Chamado quando este processo altera a configuração"""
+    _configuracao.invalidar()
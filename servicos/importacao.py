@@ -0,0 +1,68 @@
+"""
+Leitura de arquivos de importação (CSV e JSON) linha a linha, sem carregá-los inteiros na memória
+"""
+import csv
+import io
+import json
+
+
+def ler_csv(arquivo):
+    """
+    Lê um CSV (arquivo binário) como dicts, aceitando ';' ou ',' como separador.
+
+    Os nomes das colunas são normalizados para minúsculas.
+    """
+    amostra = arquivo.read(2048)
+    if isinstance(amostra, bytes):
+        amostra = amostra.decode('utf-8-sig', errors='ignore')
+    arquivo.seek(0)
+    try:
+        separador = csv.Sniffer().sniff(amostra, delimiters=';,').delimiter
+    except csv.Error:
+        separador = ';'
+
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    leitor = csv.DictReader(texto, delimiter=separador)
+    leitor.fieldnames = [(campo or '').strip().lower() for campo in (leitor.fieldnames or [])]
+    return leitor
+
+
+def ler_json(arquivo):
+    """
+    Lê objetos JSON de um arquivo binário.
+
+    JSON Lines (um objeto por linha) é lido aos poucos; uma lista JSON ([...])
+    precisa ser carregada inteira, pois a biblioteca padrão não lê listas em partes.
+    """
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig')
+    primeiro = ''
+    while not primeiro:
+        linha = texto.readline()
+        if not linha:
+            return
+        primeiro = linha.strip()
+
+    if primeiro.startswith('['):
+        for objeto in json.loads(primeiro + texto.read()):
+            yield objeto
+        return
+
+    yield _decodificar(primeiro)
+    for linha in texto:
+        if linha.strip():
+            yield _decodificar(linha)
+
+
+def _decodificar(linha):
+    """Um objeto JSON Lines; linhas inválidas viram {'_erro': ...} para serem reportadas"""
+    try:
+        return json.loads(linha)
+    except ValueError as e:
+        return {'_erro': f'JSON inválido: {e}'}
+
+
+def ler_linhas(arquivo, nome_arquivo):
+    """Escolhe o leitor pelo nome do arquivo (.csv, .json, .jsonl)"""
+    if nome_arquivo.lower().endswith(('.json', '.jsonl', '.ndjson')):
+        return ler_json(arquivo)
+    return ler_csv(arquivo)
@@ -0,0 +1,63 @@
+"""
+Comando para preencher o custo (preco_custo) nos itens de vendas antigas
+"""
+from bson import ObjectId
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from servicos.models import ProdutoRoupa, VendaRoupa
+
+
+class Command(BaseCommand):
+    help = 'Congela o preço de custo atual nos itens de vendas que ainda não têm custo registrado'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Quantidade de vendas atualizadas por lote')
+
+    def handle(self, *args, **options):
+        tamanho_lote = options['lote']
+        colecao_vendas = VendaRoupa._get_collection()
+
+        filtro = {'itens': {'$elemMatch': {'preco_custo': {'$exists': False}}}}
+        vendas = list(colecao_vendas.find(filtro, {'itens': 1}))
+
+        if not vendas:
+            self.stdout.write(self.style.SUCCESS('✅ Todas as vendas já têm custo registrado.'))
+            return
+
+        # Buscar o custo de todos os produtos envolvidos em uma única consulta
+        produto_ids = {
+            item.get('produto_id')
+            for venda in vendas
+            for item in venda.get('itens', [])
+            if ObjectId.is_valid(item.get('produto_id') or '')
+        }
+        custos = {
+            str(produto['_id']): produto.get('preco_custo')
+            for produto in ProdutoRoupa._get_collection().find(
+                {'_id': {'$in': [ObjectId(pid) for pid in produto_ids]}},
+                {'preco_custo': 1}
+            )
+        }
+
+        self.stdout.write(f'🎯 Atualizando {len(vendas)} vendas...')
+
+        operacoes = []
+        atualizadas = 0
+        for venda in vendas:
+            itens = venda.get('itens', [])
+            for item in itens:
+                if 'preco_custo' not in item:
+                    custo = custos.get(item.get('produto_id'))
+                    item['preco_custo'] = float(custo) if custo else None
+
+            operacoes.append(UpdateOne({'_id': venda['_id']}, {'$set': {'itens': itens}}))
+
+            if len(operacoes) >= tamanho_lote:
+                atualizadas += colecao_vendas.bulk_write(operacoes, ordered=False).modified_count
+                operacoes = []
+
+        if operacoes:
+            atualizadas += colecao_vendas.bulk_write(operacoes, ordered=False).modified_count
+
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Total: {atualizadas} vendas atualizadas!'))
+        self.stdout.write('\n💡 Itens de produtos já excluídos ficam com custo vazio e aparecem como "itens_sem_custo" no relatório de margem')
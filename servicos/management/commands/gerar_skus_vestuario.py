@@ -0,0 +1,39 @@
+"""
+Comando para gerar SKUs para os produtos de vestuário cadastrados antes dos códigos por tamanho
+"""
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from servicos.models import ContadorSequencia, ProdutoRoupa
+
+
+class Command(BaseCommand):
+    help = 'Gera SKU base e variantes (um SKU por tamanho) para produtos que ainda não têm'
+
+    def handle(self, *args, **options):
+        colecao = ProdutoRoupa._get_collection()
+        produto_ids = [p['_id'] for p in colecao.find({'sku_base': {'$exists': False}}, {'_id': 1})]
+
+        if not produto_ids:
+            self.stdout.write(self.style.SUCCESS('✅ Todos os produtos já têm SKU.'))
+            return
+
+        self.stdout.write(f'🏷️  Gerando SKUs para {len(produto_ids)} produtos...')
+
+        # Reserva todos os números de uma vez
+        sequencias = ContadorSequencia.reservar_bloco(ProdutoRoupa.CONTADOR_SKU, len(produto_ids))
+
+        operacoes = []
+        for produto_id, sequencia in zip(produto_ids, sequencias):
+            sku_base = ProdutoRoupa.gerar_sku_base(sequencia)
+            variantes = [
+                {'tamanho': tamanho, 'sku': f'{sku_base}-{tamanho.upper()}'}
+                for tamanho in ProdutoRoupa.TAMANHOS_VARIANTE
+            ]
+            operacoes.append(UpdateOne(
+                {'_id': produto_id, 'sku_base': {'$exists': False}},
+                {'$set': {'sku_base': sku_base, 'variantes': variantes}}
+            ))
+
+        resultado = colecao.bulk_write(operacoes, ordered=False)
+
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Total: {resultado.modified_count} produtos atualizados!'))
@@ -0,0 +1,19 @@
+"""
+Comando para gravar um snapshot do estoque atual de todos os produtos de vestuário
+"""
+from django.core.management.base import BaseCommand
+from servicos.models import SnapshotEstoque
+
+
+class Command(BaseCommand):
+    help = (
+        'Grava o estoque atual de todos os produtos como ponto de partida para consultas '
+        'de estoque por data. Rode uma vez ao ativar o histórico e depois periodicamente (ex: diariamente)'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write('📸 Gerando snapshot do estoque...')
+
+        total = SnapshotEstoque.gerar()
+
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Snapshot gravado para {total} produtos!'))
@@ -0,0 +1,31 @@
+"""
+Comando para calcular as sugestões de reposição do estoque de vestuário
+"""
+from django.core.management.base import BaseCommand
+from servicos.models import SugestaoReposicao
+
+
+class Command(BaseCommand):
+    help = (
+        'Calcula a média móvel e a tendência de vendas por produto/tamanho e projeta quando '
+        'o estoque chega ao mínimo. Rode periodicamente (ex: diariamente)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=365, help='Dias de histórico de vendas considerados')
+        parser.add_argument('--semanas-media', type=int, default=4, help='Semanas da média móvel')
+        parser.add_argument('--semanas-tendencia', type=int, default=12, help='Semanas usadas para a tendência')
+        parser.add_argument('--cobertura', type=int, default=30, help='Dias de venda que a reposição deve cobrir')
+
+    def handle(self, *args, **options):
+        self.stdout.write('📈 Calculando sugestões de reposição...')
+
+        total = SugestaoReposicao.gerar(
+            dias_historico=options['dias'],
+            semanas_media=options['semanas_media'],
+            semanas_tendencia=options['semanas_tendencia'],
+            dias_cobertura=options['cobertura'],
+        )
+
+        a_repor = SugestaoReposicao.objects(quantidade_sugerida__gt=0).count()
+        self.stdout.write(self.style.SUCCESS(f'\n✅ {total} produtos analisados, {a_repor} com reposição sugerida!'))
@@ -0,0 +1,41 @@
+"""
+Comando para importar produtos de vestuário de um arquivo CSV ou JSON
+"""
+import time
+from django.core.management.base import BaseCommand, CommandError
+from servicos.importacao import ler_linhas
+from servicos.models import ProdutoRoupa
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa (cria ou atualiza) produtos de vestuário de um CSV ou JSON, em lotes. '
+        'Produtos existentes são identificados pelo sku_base ou, sem ele, pelo nome'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Caminho do arquivo .csv, .json ou .jsonl')
+        parser.add_argument('--lote', type=int, default=500, help='Quantidade de produtos gravados por lote')
+        parser.add_argument('--max-erros', type=int, default=50, help='Quantidade máxima de erros exibidos')
+
+    def handle(self, *args, **options):
+        caminho = options['arquivo']
+        self.stdout.write(f'📦 Importando produtos de {caminho}...')
+
+        inicio = time.monotonic()
+        try:
+            with open(caminho, 'rb') as arquivo:
+                relatorio = ProdutoRoupa.importar(ler_linhas(arquivo, caminho), tamanho_lote=max(1, options['lote']))
+        except OSError as e:
+            raise CommandError(f'Não foi possível abrir o arquivo: {e}')
+        duracao = time.monotonic() - inicio
+
+        for erro in relatorio['erros'][:options['max_erros']]:
+            self.stdout.write(self.style.ERROR(f"❌ Registro {erro['registro']}: {erro['erro']}"))
+        if len(relatorio['erros']) > options['max_erros']:
+            self.stdout.write(f"... e mais {len(relatorio['erros']) - options['max_erros']} erros")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\n✅ {relatorio['criados']} criados, {relatorio['atualizados']} atualizados, "
+            f"{len(relatorio['erros'])} com erro ({duracao:.1f}s)"
+        ))
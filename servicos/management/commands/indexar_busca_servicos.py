@@ -0,0 +1,38 @@
+"""
+Comando para (re)gerar os termos de busca dos serviços já cadastrados
+"""
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from servicos.models import Servico
+
+
+class Command(BaseCommand):
+    help = 'Gera os termos de busca normalizados (sem acentos) de todos os serviços'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Quantidade de serviços atualizados por lote')
+
+    def handle(self, *args, **options):
+        Servico.ensure_indexes()
+        colecao = Servico._get_collection()
+
+        self.stdout.write(f'🎯 Indexando {Servico.objects.count()} serviços...')
+
+        operacoes = []
+        atualizados = 0
+        for servico in Servico.objects.only('nome', 'descricao', 'categoria', 'tags', 'termos_busca'):
+            termos = servico.gerar_termos_busca()
+            if termos != list(servico.termos_busca or []):
+                operacoes.append(UpdateOne({'_id': servico.id}, {'$set': {'termos_busca': termos}}))
+
+            if len(operacoes) >= options['lote']:
+                atualizados += colecao.bulk_write(operacoes, ordered=False).modified_count
+                operacoes = []
+
+        if operacoes:
+            atualizados += colecao.bulk_write(operacoes, ordered=False).modified_count
+
+        if atualizados:
+            Servico.catalogo_alterado()
+
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Total: {atualizados} serviços atualizados!'))
@@ -0,0 +1,88 @@
+"""
+Comando para recalcular do zero as estatísticas dos clientes (compras e agendamentos)
+"""
+from datetime import datetime
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from servicos.models import VendaRoupa
+from servicos.models_mongo import AgendamentoMongo, ClienteMongo
+
+
+class Command(BaseCommand):
+    help = 'Recalcula total de compras, valor gasto e agendamentos de cada cliente a partir do histórico'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--telefone', help='Recalcula apenas o cliente com este telefone')
+        parser.add_argument('--lote', type=int, default=500, help='Quantidade de clientes atualizados por lote')
+
+    def handle(self, *args, **options):
+        telefone = options.get('telefone')
+        if telefone:
+            cliente = ClienteMongo.objects(telefone=telefone).first()
+            if not cliente:
+                self.stdout.write(self.style.ERROR(f'❌ Cliente com telefone {telefone} não encontrado'))
+                return
+            cliente.atualizar_estatisticas()
+            self.stdout.write(self.style.SUCCESS(f'✅ Estatísticas de {cliente.nome} recalculadas!'))
+            return
+
+        # Uma agregação por coleção em vez de duas consultas por cliente
+        compras = {
+            grupo['_id']: grupo
+            for grupo in VendaRoupa.objects.aggregate([
+                {'$match': {'cliente_telefone': {'$nin': [None, '']}}},
+                {'$group': {
+                    '_id': '$cliente_telefone',
+                    'total': {'$sum': 1},
+                    'valor': {'$sum': '$valor_total'},
+                    'ultima': {'$max': '$data_venda'},
+                }},
+            ])
+        }
+        agendamentos = {
+            grupo['_id']: grupo
+            for grupo in AgendamentoMongo.objects.aggregate([
+                {'$match': {'cliente_telefone': {'$nin': [None, '']}}},
+                {'$group': {
+                    '_id': '$cliente_telefone',
+                    'total': {'$sum': 1},
+                    'ultimo': {'$max': '$data_criacao'},
+                }},
+            ])
+        }
+
+        colecao = ClienteMongo._get_collection()
+        telefones = [cliente['telefone'] for cliente in colecao.find({}, {'telefone': 1})]
+        self.stdout.write(f'🎯 Recalculando {len(telefones)} clientes...')
+
+        agora = datetime.now()
+        operacoes = []
+        atualizados = 0
+        for telefone in telefones:
+            compra = compras.get(telefone, {})
+            agendamento = agendamentos.get(telefone, {})
+            total_compras = compra.get('total', 0)
+            total_agendamentos = agendamento.get('total', 0)
+
+            valores = {
+                'total_compras': total_compras,
+                'valor_total_gasto': float(compra.get('valor') or 0),
+                'total_agendamentos': total_agendamentos,
+                'cliente_frequente': (total_compras + total_agendamentos) >= ClienteMongo.LIMITE_CLIENTE_FREQUENTE,
+                'data_atualizacao': agora,
+            }
+            if compra.get('ultima'):
+                valores['ultima_compra'] = compra['ultima']
+            if agendamento.get('ultimo'):
+                valores['ultimo_agendamento'] = agendamento['ultimo']
+
+            operacoes.append(UpdateOne({'telefone': telefone}, {'$set': valores}))
+
+            if len(operacoes) >= options['lote']:
+                atualizados += colecao.bulk_write(operacoes, ordered=False).modified_count
+                operacoes = []
+
+        if operacoes:
+            atualizados += colecao.bulk_write(operacoes, ordered=False).modified_count
+
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Total: {atualizados} clientes atualizados!'))
@@ -0,0 +1,31 @@
+"""
+Comando para reconstruir o resumo diário das vendas de roupa (fechamento de caixa)
+"""
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from servicos.models import ResumoVendasDia
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstrói o resumo de vendas dos dias informados a partir das vendas. '
+        'Use para gerar o histórico anterior ao resumo ou corrigir divergências'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inicio', help='Primeiro dia (AAAA-MM-DD). Padrão: 30 dias atrás')
+        parser.add_argument('--fim', help='Último dia (AAAA-MM-DD). Padrão: hoje')
+
+    def handle(self, *args, **options):
+        try:
+            fim = datetime.strptime(options['fim'], '%Y-%m-%d').date() if options.get('fim') else datetime.now().date()
+            inicio = (datetime.strptime(options['inicio'], '%Y-%m-%d').date()
+                      if options.get('inicio') else fim - timedelta(days=30))
+        except ValueError:
+            raise CommandError('Datas devem estar no formato AAAA-MM-DD')
+
+        self.stdout.write(f'🧮 Recalculando resumos de {inicio:%d/%m/%Y} a {fim:%d/%m/%Y}...')
+
+        total = ResumoVendasDia.recalcular(inicio, fim)
+
+        self.stdout.write(self.style.SUCCESS(f'\n✅ {total} dias com movimento gravados!'))
@@ -0,0 +1,14 @@
+"""
+Comando para regerar a listagem achatada de agendamentos (coleção agendamentos_view)
+"""
+from django.core.management.base import BaseCommand
+from servicos.models import AgendamentoListagem
+
+
+class Command(BaseCommand):
+    help = 'Regera a coleção agendamentos_view a partir dos agendamentos, serviços e profissionais'
+
+    def handle(self, *args, **options):
+        self.stdout.write('🎯 Regerando a listagem de agendamentos...')
+        total = AgendamentoListagem.reconstruir()
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Total: {total} agendamentos na listagem!'))
@@ -1,10 +1,15 @@
 from django.db import models
-from mongoengine import Document, EmbeddedDocument, fields
+from mongoengine import Document, EmbeddedDocument, ValidationError, fields
+from bson import ObjectId
 from django.urls import reverse
-from datetime import datetime
+from django.utils import timezone
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 import os
+import re
 from django.core.files.storage import default_storage
 from django.conf import settings
+from .busca import termos_consulta, tokenizar
 
 # Create your models here.
 
@@ -37,6 +42,21 @@ class Profissional(Document):
     
     def __str__(self):
         return self.nome_completo
+    
+    def save(self, *args, **kwargs):
+        """Salva, avisa os processos que o catálogo mudou e propaga um novo nome para a listagem"""
+        renomeado = bool(self.pk) and 'nome_completo' in self._changed_fields
+        resultado = super().save(*args, **kwargs)
+        Servico.catalogo_alterado()
+        if renomeado:
+            AgendamentoListagem.profissional_alterado(self)
+        return resultado
+    
+    def delete(self, *args, **kwargs):
+        """Remove e avisa os processos que o catálogo mudou"""
+        resultado = super().delete(*args, **kwargs)
+        Servico.catalogo_alterado()
+        return resultado
 
 class Servico(Document):
     """
@@ -67,6 +87,10 @@ class Servico(Document):
     duracao_minutos = fields.IntField(min_value=0, default=30, verbose_name="Duração (minutos)")
     materiais_necessarios = fields.ListField(fields.StringField(max_length=100), verbose_name="Materiais Necessários")
     
+    # Palavras normalizadas (sem acento, minúsculas) de nome, descrição, categoria e tags,
+    # mantidas pelo save() e consultadas por prefixo na busca
+    termos_busca = fields.ListField(fields.StringField(), verbose_name="Termos de Busca")
+    
     # Configurações do documento
     meta = {
         'collection': 'servicos',
@@ -76,9 +100,13 @@ class Servico(Document):
             'categoria',
             'disponivel',
             ('categoria', 'nome'),
+            ('termos_busca', 'disponivel'),
         ]
     }
     
+    # Contador (ContadorSequencia) incrementado a cada alteração no catálogo de serviços
+    CONTADOR_VERSAO = 'catalogo_servicos'
+    
     def __str__(self):
         return self.nome
     
@@ -88,10 +116,39 @@ class Servico(Document):
     
     def save(self, *args, **kwargs):
         """
-        Sobrescreve o método save para atualizar a data de modificação
+        Sobrescreve o método save para atualizar a data de modificação e os termos de busca
         """
         self.data_atualizacao = datetime.now()
-        return super().save(*args, **kwargs)
+        self.termos_busca = self.gerar_termos_busca()
+        # Serviço já existente com nome, categoria ou duração alterados: atualizar a listagem de agendamentos
+        propagar = bool(self.pk) and bool({'nome', 'categoria', 'duracao_minutos'} & set(self._changed_fields))
+        resultado = super().save(*args, **kwargs)
+        self.catalogo_alterado()
+        if propagar:
+            AgendamentoListagem.servico_alterado(self)
+        return resultado
+    
+    def delete(self, *args, **kwargs):
+        """Remove e avisa os processos que o catálogo mudou"""
+        resultado = super().delete(*args, **kwargs)
+        self.catalogo_alterado()
+        return resultado
+    
+    @classmethod
+    def catalogo_alterado(cls):
+        """
+        Nova versão do catálogo (serviços e profissionais): este processo recarrega o cache
+        já, os demais na próxima verificação. Escritas que não passam por save() devem chamá-lo também.
+        """
+        from . import catalogo
+        
+        ContadorSequencia.proximo_valor(cls.CONTADOR_VERSAO)
+        catalogo.invalidar()
+    
+    def gerar_termos_busca(self):
+        """Palavras normalizadas que tornam o serviço encontrável pela busca"""
+        textos = [self.nome, self.descricao, self.categoria] + list(self.tags or [])
+        return tokenizar(' '.join(t for t in textos if t))
     
     @classmethod
     def get_categorias(cls):
@@ -122,15 +179,16 @@ class Servico(Document):
         if categoria:
             query['categoria'] = categoria
         
-        # Busca por termo
-        if termo_busca:
-            # Busca em nome, descrição e tags
-            query['$or'] = [
-                {'nome': {'$regex': termo_busca, '$options': 'i'}},
-                {'descricao': {'$regex': termo_busca, '$options': 'i'}},
-                {'tags': {'$in': [termo_busca]}},
-                {'categoria': {'$regex': termo_busca, '$options': 'i'}}
-            ]
+        # Busca por termo: cada palavra digitada precisa ser prefixo de algum termo
+        # indexado (sem acentos), o que vira uma faixa no índice de termos_busca
+        if termo_busca and termo_busca.strip():
+            termos = termos_consulta(termo_busca)
+            if not termos:
+                # Só palavras ignoradas ou pontuação ("de "): nada a procurar
+                return cls.objects.none()
+            query['termos_busca'] = {
+                '$all': [re.compile('^' + re.escape(termo)) for termo in termos]
+            }
         
         return cls.objects(__raw__=query)
 
@@ -194,10 +252,197 @@ class Agendamento(Document):
     
     def save(self, *args, **kwargs):
         """
-        Sobrescreve o método save para atualizar a data de modificação
+        Sobrescreve o método save para atualizar a data de modificação e a listagem
         """
         self.data_atualizacao = datetime.now()
-        return super().save(*args, **kwargs)
+        resultado = super().save(*args, **kwargs)
+        AgendamentoListagem.sincronizar(self)
+        return resultado
+    
+    def delete(self, *args, **kwargs):
+        """Remove o agendamento e sua linha na listagem"""
+        agendamento_id = self.id
+        resultado = super().delete(*args, **kwargs)
+        AgendamentoListagem.objects(id=agendamento_id).delete()
+        return resultado
+    
+    @staticmethod
+    def _id_referencia(valor):
+        """Id de uma referência, carregada (documento) ou não (DBRef/ObjectId)"""
+        return getattr(valor, 'id', valor)
+
+class AgendamentoListagem(Document):
+    """
+    Projeção achatada dos agendamentos para as telas de listagem (fila, histórico, dashboard).
+    
+    Guarda nome do serviço e do profissional, preço e duração junto do
+    agendamento, então as listagens leem uma única coleção indexada. É mantida
+    por Agendamento.save()/delete(); renomear um serviço ou profissional
+    propaga o novo nome com update_many. Não deve ser editada diretamente.
+    """
+    id = fields.ObjectIdField(primary_key=True)
+    cliente_nome = fields.StringField(verbose_name="Nome do Cliente")
+    cliente_telefone = fields.StringField(verbose_name="Telefone do Cliente")
+    servico_id = fields.ObjectIdField(verbose_name="Serviço")
+    servico_nome = fields.StringField(verbose_name="Nome do Serviço")
+    servico_categoria = fields.StringField(verbose_name="Categoria do Serviço")
+    duracao_minutos = fields.IntField(default=0, verbose_name="Duração (minutos)")
+    profissional_id = fields.ObjectIdField(verbose_name="Profissional")
+    profissional_nome = fields.StringField(verbose_name="Nome do Profissional")
+    data_agendamento = fields.DateTimeField(verbose_name="Data do Agendamento")
+    hora_agendamento = fields.StringField(verbose_name="Hora do Agendamento")
+    status = fields.StringField(choices=Agendamento._fields['status'].choices, verbose_name="Status")
+    valor_total = fields.FloatField(default=0.0, verbose_name="Valor Total")
+    data_criacao = fields.DateTimeField(verbose_name="Data de Criação")
+    
+    meta = {
+        'collection': 'agendamentos_view',
+        'ordering': ['-data_agendamento'],
+        'indexes': [
+            # Terminam na ordenação da fila (data, hora, id): cada página é um trecho contíguo do índice
+            ('status', 'data_agendamento', 'hora_agendamento', 'id'),
+            ('profissional_id', 'data_agendamento', 'hora_agendamento', 'id'),
+            ('servico_id', 'data_agendamento'),
+            ('data_agendamento', 'hora_agendamento', 'id'),
+            '-data_criacao',
+        ]
+    }
+    
+    def __str__(self):
+        return f"{self.cliente_nome} - {self.servico_nome} - {self.data_agendamento:%d/%m/%Y} {self.hora_agendamento}"
+    
+    @classmethod
+    def documento(cls, agendamento):
+        """
+        Linha da listagem (dict do pymongo) de um agendamento.
+        
+        Os nomes vêm das referências (lidas do banco se ainda não carregadas), e
+        não do cache do catálogo, que pode estar alguns segundos atrasado.
+        """
+        servico_id = Agendamento._id_referencia(agendamento._data.get('servico'))
+        profissional_id = Agendamento._id_referencia(agendamento._data.get('profissional'))
+        # Referência para documento removido continua como DBRef
+        servico = agendamento.servico if isinstance(agendamento.servico, Servico) else None
+        profissional = agendamento.profissional if isinstance(agendamento.profissional, Profissional) else None
+        
+        return {
+            '_id': agendamento.id,
+            'cliente_nome': agendamento.cliente_nome,
+            'cliente_telefone': agendamento.cliente_telefone,
+            'servico_id': servico_id,
+            'servico_nome': servico.nome if servico else '',
+            'servico_categoria': servico.categoria if servico else '',
+            'duracao_minutos': (servico.duracao_minutos if servico else 0) or 0,
+            'profissional_id': profissional_id,
+            'profissional_nome': profissional.nome_completo if profissional else '',
+            'data_agendamento': agendamento.data_agendamento,
+            'hora_agendamento': agendamento.hora_agendamento,
+            'status': agendamento.status,
+            'valor_total': float(agendamento.valor_total or 0),
+            'data_criacao': agendamento.data_criacao,
+        }
+    
+    @classmethod
+    def fila(cls, inicio=None, fim=None, status=None, profissional_id=None, cursor=None, limite=50):
+        """
+        Agendamentos em ordem de atendimento (data, hora), de 'inicio' (padrão: hoje) até 'fim'.
+        
+        Pagina por cursor: cada página continua depois do último item da anterior,
+        então o custo não cresce com o histórico. Os filtros de igualdade (status,
+        profissional) + faixa de data usam os índices da coleção.
+        Retorna (agendamentos, cursor da próxima página ou None).
+        """
+        from .paginacao import codificar_cursor, decodificar_cursor
+        
+        filtro = {'data_agendamento': {'$gte': inicio or datetime.combine(datetime.now().date(), datetime.min.time())}}
+        if fim:
+            filtro['data_agendamento']['$lt'] = fim
+        if status:
+            filtro['status'] = status
+        if profissional_id and ObjectId.is_valid(str(profissional_id)):
+            filtro['profissional_id'] = ObjectId(str(profissional_id))
+        
+        ultimo = decodificar_cursor(cursor) if cursor else None
+        if ultimo and len(ultimo) == 3 and ObjectId.is_valid(ultimo[2]):
+            try:
+                data = datetime.fromisoformat(ultimo[0])
+            except ValueError:
+                data = None
+            if data is not None:
+                hora, ultimo_id = ultimo[1], ObjectId(ultimo[2])
+                filtro['$or'] = [
+                    {'data_agendamento': {'$gt': data}},
+                    {'data_agendamento': data, 'hora_agendamento': {'$gt': hora}},
+                    {'data_agendamento': data, 'hora_agendamento': hora, '_id': {'$gt': ultimo_id}},
+                ]
+        
+        # Um item a mais indica se existe próxima página
+        agendamentos = list(
+            cls.objects(__raw__=filtro).order_by('data_agendamento', 'hora_agendamento', 'id').limit(limite + 1)
+        )
+        proximo = None
+        if len(agendamentos) > limite:
+            agendamentos = agendamentos[:limite]
+            ultimo = agendamentos[-1]
+            proximo = codificar_cursor([ultimo.data_agendamento, ultimo.hora_agendamento, ultimo.id])
+        return agendamentos, proximo
+    
+    @classmethod
+    def sincronizar(cls, agendamento):
+        """Grava (ou substitui) a linha do agendamento"""
+        cls._get_collection().replace_one({'_id': agendamento.id}, cls.documento(agendamento), upsert=True)
+    
+    @classmethod
+    def servico_alterado(cls, servico):
+        """Propaga nome, categoria e duração do serviço para todas as suas linhas"""
+        cls._get_collection().update_many({'servico_id': servico.id}, {'$set': {
+            'servico_nome': servico.nome,
+            'servico_categoria': servico.categoria,
+            'duracao_minutos': servico.duracao_minutos or 0,
+        }})
+    
+    @classmethod
+    def profissional_alterado(cls, profissional):
+        """Propaga o nome do profissional para todas as suas linhas"""
+        cls._get_collection().update_many(
+            {'profissional_id': profissional.id},
+            {'$set': {'profissional_nome': profissional.nome_completo}},
+        )
+    
+    @classmethod
+    def reconstruir(cls):
+        """
+        Regera a coleção inteira a partir dos agendamentos, no próprio banco
+        ($lookup + $out, sem trazer os documentos para o Python).
+        """
+        Agendamento.objects.aggregate([
+            {'$lookup': {'from': Servico._get_collection_name(), 'localField': 'servico',
+                         'foreignField': '_id', 'as': 'servico_doc'}},
+            {'$lookup': {'from': Profissional._get_collection_name(), 'localField': 'profissional',
+                         'foreignField': '_id', 'as': 'profissional_doc'}},
+            {'$set': {
+                'servico_doc': {'$arrayElemAt': ['$servico_doc', 0]},
+                'profissional_doc': {'$arrayElemAt': ['$profissional_doc', 0]},
+            }},
+            {'$project': {
+                'cliente_nome': 1,
+                'cliente_telefone': 1,
+                'servico_id': '$servico',
+                'servico_nome': {'$ifNull': ['$servico_doc.nome', '']},
+                'servico_categoria': {'$ifNull': ['$servico_doc.categoria', '']},
+                'duracao_minutos': {'$ifNull': ['$servico_doc.duracao_minutos', 0]},
+                'profissional_id': '$profissional',
+                'profissional_nome': {'$ifNull': ['$profissional_doc.nome_completo', '']},
+                'data_agendamento': 1,
+                'hora_agendamento': 1,
+                'status': 1,
+                'valor_total': {'$ifNull': ['$valor_total', 0]},
+                'data_criacao': 1,
+            }},
+            {'$out': cls._get_collection_name()},
+        ])
+        cls.ensure_indexes()
+        return cls.objects.count()
 
 class HorarioDisponivel(Document):
     """
@@ -307,18 +552,67 @@ class ConfiguracaoBarbearia(Document):
     def __str__(self):
         return self.nome_barbearia
     
+    # Contador (ContadorSequencia) incrementado a cada alteração na configuração
+    CONTADOR_VERSAO = 'configuracao_barbearia'
+    
+    def save(self, *args, **kwargs):
+        """Salva e avisa os processos para recarregar a configuração"""
+        resultado = super().save(*args, **kwargs)
+        self.configuracao_alterada()
+        return resultado
+    
+    @classmethod
+    def configuracao_alterada(cls):
+        """Nova versão da configuração: este processo recarrega já, os demais na próxima verificação"""
+        from . import catalogo
+        
+        ContadorSequencia.proximo_valor(cls.CONTADOR_VERSAO)
+        catalogo.invalidar_configuracao()
+    
     @classmethod
     def get_configuracao(cls):
         """
-        Retorna a configuração da barbearia
+        Retorna a configuração da barbearia a partir do cache do processo.
+        
+        A instância é compartilhada entre as requisições: para alterar a
+        configuração use alternar_aberta() ou carregue uma instância própria.
         """
-        try:
-            return cls.objects(ativo=True).first()
-        except:
-            return cls(
-                nome_barbearia="Barbearia",
-                ativo=True
-            ).save()
+        from . import catalogo
+        
+        return catalogo.configuracao()
+    
+    @classmethod
+    def carregar(cls):
+        """
+        Lê a configuração ativa do banco, criando a padrão se ainda não existir.
+        
+        O upsert evita que leituras simultâneas criem configurações duplicadas.
+        """
+        from pymongo import ReturnDocument
+        
+        dados = cls._get_collection().find_one_and_update(
+            {'ativo': True},
+            {'$setOnInsert': {'nome_barbearia': 'Barbearia', 'aberta': True}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return cls._from_son(dados)
+    
+    @classmethod
+    def alternar_aberta(cls):
+        """Abre ou fecha a barbearia numa única operação no banco e retorna a configuração atualizada"""
+        from pymongo import ReturnDocument
+        
+        dados = cls._get_collection().find_one_and_update(
+            {'ativo': True},
+            [{'$set': {'aberta': {'$not': [{'$ifNull': ['$aberta', True]}]}}}],
+            return_document=ReturnDocument.AFTER,
+        )
+        if dados is None:
+            cls.carregar()
+            return cls.alternar_aberta()
+        cls.configuracao_alterada()
+        return cls._from_son(dados)
     
     @property
     def esta_funcionando(self):
@@ -349,6 +643,17 @@ class CategoriaRoupa(Document):
     def __str__(self):
         return self.nome
 
+class VarianteRoupa(EmbeddedDocument):
+    """
+    Variante (tamanho) de um produto de roupa, com seus códigos de identificação
+    """
+    tamanho = fields.StringField(max_length=10, required=True, verbose_name="Tamanho")
+    sku = fields.StringField(max_length=50, required=True, verbose_name="SKU")
+    ean = fields.StringField(max_length=14, verbose_name="Código de Barras (EAN)")
+    
+    def __str__(self):
+        return f"{self.sku} ({self.tamanho})"
+
 class ProdutoRoupa(Document):
     """
     Documento que representa um produto de roupa
@@ -383,6 +688,10 @@ class ProdutoRoupa(Document):
     # Tags para busca
     tags = fields.ListField(fields.StringField(max_length=50), verbose_name="Tags")
     
+    # Códigos por tamanho (SKU interno + EAN opcional) para leitura no PDV
+    sku_base = fields.StringField(max_length=40, verbose_name="SKU Base")
+    variantes = fields.ListField(fields.EmbeddedDocumentField(VarianteRoupa), verbose_name="Variantes")
+    
     # Status
     ativo = fields.BooleanField(default=True, verbose_name="Ativo")
     em_destaque = fields.BooleanField(default=False, verbose_name="Em Destaque")
@@ -391,6 +700,9 @@ class ProdutoRoupa(Document):
     data_criacao = fields.DateTimeField(default=datetime.now, verbose_name="Data de Criação")
     data_atualizacao = fields.DateTimeField(default=datetime.now, verbose_name="Última Atualização")
     
+    # Versão do catálogo em que o produto foi alterado pela última vez (sincronização do PDV)
+    versao = fields.IntField(default=0, verbose_name="Versão no Catálogo")
+    
     meta = {
         'collection': 'produtos_roupa',
         'ordering': ['categoria', 'nome'],
@@ -399,10 +711,30 @@ class ProdutoRoupa(Document):
             'categoria',
             'ativo',
             'marca',
+            'cor',
+            'versao',
             ('categoria', 'nome'),
+            ('ativo', 'categoria', 'nome'),
+            # Leitura de código no PDV: um código identifica uma única variante
+            {'fields': ['variantes.sku'], 'unique': True,
+             'partialFilterExpression': {'variantes.sku': {'$exists': True}}},
+            {'fields': ['variantes.ean'], 'unique': True,
+             'partialFilterExpression': {'variantes.ean': {'$type': 'string'}}},
         ]
     }
     
+    # Nome do contador (ContadorSequencia) que versiona o catálogo de roupas
+    CONTADOR_VERSAO = 'catalogo_roupa'
+    
+    # Tamanhos com estoque próprio (campos estoque_<tamanho>)
+    TAMANHOS = ('pp', 'p', 'm', 'g', 'gg')
+    
+    # Tamanhos que recebem SKU ('unico' = vendido sem tamanho, sem controle de estoque)
+    TAMANHOS_VARIANTE = TAMANHOS + ('unico',)
+    
+    # Contador (ContadorSequencia) usado para gerar o SKU base dos produtos
+    CONTADOR_SKU = 'sku_roupa'
+    
     def __str__(self):
         return f"{self.nome} - {self.categoria if self.categoria else 'Sem Categoria'}"
     
@@ -431,6 +763,11 @@ class ProdutoRoupa(Document):
         """Retorna se GG está disponível"""
         return self.estoque_gg > 0
     
+    @property
+    def estoque_por_tamanho(self):
+        """Retorna o estoque atual de cada tamanho ({'pp': 0, 'p': 3, ...})"""
+        return {tamanho: getattr(self, f'estoque_{tamanho}') or 0 for tamanho in self.TAMANHOS}
+    
     @property
     def estoque_baixo(self):
         """Verifica se o estoque está baixo"""
@@ -445,10 +782,161 @@ class ProdutoRoupa(Document):
         return 0
     
     def save(self, *args, **kwargs):
-        """Atualiza o estoque total e a data de atualização"""
+        """Atualiza o estoque total, os SKUs, a data de atualização e a versão no catálogo"""
         self.estoque_total = self.estoque_pp + self.estoque_p + self.estoque_m + self.estoque_g + self.estoque_gg
         self.data_atualizacao = datetime.now()
-        return super().save(*args, **kwargs)
+        self.completar_variantes()
+        with self.reservar_versao() as versao:
+            self.versao = versao
+            return super().save(*args, **kwargs)
+    
+    @classmethod
+    def gerar_sku_base(cls, sequencia):
+        """SKU base a partir de um valor do contador (ex: RP00042)"""
+        return f"RP{sequencia:05d}"
+    
+    def completar_variantes(self):
+        """Garante um SKU base e uma variante para cada tamanho (SKU = <base>-<TAMANHO>)"""
+        if not self.sku_base:
+            self.sku_base = self.gerar_sku_base(ContadorSequencia.proximo_valor(self.CONTADOR_SKU))
+        
+        existentes = {variante.tamanho for variante in self.variantes}
+        for tamanho in self.TAMANHOS_VARIANTE:
+            if tamanho not in existentes:
+                self.variantes.append(VarianteRoupa(
+                    tamanho=tamanho,
+                    sku=f"{self.sku_base}-{tamanho.upper()}"
+                ))
+    
+    @property
+    def variantes_por_tamanho(self):
+        """Variantes indexadas por tamanho ({'pp': VarianteRoupa, ...})"""
+        return {variante.tamanho: variante for variante in self.variantes}
+    
+    @classmethod
+    def buscar_por_codigo(cls, codigo):
+        """
+        Busca um produto ativo pelo SKU ou EAN de uma variante, em uma única leitura indexada.
+
+        Retorna {'produto', 'variante', 'estoque'} ou None. 'estoque' é None para o
+        tamanho 'unico', que não tem controle de estoque.
+        """
+        codigo = (codigo or '').strip().upper()
+        if not codigo:
+            return None
+        
+        campos = {campo: 1 for campo in cls.CAMPOS_PDV}
+        campos['variantes'] = 1
+        dados = cls._get_collection().find_one(
+            {'$or': [{'variantes.sku': codigo}, {'variantes.ean': codigo}], 'ativo': True},
+            campos
+        )
+        if not dados:
+            return None
+        
+        variante = next(
+            v for v in dados['variantes'] if v.get('sku') == codigo or v.get('ean') == codigo
+        )
+        tamanho = variante['tamanho']
+        
+        return {
+            'produto': cls.serializar_pdv(dados),
+            'variante': {'tamanho': tamanho, 'sku': variante['sku'], 'ean': variante.get('ean')},
+            'estoque': int(dados.get(f'estoque_{tamanho}') or 0) if tamanho in cls.TAMANHOS else None,
+        }
+    
+    def codigos_em_uso(self):
+        """SKUs e EANs das variantes que já pertencem a outro produto: {código: nome do outro produto}"""
+        codigos = [codigo for variante in self.variantes for codigo in (variante.sku, variante.ean) if codigo]
+        filtro = {'$or': [{'variantes.sku': {'$in': codigos}}, {'variantes.ean': {'$in': codigos}}]}
+        if self.id:
+            filtro['_id'] = {'$ne': self.id}
+        
+        em_uso = {}
+        for dados in self._get_collection().find(filtro, {'nome': 1, 'variantes': 1}):
+            for variante in dados.get('variantes', []):
+                for codigo in (variante.get('sku'), variante.get('ean')):
+                    if codigo in codigos:
+                        em_uso[codigo] = dados.get('nome')
+        return em_uso
+    
+    def delete(self, *args, **kwargs):
+        """Registra a remoção para que os PDVs a recebam na próxima sincronização"""
+        produto_id = str(self.id)
+        resultado = super().delete(*args, **kwargs)
+        with self.reservar_versao() as versao:
+            ProdutoRoupaRemovido(produto_id=produto_id, versao=versao).save()
+        return resultado
+    
+    @classmethod
+    def reservar_versao(cls):
+        """
+        Reserva a próxima versão do catálogo (usar com 'with').
+
+        Toda escrita que não passa por save() (update, bulk_write) deve gravar
+        também 'versao' com este valor, dentro do bloco, para aparecer na
+        sincronização do PDV.
+        """
+        return ContadorSequencia.reservar(cls.CONTADOR_VERSAO)
+    
+    @classmethod
+    def versao_catalogo(cls):
+        """
+        Versão do catálogo já gravada por completo (leitura simples, sem incrementar).
+
+        Fica abaixo de escritas que reservaram versão e ainda não terminaram,
+        então nenhuma delas fica de fora da próxima sincronização.
+        """
+        return ContadorSequencia.valor_confirmado(cls.CONTADOR_VERSAO)
+    
+    # Campos lidos do banco para montar o catálogo do PDV
+    CAMPOS_PDV = ('nome', 'categoria', 'marca', 'preco', 'ativo', 'versao',
+                  'estoque_pp', 'estoque_p', 'estoque_m', 'estoque_g', 'estoque_gg')
+    
+    @staticmethod
+    def serializar_pdv(dados):
+        """Converte um documento bruto (dict do pymongo ou to_mongo()) para o formato do PDV"""
+        return {
+            'id': str(dados['_id']),
+            'nome': dados.get('nome', ''),
+            'categoria': dados.get('categoria') or '',
+            'marca': dados.get('marca') or '',
+            'preco': float(dados.get('preco') or 0),
+            'estoque_pp': int(dados.get('estoque_pp') or 0),
+            'estoque_p': int(dados.get('estoque_p') or 0),
+            'estoque_m': int(dados.get('estoque_m') or 0),
+            'estoque_g': int(dados.get('estoque_g') or 0),
+            'estoque_gg': int(dados.get('estoque_gg') or 0),
+            'versao': int(dados.get('versao') or 0),
+        }
+    
+    @classmethod
+    def catalogo_pdv(cls, desde=None):
+        """
+        Catálogo para o PDV do vestuário.
+
+        Sem 'desde' retorna todos os produtos ativos. Com 'desde' retorna só o que
+        mudou depois daquela versão: produtos alterados e ids removidos/desativados.
+        """
+        campos = {campo: 1 for campo in cls.CAMPOS_PDV}
+        
+        if desde is None:
+            documentos = cls._get_collection().find({'ativo': True}, campos).sort([('categoria', 1), ('nome', 1)])
+            return {'completo': True, 'produtos': [cls.serializar_pdv(d) for d in documentos], 'removidos': []}
+        
+        # 'desde' vem de versao_catalogo(): tudo até ele já estava gravado
+        produtos, removidos = [], []
+        for dados in cls._get_collection().find({'versao': {'$gt': desde}}, campos):
+            if dados.get('ativo', True):
+                produtos.append(cls.serializar_pdv(dados))
+            else:
+                removidos.append(str(dados['_id']))
+        
+        removidos.extend(
+            r.produto_id for r in ProdutoRoupaRemovido.objects(versao__gt=desde).only('produto_id')
+        )
+        
+        return {'completo': False, 'produtos': produtos, 'removidos': removidos}
     
     @classmethod
     def buscar_produtos(cls, termo_busca=None, categoria=None, apenas_disponiveis=True):
@@ -462,147 +950,2053 @@ class ProdutoRoupa(Document):
             query['categoria'] = categoria
         
         if termo_busca:
-            query['$or'] = [
-                {'nome': {'$regex': termo_busca, '$options': 'i'}},
-                {'marca': {'$regex': termo_busca, '$options': 'i'}},
-            ]
+            query['$or'] = cls._filtro_termo(termo_busca)
         
         return cls.objects(__raw__=query)
     
-    @classmethod
-    def produtos_estoque_baixo(cls):
-        """Retorna produtos com estoque baixo"""
-        # No MongoEngine, precisamos fazer a query manualmente
-        produtos = cls.objects(ativo=True)
-        return [p for p in produtos if p.estoque_total <= p.estoque_minimo]
-
-class VendaRoupa(Document):
-    """
-    Documento que representa uma venda de roupa
-    """
-    # Dados da venda
-    numero_venda = fields.StringField(max_length=50, unique=True, verbose_name="Número da Venda")
-    data_venda = fields.DateTimeField(default=datetime.now, verbose_name="Data da Venda")
-    
-    # Dados do cliente
-    cliente_nome = fields.StringField(max_length=200, required=True, verbose_name="Nome do Cliente")
-    cliente_telefone = fields.StringField(max_length=20, verbose_name="Telefone do Cliente")
-    cliente_email = fields.EmailField(required=False, verbose_name="E-mail do Cliente")
-    
-    # Itens da venda
-    itens = fields.ListField(
-        fields.DictField(),
-        verbose_name="Itens da Venda"
-    )
-    
-    # Valores
-    subtotal = fields.DecimalField(min_value=0, precision=2, required=True, verbose_name="Subtotal")
-    desconto = fields.DecimalField(min_value=0, precision=2, default=0, verbose_name="Desconto")
-    valor_total = fields.DecimalField(min_value=0, precision=2, required=True, verbose_name="Valor Total")
+    @staticmethod
+    def _filtro_termo(termo_busca):
+        """Condições ($or) do termo de busca em nome, marca e cor (texto literal, sem regex do usuário)"""
+        padrao = re.escape(termo_busca.strip())
+        return [{campo: {'$regex': padrao, '$options': 'i'}} for campo in ('nome', 'marca', 'cor')]
     
-    # Forma de pagamento
-    forma_pagamento = fields.StringField(
-        choices=[
-            ('dinheiro', 'Dinheiro'),
-            ('debito', 'Cartão Débito'),
-            ('credito', 'Cartão Crédito'),
-            ('pix', 'PIX'),
-            ('outro', 'Outro')
-        ],
-        default='dinheiro',
-        verbose_name="Forma de Pagamento"
-    )
+    # Limites das faixas de preço da busca facetada (a última faixa é "acima de")
+    FAIXAS_PRECO = (0, 50, 100, 200, 500)
     
-    # Status
-    status = fields.StringField(
-        choices=[
-            ('pendente', 'Pendente'),
-            ('concluida', 'Concluída'),
-            ('cancelada', 'Cancelada'),
-            ('devolvida', 'Devolvida'),
-        ],
-        default='concluida',
-        verbose_name="Status"
-    )
+    # Campos lidos para exibir um produto nos resultados da busca
+    CAMPOS_BUSCA = ('nome', 'categoria', 'marca', 'cor', 'imagem', 'preco', 'preco_custo', 'ativo',
+                    'estoque_total', 'estoque_minimo', 'estoque_pp', 'estoque_p', 'estoque_m',
+                    'estoque_g', 'estoque_gg')
     
-    # Observações
-    observacoes = fields.StringField(verbose_name="Observações")
+    @classmethod
+    def _faixa_preco(cls, chave):
+        """'50-100' -> (50, 100); '500-' -> (500, None); None se inválida"""
+        try:
+            minimo, maximo = chave.split('-')
+            return float(minimo), (float(maximo) if maximo else None)
+        except (AttributeError, ValueError):
+            return None
     
-    # Campos de auditoria
-    data_criacao = fields.DateTimeField(default=datetime.now, verbose_name="Data de Criação")
-    data_atualizacao = fields.DateTimeField(default=datetime.now, verbose_name="Última Atualização")
+    @classmethod
+    def _rotulo_faixa(cls, minimo, maximo):
+        if maximo is None:
+            return f"{minimo:g}-", f"Acima de R$ {minimo:g}"
+        return f"{minimo:g}-{maximo:g}", f"R$ {minimo:g} a R$ {maximo:g}"
     
-    # Vendedor (opcional, para registrar quem fez a venda)
-    vendedor = fields.StringField(max_length=200, verbose_name="Vendedor")
+    @classmethod
+    def filtro_busca(cls, termo=None, categoria=None, marca=None, cor=None, tamanho=None,
+                     faixa_preco=None, estoque_baixo=False, apenas_ativos=True):
+        """Filtro ($match) da busca de produtos; os campos de igualdade vêm primeiro para usar os índices"""
+        filtro = {}
+        if apenas_ativos:
+            filtro['ativo'] = True
+        if categoria:
+            filtro['categoria'] = categoria
+        if marca:
+            filtro['marca'] = marca
+        if cor:
+            filtro['cor'] = cor
+        if tamanho in cls.TAMANHOS:
+            filtro[f'estoque_{tamanho}'] = {'$gt': 0}
+        faixa = cls._faixa_preco(faixa_preco) if faixa_preco else None
+        if faixa:
+            minimo, maximo = faixa
+            filtro['preco'] = {'$gte': minimo} if maximo is None else {'$gte': minimo, '$lt': maximo}
+        if estoque_baixo:
+            filtro['$expr'] = {'$lte': ['$estoque_total', '$estoque_minimo']}
+        if termo and termo.strip():
+            filtro['$or'] = cls._filtro_termo(termo)
+        return filtro
     
-    meta = {
-        'collection': 'vendas_roupa',
-        'ordering': ['-data_venda'],
-        'indexes': [
-            'numero_venda',
-            'data_venda',
-            'cliente_nome',
-            'status',
-            'forma_pagamento',
-            ('data_venda', 'status'),
+    @classmethod
+    def buscar_facetado(cls, pagina=1, por_pagina=20, **filtros):
+        """
+        Busca de produtos com contagens por faceta numa única agregação ($facet).
+        
+        filtros: os argumentos de filtro_busca(). As facetas são contadas sobre o
+        resultado filtrado, então mostram quantos produtos restam ao refinar.
+        Retorna {'produtos': [ProdutoRoupa], 'total': int, 'pagina': int,
+        'facetas': {'categorias', 'marcas', 'cores', 'tamanhos', 'faixas_preco'}}.
+        Os produtos têm só os campos de CAMPOS_BUSCA (somente leitura).
+        """
+        filtro = cls.filtro_busca(**filtros)
+        pagina = max(1, pagina)
+        
+        contagem_tamanhos = {
+            tamanho: {'$sum': {'$cond': [{'$gt': [f'$estoque_{tamanho}', 0]}, 1, 0]}}
+            for tamanho in cls.TAMANHOS
+        }
+        pipeline = [
+            {'$match': filtro},
+            {'$facet': {
+                'produtos': [
+                    {'$sort': {'categoria': 1, 'nome': 1}},
+                    {'$skip': (pagina - 1) * por_pagina},
+                    {'$limit': por_pagina},
+                    {'$project': {campo: 1 for campo in cls.CAMPOS_BUSCA}},
+                ],
+                'total': [{'$count': 'total'}],
+                'categorias': [
+                    {'$match': {'categoria': {'$nin': [None, '']}}},
+                    {'$sortByCount': '$categoria'},
+                ],
+                'marcas': [
+                    {'$match': {'marca': {'$nin': [None, '']}}},
+                    {'$sortByCount': '$marca'},
+                ],
+                'cores': [
+                    {'$match': {'cor': {'$nin': [None, '']}}},
+                    {'$sortByCount': '$cor'},
+                ],
+                'tamanhos': [{'$group': dict(_id=None, **contagem_tamanhos)}],
+                'faixas_preco': [{'$bucket': {
+                    'groupBy': '$preco',
+                    'boundaries': list(cls.FAIXAS_PRECO),
+                    'default': 'acima',
+                    'output': {'total': {'$sum': 1}},
+                }}],
+            }},
         ]
-    }
+        resultado = next(iter(cls.objects.aggregate(pipeline)), {})
+        
+        total = resultado['total'][0]['total'] if resultado.get('total') else 0
+        tamanhos = resultado['tamanhos'][0] if resultado.get('tamanhos') else {}
+        
+        faixas = []
+        limites = cls.FAIXAS_PRECO
+        for grupo in resultado.get('faixas_preco', []):
+            if grupo['_id'] == 'acima':
+                minimo, maximo = limites[-1], None
+            else:
+                minimo = grupo['_id']
+                maximo = limites[limites.index(minimo) + 1]
+            chave, rotulo = cls._rotulo_faixa(minimo, maximo)
+            faixas.append({'chave': chave, 'rotulo': rotulo, 'total': grupo['total']})
+        
+        return {
+            'produtos': [cls._from_son(dados) for dados in resultado.get('produtos', [])],
+            'total': total,
+            'pagina': pagina,
+            'facetas': {
+                'categorias': [{'valor': g['_id'], 'total': g['count']} for g in resultado.get('categorias', [])],
+                'marcas': [{'valor': g['_id'], 'total': g['count']} for g in resultado.get('marcas', [])],
+                'cores': [{'valor': g['_id'], 'total': g['count']} for g in resultado.get('cores', [])],
+                'tamanhos': [
+                    {'valor': tamanho, 'total': tamanhos.get(tamanho, 0)}
+                    for tamanho in cls.TAMANHOS if tamanhos.get(tamanho)
+                ],
+                'faixas_preco': faixas,
+            },
+        }
+    
+    # Campos necessários para exibir os itens de uma venda (recibo, detalhe, exportação)
+    CAMPOS_ITEM_VENDA = ('nome', 'categoria', 'marca', 'cor', 'imagem')
     
-    def __str__(self):
-        return f"Venda #{self.numero_venda} - {self.cliente_nome}"
+    @classmethod
+    def carregar_em_lote(cls, produto_ids, campos=CAMPOS_ITEM_VENDA):
+        """
+        Busca vários produtos em uma única consulta (id__in) e retorna {id: produto}.
+
+        Só os campos pedidos são carregados, então os documentos retornados
+        servem apenas para leitura (não chame save() neles).
+        """
+        ids_validos = {str(pid) for pid in produto_ids if pid and ObjectId.is_valid(str(pid))}
+        if not ids_validos:
+            return {}
+        
+        produtos = cls.objects(id__in=list(ids_validos)).only(*campos)
+        return {str(produto.id): produto for produto in produtos}
     
-    def save(self, *args, **kwargs):
-        """Atualiza a data de modificação"""
-        self.data_atualizacao = datetime.now()
-        return super().save(*args, **kwargs)
+    # Colunas aceitas na importação (além de estoque_<tamanho> e ean_<tamanho>)
+    CAMPOS_IMPORTACAO = (
+        'nome', 'descricao', 'categoria', 'preco', 'preco_custo', 'estoque_minimo',
+        'marca', 'cor', 'material', 'tags', 'ativo', 'em_destaque', 'sku_base',
+    )
     
     @classmethod
-    def gerar_numero_venda(cls):
-        """Gera um número único de venda"""
-        from datetime import datetime
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    def _produto_importacao(cls, linha):
+        """
+        Converte e valida uma linha importada (CSV ou JSON).
+
+        Retorna (produto, campos informados, EANs por tamanho); o produto não é salvo.
+        """
+        if linha.get('_erro'):
+            raise ValueError(linha['_erro'])
         
-        # Verificar se já existe
-        count = cls.objects.filter(numero_venda__contains=timestamp).count()
-        numero = f"VENDA-{timestamp}-{count + 1:03d}"
+        dados = {}
+        for campo in cls.CAMPOS_IMPORTACAO + tuple(f'estoque_{tamanho}' for tamanho in cls.TAMANHOS):
+            valor = linha.get(campo)
+            if isinstance(valor, str):
+                valor = valor.strip()
+            if valor is None or valor == '':
+                continue
+            
+            if campo in ('preco', 'preco_custo'):
+                valor = float(str(valor).replace(',', '.'))
+            elif campo.startswith('estoque_'):
+                valor = int(valor)
+            elif campo in ('ativo', 'em_destaque'):
+                valor = valor if isinstance(valor, bool) else str(valor).lower() in ('1', 'true', 'sim', 's')
+            elif campo == 'tags':
+                valor = valor if isinstance(valor, list) else [tag.strip() for tag in valor.split('|') if tag.strip()]
+            elif campo == 'sku_base':
+                valor = str(valor).upper()
+            dados[campo] = valor
+        
+        eans = {}
+        for tamanho in cls.TAMANHOS_VARIANTE:
+            ean = str(linha.get(f'ean_{tamanho}') or '').strip()
+            if ean:
+                if not ean.isdigit():
+                    raise ValueError(f'EAN inválido para o tamanho {tamanho.upper()}: {ean}')
+                eans[tamanho] = ean
         
-        return numero
+        produto = cls(**dados)
+        produto.estoque_total = sum(getattr(produto, f'estoque_{tamanho}') or 0 for tamanho in cls.TAMANHOS)
+        produto.validate()
+        return produto, set(dados), eans
     
     @classmethod
-    def vendas_periodo(cls, data_inicio, data_fim):
-        """Retorna vendas em um período específico"""
-        return cls.objects(
-            data_venda__gte=data_inicio,
-            data_venda__lte=data_fim
-        ).order_by('-data_venda')
+    def importar(cls, linhas, tamanho_lote=500, usuario=''):
+        """
+        Importa produtos de um iterável de dicts (ex: csv.DictReader), gravando em lotes.
+
+        Produtos são identificados pelo sku_base ou, sem ele, pelo nome: os existentes
+        têm os campos informados atualizados e os novos são criados com estoque
+        inicial. O estoque de produtos existentes não é alterado (use a contagem
+        de estoque). Retorna {'criados', 'atualizados', 'erros': [{'registro', 'erro'}]}.
+        """
+        relatorio = {'criados': 0, 'atualizados': 0, 'erros': []}
+        
+        lote = []
+        for registro, linha in enumerate(linhas, start=1):
+            try:
+                lote.append((registro,) + cls._produto_importacao(linha))
+            except (ValueError, TypeError, ValidationError) as e:
+                relatorio['erros'].append({'registro': registro, 'erro': str(e)})
+                continue
+            
+            if len(lote) >= tamanho_lote:
+                cls._gravar_lote_importacao(lote, relatorio, usuario)
+                lote = []
+        
+        if lote:
+            cls._gravar_lote_importacao(lote, relatorio, usuario)
+        
+        relatorio['erros'].sort(key=lambda erro: erro['registro'])
+        return relatorio
     
     @classmethod
-    def vendas_hoje(cls):
-        """Retorna vendas do dia atual"""
-        from datetime import datetime, timedelta
-        hoje = datetime.now().date()
-        amanha = hoje + timedelta(days=1)
+    def _gravar_lote_importacao(cls, lote, relatorio, usuario):
+        """Grava um lote da importação: uma leitura, um bulk_write e um insert de movimentações"""
+        from pymongo import UpdateOne
+        from pymongo.errors import BulkWriteError
         
-        return cls.objects(
-            data_venda__gte=datetime.combine(hoje, datetime.min.time()),
-            data_venda__lt=datetime.combine(amanha, datetime.min.time())
-        )
-    
-    @property
-    def lucro_bruto(self):
-        """Calcula o lucro bruto da venda"""
-        # Calcula a diferença entre o valor vendido e o custo dos produtos
-        lucro = 0
-        for item in self.itens:
-            produto_id = item.get('produto_id')
-            quantidade = item.get('quantidade', 0)
-            preco_venda = item.get('preco_venda', 0)
-            
-            try:
-                produto = ProdutoRoupa.objects.get(id=produto_id)
-                if produto.preco_custo:
-                    lucro += (preco_venda - float(produto.preco_custo)) * quantidade
-            except:
-                pass
+        def chave(produto):
+            return ('sku_base', produto.sku_base) if produto.sku_base else ('nome', produto.nome)
+        
+        # Registros repetidos no mesmo lote: vale o primeiro
+        unicos = {}
+        for item in lote:
+            registro, produto = item[0], item[1]
+            if chave(produto) in unicos:
+                relatorio['erros'].append({
+                    'registro': registro,
+                    'erro': f'Repetido no arquivo (registro {unicos[chave(produto)][0]})'
+                })
+            else:
+                unicos[chave(produto)] = item
+        lote = list(unicos.values())
+        
+        # Quais já existem (uma consulta para o lote)
+        skus = [produto.sku_base for _, produto, _, _ in lote if produto.sku_base]
+        nomes = [produto.nome for _, produto, _, _ in lote if not produto.sku_base]
+        existentes = set()
+        for dados in cls._get_collection().find(
+            {'$or': [{'sku_base': {'$in': skus}}, {'nome': {'$in': nomes}}]}, {'sku_base': 1, 'nome': 1}
+        ):
+            existentes.add(('sku_base', dados.get('sku_base')))
+            existentes.add(('nome', dados.get('nome')))
+        
+        # Filtro de cada registro, antes de gerar SKUs para os novos
+        filtros = [dict([chave(produto)]) for _, produto, _, _ in lote]
+        
+        # SKUs dos produtos novos sem SKU: um bloco reservado de uma vez
+        novos_sem_sku = [p for _, p, _, _ in lote if not p.sku_base and chave(p) not in existentes]
+        for produto, sequencia in zip(novos_sem_sku, ContadorSequencia.reservar_bloco(cls.CONTADOR_SKU, len(novos_sem_sku))):
+            produto.sku_base = cls.gerar_sku_base(sequencia)
         
-        return lucro
\ No newline at end of file
+        agora = datetime.now()
+        with cls.reservar_versao() as versao:
+            operacoes = []
+            for (registro, produto, informados, eans), filtro in zip(lote, filtros):
+                if produto.sku_base:
+                    produto.completar_variantes()
+                    for variante in produto.variantes:
+                        variante.ean = eans.get(variante.tamanho)
+            
+                documento = produto.to_mongo().to_dict()
+                documento.pop('_id', None)
+                # Estoque e códigos só na criação; o resto é atualizado se veio no arquivo
+                atualizar = {
+                    campo: documento[campo] for campo in informados
+                    if campo in documento and not campo.startswith('estoque_') and campo != 'sku_base'
+                }
+                if 'estoque_minimo' in informados:
+                    atualizar['estoque_minimo'] = documento['estoque_minimo']
+                atualizar.update(versao=versao, data_atualizacao=agora)
+                criar = {campo: valor for campo, valor in documento.items() if campo not in atualizar}
+            
+                operacoes.append(UpdateOne(filtro, {'$set': atualizar, '$setOnInsert': criar}, upsert=True))
+        
+            try:
+                resultado = cls._get_collection().bulk_write(operacoes, ordered=False).bulk_api_result
+            except BulkWriteError as e:
+                resultado = e.details
+                for erro in resultado.get('writeErrors', []):
+                    mensagem = 'Código (SKU/EAN) já usado por outro produto' if erro.get('code') == 11000 else erro.get('errmsg')
+                    relatorio['erros'].append({'registro': lote[erro['index']][0], 'erro': mensagem})
+        
+        criados = resultado.get('upserted', [])
+        relatorio['criados'] += len(criados)
+        relatorio['atualizados'] += resultado.get('nMatched', 0)
+        
+        # Estoque inicial dos produtos criados entra no histórico de movimentações
+        movimentos = []
+        for criado in criados:
+            produto = lote[criado['index']][1]
+            movimentos.extend(MovimentacaoEstoque.por_diferenca(
+                criado['_id'], {}, produto.estoque_por_tamanho, 'entrada',
+                data=agora, referencia='IMPORTACAO', usuario=usuario
+            ))
+        MovimentacaoEstoque.registrar(movimentos)
+    
+    @classmethod
+    def estatisticas_por_categoria(cls):
+        """
+        Estatísticas de produtos por categoria em uma única agregação.
+
+        A chave é o nome da categoria (o mesmo valor gravado em ProdutoRoupa.categoria);
+        produtos sem categoria ficam na chave ''.
+        """
+        pipeline = [
+            {'$group': {
+                '_id': '$categoria',
+                'total': {'$sum': 1},
+                'ativos': {'$sum': {'$cond': [{'$eq': ['$ativo', True]}, 1, 0]}},
+                'estoque': {'$sum': {'$ifNull': ['$estoque_total', 0]}},
+                'valor_estoque': {'$sum': {'$multiply': [
+                    {'$ifNull': ['$estoque_total', 0]},
+                    {'$ifNull': ['$preco', 0]}
+                ]}},
+            }}
+        ]
+        
+        estatisticas = {}
+        for item in cls.objects.aggregate(pipeline):
+            chave = item['_id'] or ''
+            atual = estatisticas.setdefault(chave, {'total': 0, 'ativos': 0, 'estoque': 0, 'valor_estoque': 0.0})
+            atual['total'] += item['total']
+            atual['ativos'] += item['ativos']
+            atual['estoque'] += item['estoque']
+            atual['valor_estoque'] += float(item['valor_estoque'])
+        
+        return estatisticas
+    
+    @classmethod
+    def produtos_estoque_baixo(cls):
+        """Retorna produtos com estoque baixo (comparação feita no banco)"""
+        return list(cls.objects(__raw__=cls.filtro_busca(estoque_baixo=True)))
+
+class ContadorSequencia(Document):
+    """
+    Documento que guarda contadores sequenciais (ex: número das vendas)
+    """
+    nome = fields.StringField(max_length=100, primary_key=True, verbose_name="Nome do Contador")
+    valor = fields.IntField(default=0, verbose_name="Último Valor")
+    
+    # Valores reservados com reservar() cuja escrita ainda não terminou: [{'valor', 'em'}]
+    pendentes = fields.ListField(fields.DictField(), verbose_name="Reservas em Andamento")
+
+    meta = {
+        'collection': 'contadores'
+    }
+    
+    # Segundos até uma reserva não concluída (processo interrompido) deixar de segurar o valor confirmado
+    VALIDADE_RESERVA = 300
+
+    def __str__(self):
+        return f"{self.nome} = {self.valor}"
+
+    @classmethod
+    def proximo_valor(cls, nome, quantidade=1):
+        """
+        Incrementa o contador de forma atômica e retorna o último valor reservado.
+
+        Com quantidade > 1 reserva um bloco inteiro: os valores reservados vão
+        de (retorno - quantidade + 1) até o retorno.
+        """
+        from pymongo import ReturnDocument
+
+        if quantidade < 1:
+            raise ValueError("A quantidade reservada deve ser maior que zero")
+
+        documento = cls._get_collection().find_one_and_update(
+            {'_id': nome},
+            {'$inc': {'valor': quantidade}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return documento['valor']
+
+    @classmethod
+    @contextmanager
+    def reservar(cls, nome):
+        """
+        Incrementa o contador e mantém o valor reservado como pendente até o fim
+        do bloco 'with', para valor_confirmado() não passar de uma escrita em andamento.
+
+            with ContadorSequencia.reservar('catalogo_roupa') as versao:
+                ...grava os documentos com versao...
+        """
+        from pymongo import ReturnDocument
+
+        documento = cls._get_collection().find_one_and_update(
+            {'_id': nome},
+            [
+                {'$set': {'valor': {'$add': [{'$ifNull': ['$valor', 0]}, 1]}}},
+                # Registra a reserva e descarta as vencidas
+                {'$set': {'pendentes': {'$concatArrays': [
+                    {'$filter': {
+                        'input': {'$ifNull': ['$pendentes', []]},
+                        'cond': {'$gte': ['$$this.em', {'$subtract': ['$$NOW', cls.VALIDADE_RESERVA * 1000]}]},
+                    }},
+                    [{'valor': '$valor', 'em': '$$NOW'}],
+                ]}}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        valor = documento['valor']
+        try:
+            yield valor
+        finally:
+            cls._get_collection().update_one({'_id': nome}, {'$pull': {'pendentes': {'valor': valor}}})
+
+    @classmethod
+    def valor_confirmado(cls, nome):
+        """
+        Maior valor até o qual todas as reservas já terminaram: o valor atual, ou
+        o anterior à reserva pendente mais antiga. Quem leu os documentos depois
+        desta leitura já vê todas as escritas até ele.
+        """
+        documento = cls._get_collection().find_one({'_id': nome}, {'valor': 1, 'pendentes': 1})
+        if not documento:
+            return 0
+        # $$NOW é gravado em UTC
+        limite = datetime.utcnow() - timedelta(seconds=cls.VALIDADE_RESERVA)
+        abertas = [p['valor'] for p in documento.get('pendentes') or () if p['em'] >= limite]
+        return min(abertas) - 1 if abertas else documento['valor']
+
+    @classmethod
+    def valor_atual(cls, nome):
+        """Retorna o valor atual do contador sem incrementá-lo"""
+        documento = cls._get_collection().find_one({'_id': nome}, {'valor': 1})
+        return documento['valor'] if documento else 0
+
+    @classmethod
+    def reservar_bloco(cls, nome, quantidade):
+        """Reserva um bloco de valores consecutivos e retorna o range reservado"""
+        ultimo = cls.proximo_valor(nome, quantidade)
+        return range(ultimo - quantidade + 1, ultimo + 1)
+
+    @classmethod
+    def valores_atuais(cls, nomes):
+        """Valor atual de vários contadores em uma única leitura: {nome: valor}"""
+        valores = {nome: 0 for nome in nomes}
+        for documento in cls._get_collection().find({'_id': {'$in': list(nomes)}}, {'valor': 1}):
+            valores[documento['_id']] = documento['valor']
+        return valores
+
+class MovimentacaoEstoque(Document):
+    """
+    Movimentação de estoque de um produto/tamanho (registro somente de inclusão)
+    """
+    produto_id = fields.StringField(required=True, verbose_name="ID do Produto")
+    tamanho = fields.StringField(max_length=10, required=True, verbose_name="Tamanho")
+    
+    # Quantidade com sinal: positiva para entradas, negativa para saídas
+    quantidade = fields.IntField(required=True, verbose_name="Quantidade")
+    
+    tipo = fields.StringField(
+        choices=[
+            ('entrada', 'Entrada'),
+            ('venda', 'Venda'),
+            ('devolucao', 'Devolução'),
+            ('cancelamento', 'Cancelamento de Venda'),
+            ('ajuste', 'Ajuste'),
+        ],
+        required=True,
+        verbose_name="Tipo"
+    )
+    
+    data = fields.DateTimeField(default=datetime.now, verbose_name="Data")
+    referencia = fields.StringField(max_length=100, verbose_name="Referência")  # ex: número da venda
+    usuario = fields.StringField(max_length=200, verbose_name="Usuário")
+    observacao = fields.StringField(verbose_name="Observação")
+    
+    meta = {
+        'collection': 'movimentacoes_estoque',
+        'ordering': ['data'],
+        'indexes': [
+            'data',
+            'referencia',
+            ('produto_id', 'data'),
+        ]
+    }
+    
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.quantidade:+d} ({self.produto_id}/{self.tamanho})"
+    
+    @classmethod
+    def por_diferenca(cls, produto_id, anterior, atual, tipo, **dados):
+        """
+        Monta (sem salvar) as movimentações que levam o estoque de 'anterior' para 'atual'.
+
+        'anterior' e 'atual' são dicts {tamanho: quantidade}; tamanhos sem diferença são ignorados.
+        """
+        movimentos = []
+        for tamanho in ProdutoRoupa.TAMANHOS:
+            diferenca = (atual.get(tamanho) or 0) - (anterior.get(tamanho) or 0)
+            if diferenca:
+                movimentos.append(cls(
+                    produto_id=str(produto_id),
+                    tamanho=tamanho,
+                    quantidade=diferenca,
+                    tipo=tipo,
+                    **dados
+                ))
+        return movimentos
+    
+    @classmethod
+    def registrar(cls, movimentos):
+        """Grava as movimentações com um único insert"""
+        if movimentos:
+            cls.objects.insert(movimentos, load_bulk=False)
+        return len(movimentos)
+    
+    @classmethod
+    def aplicar(cls, movimentos):
+        """
+        Aplica as movimentações ao estoque dos produtos e as grava.
+
+        O estoque muda com $inc em um único bulk_write (sem sobrescrever alterações
+        concorrentes), e as movimentações entram com um único insert.
+        """
+        from pymongo import UpdateOne
+        
+        incrementos = {}
+        for movimento in movimentos:
+            campos = incrementos.setdefault(movimento.produto_id, {})
+            for campo in (f'estoque_{movimento.tamanho}', 'estoque_total'):
+                campos[campo] = campos.get(campo, 0) + movimento.quantidade
+        
+        if incrementos:
+            with ProdutoRoupa.reservar_versao() as versao:
+                ProdutoRoupa._get_collection().bulk_write([
+                    UpdateOne({'_id': ObjectId(produto_id)}, {
+                        '$inc': campos,
+                        '$set': {'versao': versao, 'data_atualizacao': datetime.now()}
+                    })
+                    for produto_id, campos in incrementos.items()
+                ], ordered=False)
+        
+        return cls.registrar(movimentos)
+    
+    @classmethod
+    def estoque_em(cls, data, produto_ids=None):
+        """
+        Estoque de cada produto/tamanho em uma data: {produto_id: {tamanho: quantidade}}.
+
+        Parte do último snapshot anterior à data e reaplica só as movimentações
+        entre o snapshot e a data, então o custo é limitado pelo intervalo entre snapshots.
+        """
+        snapshot = SnapshotEstoque.ultimo_antes_de(data)
+        
+        estoque = {}
+        if snapshot:
+            filtro_snapshot = {'data': snapshot}
+            if produto_ids is not None:
+                filtro_snapshot['produto_id'] = {'$in': [str(pid) for pid in produto_ids]}
+            for item in SnapshotEstoque._get_collection().find(filtro_snapshot, {'produto_id': 1, 'estoque': 1}):
+                estoque[item['produto_id']] = dict(item.get('estoque') or {})
+        
+        filtro = {'data': {'$lte': data}}
+        if snapshot:
+            filtro['data']['$gt'] = snapshot
+        if produto_ids is not None:
+            filtro['produto_id'] = {'$in': [str(pid) for pid in produto_ids]}
+        
+        pipeline = [
+            {'$match': filtro},
+            {'$group': {
+                '_id': {'produto_id': '$produto_id', 'tamanho': '$tamanho'},
+                'quantidade': {'$sum': '$quantidade'}
+            }}
+        ]
+        for item in cls.objects.aggregate(pipeline):
+            produto = estoque.setdefault(item['_id']['produto_id'], {})
+            tamanho = item['_id']['tamanho']
+            produto[tamanho] = produto.get(tamanho, 0) + item['quantidade']
+        
+        return estoque
+
+class SnapshotEstoque(Document):
+    """
+    Fotografia periódica do estoque de um produto, ponto de partida para consultas por data
+    """
+    data = fields.DateTimeField(required=True, verbose_name="Data do Snapshot")
+    produto_id = fields.StringField(required=True, verbose_name="ID do Produto")
+    estoque = fields.DictField(verbose_name="Estoque por Tamanho")
+    
+    meta = {
+        'collection': 'snapshots_estoque',
+        'ordering': ['-data'],
+        'indexes': [
+            '-data',
+            ('data', 'produto_id'),
+        ]
+    }
+    
+    def __str__(self):
+        return f"Snapshot {self.data:%d/%m/%Y %H:%M} - {self.produto_id}"
+    
+    @classmethod
+    def ultimo_antes_de(cls, data):
+        """Data do último snapshot tirado até 'data' (ou None)"""
+        documento = cls._get_collection().find_one(
+            {'data': {'$lte': data}}, {'data': 1}, sort=[('data', -1)]
+        )
+        return documento['data'] if documento else None
+    
+    @classmethod
+    def gerar(cls, data=None):
+        """Grava o estoque atual de todos os produtos com a mesma data (um único insert)"""
+        data = data or datetime.now()
+        campos = {f'estoque_{tamanho}': 1 for tamanho in ProdutoRoupa.TAMANHOS}
+        
+        snapshots = [
+            cls(
+                data=data,
+                produto_id=str(produto['_id']),
+                estoque={tamanho: produto.get(f'estoque_{tamanho}') or 0 for tamanho in ProdutoRoupa.TAMANHOS}
+            )
+            for produto in ProdutoRoupa._get_collection().find({}, campos)
+        ]
+        if snapshots:
+            cls.objects.insert(snapshots, load_bulk=False)
+        return len(snapshots)
+
+class ContagemEstoque(Document):
+    """
+    Contagem física do estoque (inventário) importada de um CSV, aplicada após conferência
+    """
+    data = fields.DateTimeField(default=datetime.now, verbose_name="Data da Contagem")
+    usuario = fields.StringField(max_length=200, verbose_name="Usuário")
+    arquivo = fields.StringField(max_length=255, verbose_name="Arquivo")
+    
+    status = fields.StringField(
+        choices=[
+            ('pendente', 'Pendente'),
+            ('aplicada', 'Aplicada'),
+            ('descartada', 'Descartada'),
+        ],
+        default='pendente',
+        verbose_name="Status"
+    )
+    
+    # Uma linha por produto/tamanho contado: produto_id, produto_nome, sku, tamanho,
+    # estoque_sistema, contagem e diferenca
+    itens = fields.ListField(fields.DictField(), verbose_name="Itens Contados")
+    erros = fields.ListField(fields.DictField(), verbose_name="Linhas com Erro")
+    total_linhas = fields.IntField(default=0, verbose_name="Linhas Lidas")
+    
+    data_aplicacao = fields.DateTimeField(verbose_name="Data da Aplicação")
+    
+    meta = {
+        'collection': 'contagens_estoque',
+        'ordering': ['-data'],
+        'indexes': ['-data', 'status']
+    }
+    
+    def __str__(self):
+        return f"Contagem {self.data:%d/%m/%Y %H:%M} ({self.get_status_display()})"
+    
+    @property
+    def divergencias(self):
+        """Itens em que a contagem difere do estoque do sistema"""
+        return [item for item in self.itens if item.get('diferenca')]
+    
+    @classmethod
+    def analisar(cls, linhas, usuario='', arquivo=''):
+        """
+        Compara as linhas de uma contagem com o estoque atual e grava o resultado como pendente.
+
+        'linhas' é um iterável de dicts com 'sku' (SKU/EAN da variante ou SKU base),
+        'tamanho' (só necessário com o SKU base) e 'contagem'; pode ser um
+        csv.DictReader lido aos poucos. Todos os produtos são buscados em uma
+        única consulta; contagens repetidas do mesmo produto/tamanho são somadas.
+        """
+        contagens = {}  # (código, tamanho) -> quantidade contada
+        primeira_linha = {}  # (código, tamanho) -> linha em que apareceu primeiro
+        erros = []
+        total_linhas = 0
+        for numero, linha in enumerate(linhas, start=2):  # linha 1 é o cabeçalho
+            total_linhas += 1
+            codigo = (linha.get('sku') or '').strip().upper()
+            tamanho = (linha.get('tamanho') or '').strip().lower()
+            try:
+                quantidade = int((linha.get('contagem') or '').strip())
+            except ValueError:
+                erros.append({'linha': numero, 'erro': f"Contagem inválida: {linha.get('contagem')!r}"})
+                continue
+            if not codigo:
+                erros.append({'linha': numero, 'erro': 'SKU não informado'})
+                continue
+            if quantidade < 0:
+                erros.append({'linha': numero, 'erro': 'Contagem negativa'})
+                continue
+            
+            chave = (codigo, tamanho)
+            contagens[chave] = contagens.get(chave, 0) + quantidade
+            primeira_linha.setdefault(chave, numero)
+        
+        codigos = list({codigo for codigo, _ in contagens})
+        campos = {'nome': 1, 'sku_base': 1, 'variantes': 1}
+        campos.update({f'estoque_{tamanho}': 1 for tamanho in ProdutoRoupa.TAMANHOS})
+        
+        # Índice código -> (produto, tamanho da variante ou None para o SKU base)
+        por_codigo = {}
+        for produto in ProdutoRoupa._get_collection().find({'$or': [
+            {'variantes.sku': {'$in': codigos}},
+            {'variantes.ean': {'$in': codigos}},
+            {'sku_base': {'$in': codigos}},
+        ]}, campos):
+            if produto.get('sku_base'):
+                por_codigo[produto['sku_base']] = (produto, None)
+            for variante in produto.get('variantes', []):
+                for codigo in (variante.get('sku'), variante.get('ean')):
+                    if codigo:
+                        por_codigo[codigo] = (produto, variante['tamanho'])
+        
+        itens = {}
+        for (codigo, tamanho_informado), quantidade in contagens.items():
+            produto, tamanho = por_codigo.get(codigo, (None, None))
+            tamanho = tamanho or tamanho_informado
+            numero = primeira_linha[(codigo, tamanho_informado)]
+            if produto is None:
+                erros.append({'linha': numero, 'sku': codigo, 'erro': 'SKU não encontrado'})
+                continue
+            if tamanho not in ProdutoRoupa.TAMANHOS:
+                erros.append({'linha': numero, 'sku': codigo,
+                              'erro': f'Tamanho inválido ou sem controle de estoque: {tamanho!r}'})
+                continue
+            
+            chave = (str(produto['_id']), tamanho)
+            if chave in itens:
+                itens[chave]['contagem'] += quantidade
+                continue
+            itens[chave] = {
+                'produto_id': chave[0],
+                'produto_nome': produto.get('nome'),
+                'sku': f"{produto.get('sku_base')}-{tamanho.upper()}" if produto.get('sku_base') else codigo,
+                'tamanho': tamanho,
+                'estoque_sistema': produto.get(f'estoque_{tamanho}') or 0,
+                'contagem': quantidade,
+            }
+        
+        for item in itens.values():
+            item['diferenca'] = item['contagem'] - item['estoque_sistema']
+        
+        contagem = cls(
+            usuario=usuario,
+            arquivo=arquivo,
+            itens=sorted(itens.values(), key=lambda i: (i['produto_nome'] or '', i['tamanho'])),
+            erros=sorted(erros, key=lambda e: e['linha']),
+            total_linhas=total_linhas,
+        )
+        contagem.save()
+        return contagem
+    
+    def aplicar(self, usuario=''):
+        """
+        Lança as diferenças como movimentações de ajuste, em uma única escrita em lote.
+
+        A diferença calculada na conferência é somada ao estoque (vendas feitas
+        entre a conferência e a aplicação continuam valendo). Retorna o número de ajustes.
+
+        A contagem é marcada como aplicada antes da escrita, para duas aplicações
+        simultâneas não lançarem os ajustes duas vezes, e volta a pendente se a escrita falhar.
+        """
+        agora = datetime.now()
+        resultado = self._get_collection().update_one(
+            {'_id': self.id, 'status': 'pendente'},
+            {'$set': {'status': 'aplicada', 'data_aplicacao': agora}}
+        )
+        if resultado.modified_count == 0:
+            raise ValueError('Esta contagem já foi aplicada ou descartada')
+        
+        movimentos = [
+            MovimentacaoEstoque(
+                produto_id=item['produto_id'],
+                tamanho=item['tamanho'],
+                quantidade=item['diferenca'],
+                tipo='ajuste',
+                data=agora,
+                referencia=f'CONTAGEM-{self.id}',
+                usuario=usuario,
+                observacao=f"Contagem: {item['contagem']} (sistema: {item['estoque_sistema']})"
+            )
+            for item in self.divergencias
+        ]
+        try:
+            MovimentacaoEstoque.aplicar(movimentos)
+        except Exception:
+            self._get_collection().update_one(
+                {'_id': self.id, 'status': 'aplicada'},
+                {'$set': {'status': 'pendente'}, '$unset': {'data_aplicacao': ''}}
+            )
+            raise
+        
+        self.status = 'aplicada'
+        self.data_aplicacao = agora
+        return len(movimentos)
+
+class ProdutoRoupaRemovido(Document):
+    """
+    Registro de produto excluído, usado pela sincronização do catálogo do PDV
+    """
+    produto_id = fields.StringField(required=True, verbose_name="ID do Produto")
+    versao = fields.IntField(required=True, verbose_name="Versão no Catálogo")
+    data_remocao = fields.DateTimeField(default=datetime.now, verbose_name="Data da Remoção")
+    
+    meta = {
+        'collection': 'produtos_roupa_removidos',
+        'indexes': ['versao']
+    }
+    
+    def __str__(self):
+        return f"{self.produto_id} (versão {self.versao})"
+
+class VendaRoupa(Document):
+    """
+    Documento que representa uma venda de roupa
+    """
+    # Dados da venda
+    numero_venda = fields.StringField(max_length=50, unique=True, verbose_name="Número da Venda")
+    data_venda = fields.DateTimeField(default=datetime.now, verbose_name="Data da Venda")
+    
+    # Dados do cliente
+    cliente_nome = fields.StringField(max_length=200, required=True, verbose_name="Nome do Cliente")
+    cliente_telefone = fields.StringField(max_length=20, verbose_name="Telefone do Cliente")
+    cliente_email = fields.EmailField(required=False, verbose_name="E-mail do Cliente")
+    
+    # Itens da venda
+    itens = fields.ListField(
+        fields.DictField(),
+        verbose_name="Itens da Venda"
+    )
+    
+    # Valores
+    subtotal = fields.DecimalField(min_value=0, precision=2, required=True, verbose_name="Subtotal")
+    desconto = fields.DecimalField(min_value=0, precision=2, default=0, verbose_name="Desconto")
+    valor_total = fields.DecimalField(min_value=0, precision=2, required=True, verbose_name="Valor Total")
+    
+    # Forma de pagamento
+    forma_pagamento = fields.StringField(
+        choices=[
+            ('dinheiro', 'Dinheiro'),
+            ('debito', 'Cartão Débito'),
+            ('credito', 'Cartão Crédito'),
+            ('pix', 'PIX'),
+            ('outro', 'Outro')
+        ],
+        default='dinheiro',
+        verbose_name="Forma de Pagamento"
+    )
+    
+    # Status
+    status = fields.StringField(
+        choices=[
+            ('pendente', 'Pendente'),
+            ('concluida', 'Concluída'),
+            ('cancelada', 'Cancelada'),
+            ('devolvida', 'Devolvida'),
+        ],
+        default='concluida',
+        verbose_name="Status"
+    )
+    
+    # Observações
+    observacoes = fields.StringField(verbose_name="Observações")
+    
+    # Cancelamento e devoluções (cada item guarda sua 'quantidade_devolvida')
+    valor_devolvido = fields.DecimalField(min_value=0, precision=2, default=0, verbose_name="Valor Devolvido")
+    data_cancelamento = fields.DateTimeField(verbose_name="Data do Cancelamento")
+    devolucoes = fields.ListField(fields.DictField(), verbose_name="Devoluções")
+    
+    # Campos de auditoria
+    data_criacao = fields.DateTimeField(default=datetime.now, verbose_name="Data de Criação")
+    data_atualizacao = fields.DateTimeField(default=datetime.now, verbose_name="Última Atualização")
+    
+    # Vendedor (opcional, para registrar quem fez a venda)
+    vendedor = fields.StringField(max_length=200, verbose_name="Vendedor")
+    
+    # Chave gerada pelo PDV para que reenvios da mesma venda não a dupliquem
+    chave_idempotencia = fields.StringField(max_length=100, verbose_name="Chave de Idempotência")
+    
+    # Efeitos de uma venda do lote offline (EFEITOS_LOTE) ainda não aplicados
+    efeitos_pendentes = fields.ListField(fields.StringField(max_length=20), verbose_name="Efeitos Pendentes")
+    
+    meta = {
+        'collection': 'vendas_roupa',
+        'ordering': ['-data_venda'],
+        'indexes': [
+            'numero_venda',
+            'data_venda',
+            'cliente_nome',
+            'status',
+            'forma_pagamento',
+            ('data_venda', 'status'),
+            {'fields': ['chave_idempotencia'], 'unique': True, 'sparse': True},
+        ]
+    }
+    
+    def __str__(self):
+        return f"Venda #{self.numero_venda} - {self.cliente_nome}"
+    
+    def save(self, *args, **kwargs):
+        """Atualiza a data de modificação"""
+        self.data_atualizacao = datetime.now()
+        return super().save(*args, **kwargs)
+    
+    @staticmethod
+    def _prefixo_numero_venda(data=None):
+        """Prefixo diário usado na numeração das vendas"""
+        data = data or datetime.now()
+        return f"VENDA-{data.strftime('%Y%m%d')}"
+
+    @classmethod
+    def gerar_numero_venda(cls, data=None):
+        """
+        Gera um número único de venda (ex: VENDA-20251023-0001).
+
+        A sequência é diária e vem de um contador atômico, sem consultar as vendas.
+        """
+        prefixo = cls._prefixo_numero_venda(data)
+        sequencia = ContadorSequencia.proximo_valor(prefixo)
+        return f"{prefixo}-{sequencia:04d}"
+
+    @classmethod
+    def reservar_numeros_venda(cls, quantidade, data=None):
+        """Reserva de uma vez vários números de venda (usado em importações em lote)"""
+        prefixo = cls._prefixo_numero_venda(data)
+        return [
+            f"{prefixo}-{sequencia:04d}"
+            for sequencia in ContadorSequencia.reservar_bloco(prefixo, quantidade)
+        ]
+    
+    @classmethod
+    def registrar_lote(cls, vendas_recebidas, vendedor=''):
+        """
+        Registra um lote de vendas feitas offline no PDV.
+
+        Cada venda traz uma 'chave_idempotencia' gerada no cliente; vendas já
+        registradas com a mesma chave são reconhecidas e não se repetem. Produtos,
+        números de venda, vendas, estoque e movimentações são tratados com um
+        número fixo de operações em lote, independente do tamanho do lote.
+        
+        As vendas são gravadas com os efeitos (estoque, clientes, resumo do dia)
+        marcados como pendentes; se o processo cair antes de aplicá-los, o reenvio
+        da venda reconhece a chave e aplica o que faltou.
+        Retorna um resultado por venda, na ordem recebida.
+        """
+        from pymongo.errors import BulkWriteError
+        
+        resultados = [
+            {'chave': str((v.get('chave_idempotencia') if isinstance(v, dict) else None) or '').strip(), 'status': None}
+            for v in vendas_recebidas
+        ]
+        
+        # 1. Vendas já sincronizadas anteriormente (uma consulta)
+        chaves = [r['chave'] for r in resultados if r['chave']]
+        existentes = {}
+        incompletas = []  # vendas gravadas em um envio anterior cujos efeitos não terminaram
+        for doc in cls._get_collection().find(
+            {'chave_idempotencia': {'$in': chaves}},
+            {'chave_idempotencia': 1, 'numero_venda': 1, 'efeitos_pendentes': 1}
+        ):
+            existentes[doc['chave_idempotencia']] = doc['numero_venda']
+            if doc.get('efeitos_pendentes'):
+                incompletas.append(doc['_id'])
+        retomadas = list(cls.objects(id__in=incompletas)) if incompletas else []
+        
+        # 2. Todos os produtos do lote (uma consulta)
+        produto_ids = {
+            str(item.get('produto_id'))
+            for v in vendas_recebidas if isinstance(v, dict)
+            for item in (v.get('itens') or []) if isinstance(item, dict)
+        }
+        produtos = ProdutoRoupa.carregar_em_lote(produto_ids, campos=('nome', 'categoria', 'preco_custo'))
+        
+        # 3. Validar e montar as vendas novas
+        novas = []  # (índice no lote, venda)
+        chaves_no_lote = set()
+        for indice, (dados, resultado) in enumerate(zip(vendas_recebidas, resultados)):
+            chave = resultado['chave']
+            if not isinstance(dados, dict):
+                resultado.update(status='erro', erro='Venda em formato inválido')
+                continue
+            if not chave:
+                resultado.update(status='erro', erro='Venda sem chave_idempotencia')
+                continue
+            if chave in existentes:
+                resultado.update(status='duplicada', numero_venda=existentes[chave])
+                continue
+            if chave in chaves_no_lote:
+                resultado.update(status='duplicada', erro='Chave repetida no mesmo lote')
+                continue
+            
+            try:
+                venda = cls._montar_venda_lote(dados, produtos, vendedor)
+                venda.validate()
+            except (KeyError, TypeError, ValueError, ValidationError) as e:
+                resultado.update(status='erro', erro=str(e))
+                continue
+            
+            chaves_no_lote.add(chave)
+            venda.id = ObjectId()
+            venda.chave_idempotencia = chave
+            venda.efeitos_pendentes = list(cls.EFEITOS_LOTE)
+            novas.append((indice, venda))
+        
+        if not novas:
+            cls._aplicar_efeitos_lote(retomadas)
+            return resultados
+        
+        # 4. Números de venda: um bloco reservado por dia de venda
+        por_dia = {}
+        for _, venda in novas:
+            por_dia.setdefault(venda.data_venda.date(), []).append(venda)
+        for dia, vendas_do_dia in por_dia.items():
+            numeros = cls.reservar_numeros_venda(len(vendas_do_dia), data=datetime.combine(dia, datetime.min.time()))
+            for venda, numero in zip(vendas_do_dia, numeros):
+                venda.numero_venda = numero
+        
+        # 5. Inserir as vendas; reenvios concorrentes caem no índice único da chave
+        documentos = [venda.to_mongo() for _, venda in novas]
+        
+        falhas = {}
+        try:
+            cls._get_collection().insert_many(documentos, ordered=False)
+        except BulkWriteError as e:
+            for erro in e.details.get('writeErrors', []):
+                falhas[erro['index']] = erro
+        
+        # 6. Efeitos apenas das vendas gravadas (e das retomadas de envios anteriores)
+        gravadas = []
+        for posicao, (indice, venda) in enumerate(novas):
+            resultado = resultados[indice]
+            if posicao in falhas:
+                if falhas[posicao].get('code') == 11000:
+                    resultado.update(status='duplicada')
+                else:
+                    resultado.update(status='erro', erro=falhas[posicao].get('errmsg', 'Erro ao gravar venda'))
+                continue
+            
+            resultado.update(status='criada', numero_venda=venda.numero_venda)
+            gravadas.append(venda)
+        
+        cls._aplicar_efeitos_lote(gravadas + retomadas)
+        
+        return resultados
+    
+    # Efeitos de uma venda do lote, na ordem em que são aplicados
+    EFEITOS_LOTE = ('estoque', 'clientes', 'resumo')
+    
+    @classmethod
+    def _aplicar_efeitos_lote(cls, vendas):
+        """
+        Aplica às vendas do lote os efeitos ainda pendentes: estoque e movimentações,
+        estatísticas dos clientes e resumo do dia, uma operação em lote cada.
+        
+        Cada efeito sai de efeitos_pendentes logo depois de aplicado; uma falha no
+        meio deixa os seguintes pendentes para o próximo reenvio.
+        """
+        colecao = cls._get_collection()
+        for efeito in cls.EFEITOS_LOTE:
+            vendas_efeito = [venda for venda in vendas if efeito in (venda.efeitos_pendentes or [])]
+            if not vendas_efeito:
+                continue
+            
+            if efeito == 'estoque':
+                MovimentacaoEstoque.aplicar([m for venda in vendas_efeito for m in venda.movimentos_saida()])
+            elif efeito == 'clientes':
+                cls._atualizar_clientes_lote(vendas_efeito)
+            else:
+                ResumoVendasDia.registrar_vendas(vendas_efeito)
+            
+            colecao.update_many(
+                {'_id': {'$in': [venda.id for venda in vendas_efeito]}},
+                {'$pull': {'efeitos_pendentes': efeito}}
+            )
+    
+    def movimentos_saida(self):
+        """Saídas de estoque dos itens da venda ('unico' não tem controle de estoque)"""
+        return [
+            MovimentacaoEstoque(
+                produto_id=item['produto_id'], tamanho=item['tamanho'], quantidade=-item['quantidade'],
+                tipo='venda', data=self.data_venda, referencia=self.numero_venda, usuario=self.vendedor
+            )
+            for item in self.itens
+            if item.get('tamanho') in ProdutoRoupa.TAMANHOS
+        ]
+    
+    @staticmethod
+    def _atualizar_clientes_lote(vendas):
+        """Soma as vendas às estatísticas dos clientes (pelo telefone) em uma operação em lote"""
+        from .models_mongo import ClienteMongo
+        
+        por_telefone = {}
+        for venda in vendas:
+            if venda.cliente_telefone:
+                por_telefone.setdefault(venda.cliente_telefone, []).append(venda)
+        
+        ClienteMongo.registrar_estatisticas({
+            telefone: ClienteMongo.operacao_estatisticas(
+                telefone,
+                nome=max(vendas_cliente, key=lambda v: v.data_venda).cliente_nome,
+                compras=len(vendas_cliente),
+                valor=sum(float(v.valor_total) for v in vendas_cliente),
+                data_compra=max(v.data_venda for v in vendas_cliente)
+            )
+            for telefone, vendas_cliente in por_telefone.items()
+        })
+    
+    @classmethod
+    def _montar_venda_lote(cls, dados, produtos, vendedor):
+        """Monta (sem salvar) uma venda do lote offline"""
+        itens = dados.get('itens') or []
+        if not itens:
+            raise ValueError('Nenhum item na venda')
+        if not isinstance(itens, list) or not all(isinstance(item, dict) for item in itens):
+            raise ValueError('Itens da venda em formato inválido')
+        
+        data_venda = datetime.now()
+        if dados.get('data_venda'):
+            # Datas do PDV chegam em ISO 8601 (toISOString() manda UTC com 'Z'); guardamos
+            # no horário local sem fuso, como as demais vendas
+            data_venda = datetime.fromisoformat(dados['data_venda'].replace('Z', '+00:00'))
+            if data_venda.tzinfo is not None:
+                data_venda = timezone.localtime(data_venda).replace(tzinfo=None)
+        
+        itens_venda = []
+        for item in itens:
+            produto_id = str(item['produto_id'])
+            produto = produtos.get(produto_id)
+            if not produto:
+                raise ValueError(f'Produto {produto_id} não encontrado')
+            
+            quantidade = int(item['quantidade'])
+            preco = float(item['preco'])
+            if quantidade <= 0 or preco < 0:
+                raise ValueError(f'Quantidade ou preço inválido para {produto.nome}')
+            
+            # Mesmo formato do estoque (estoque_<tamanho>): o PDV pode mandar 'M', 'PP'...
+            tamanho = str(item.get('tamanho') or 'unico').strip().lower()
+            itens_venda.append({
+                'produto_id': produto_id,
+                'produto_nome': item.get('produto_nome') or produto.nome,
+                'categoria': item.get('categoria') or produto.categoria or '',
+                'tamanho': tamanho,
+                'quantidade': quantidade,
+                'preco_unitario': preco,
+                'preco_total': preco * quantidade,
+                'preco_custo': float(produto.preco_custo) if produto.preco_custo else None
+            })
+        
+        subtotal = sum(item['preco_total'] for item in itens_venda)
+        desconto = float(dados.get('valor_desconto') or 0)
+        
+        venda = cls(
+            data_venda=data_venda,
+            cliente_nome=dados.get('cliente_nome') or 'Cliente',
+            cliente_telefone=dados.get('cliente_telefone', ''),
+            itens=itens_venda,
+            subtotal=subtotal,
+            desconto=desconto,
+            valor_total=max(0, subtotal - desconto),
+            forma_pagamento=dados.get('forma_pagamento') or 'dinheiro',
+            vendedor=vendedor
+        )
+        return venda
+    
+    @property
+    def pode_devolver(self):
+        """Se a venda ainda tem itens que podem ser devolvidos ou cancelados"""
+        return self.status == 'concluida' and any(
+            (item.get('quantidade') or 0) > (item.get('quantidade_devolvida') or 0) for item in self.itens
+        )
+    
+    def cancelar(self, usuario='', motivo=''):
+        """Cancela a venda inteira, devolvendo ao estoque o que ainda não foi devolvido"""
+        quantidades = {
+            indice: (item.get('quantidade') or 0) - (item.get('quantidade_devolvida') or 0)
+            for indice, item in enumerate(self.itens)
+        }
+        return self._devolver_itens(quantidades, usuario, motivo, cancelamento=True)
+    
+    def devolver(self, quantidades, usuario='', motivo=''):
+        """
+        Devolve parte dos itens da venda: quantidades = {índice do item: quantidade}.
+
+        Quando todos os itens forem devolvidos a venda passa para 'devolvida'.
+        """
+        return self._devolver_itens(quantidades, usuario, motivo, cancelamento=False)
+    
+    def _devolver_itens(self, quantidades, usuario, motivo, cancelamento):
+        """
+        Registra a devolução na venda e repõe o estoque.
+
+        A venda é alterada com um update condicional (falha se outra devolução ou
+        cancelamento mudou os mesmos itens nesse meio tempo); o estoque volta com
+        um único bulk_write de $inc. Retorna o valor devolvido.
+        """
+        if self.status != 'concluida':
+            raise ValueError(f'Venda {self.get_status_display().lower()} não pode ser alterada')
+        
+        tipo = 'cancelamento' if cancelamento else 'devolucao'
+        agora = datetime.now()
+        # Desconto da venda rateado proporcionalmente entre os itens
+        fator = float(self.valor_total) / float(self.subtotal) if self.subtotal else 1
+        
+        filtro = {'_id': self.id, 'status': 'concluida'}
+        alteracoes = {}
+        devolvidas = {indice: item.get('quantidade_devolvida') or 0 for indice, item in enumerate(self.itens)}
+        itens_devolvidos = []
+        movimentos = []
+        valor = 0.0
+        for indice, quantidade in quantidades.items():
+            indice, quantidade = int(indice), int(quantidade)
+            if quantidade <= 0:
+                continue
+            if not 0 <= indice < len(self.itens):
+                raise ValueError(f'Item {indice} não existe nesta venda')
+            
+            item = self.itens[indice]
+            ja_devolvida = item.get('quantidade_devolvida') or 0
+            if ja_devolvida + quantidade > (item.get('quantidade') or 0):
+                raise ValueError(f"Quantidade a devolver maior que a vendida para {item.get('produto_nome')}")
+            
+            # Protege contra devoluções simultâneas do mesmo item
+            filtro[f'itens.{indice}.quantidade_devolvida'] = ja_devolvida if ja_devolvida else {'$in': [None, 0]}
+            alteracoes[f'itens.{indice}.quantidade_devolvida'] = ja_devolvida + quantidade
+            devolvidas[indice] = ja_devolvida + quantidade
+            
+            valor += float(item.get('preco_unitario') or 0) * quantidade * fator
+            itens_devolvidos.append({'indice': indice, 'quantidade': quantidade})
+            
+            # Vendas antigas do formulário gravavam o tamanho em maiúsculas
+            tamanho = (item.get('tamanho') or '').strip().lower()
+            if tamanho == 'unico':
+                continue  # vendido sem tamanho: não há estoque a repor
+            if tamanho not in ProdutoRoupa.TAMANHOS or not ObjectId.is_valid(str(item.get('produto_id') or '')):
+                print(f"⚠️ Estoque não reposto na venda {self.numero_venda}: "
+                      f"item {indice} ({item.get('produto_nome')}) com tamanho '{tamanho}' ou produto inválido")
+                continue
+            movimentos.append(MovimentacaoEstoque(
+                produto_id=str(item['produto_id']),
+                tamanho=tamanho,
+                quantidade=quantidade,
+                tipo=tipo,
+                data=agora,
+                referencia=self.numero_venda,
+                usuario=usuario,
+                observacao=motivo
+            ))
+        
+        if not itens_devolvidos:
+            raise ValueError('Nenhum item informado para devolução')
+        
+        # Não devolve mais do que foi pago (arredondamentos do rateio)
+        valor = round(min(valor, float(self.valor_total) - float(self.valor_devolvido or 0)), 2)
+        
+        totalmente_devolvida = all(
+            devolvidas[indice] >= (item.get('quantidade') or 0) for indice, item in enumerate(self.itens)
+        )
+        if cancelamento:
+            alteracoes.update(status='cancelada', data_cancelamento=agora)
+        elif totalmente_devolvida:
+            alteracoes['status'] = 'devolvida'
+        alteracoes['data_atualizacao'] = agora
+        
+        registro = {'data': agora, 'tipo': tipo, 'usuario': usuario, 'motivo': motivo,
+                    'itens': itens_devolvidos, 'valor': valor}
+        resultado = self._get_collection().update_one(filtro, {
+            '$set': alteracoes,
+            '$inc': {'valor_devolvido': valor},
+            '$push': {'devolucoes': registro},
+        })
+        if resultado.modified_count == 0:
+            self.reload()
+            raise ValueError('A venda foi alterada por outra operação; confira e tente novamente')
+        
+        MovimentacaoEstoque.aplicar(movimentos)
+        ResumoVendasDia.registrar_estorno(self, valor, cancelamento, agora)
+        
+        # Estatísticas do cliente: um cancelamento deixa de contar como compra
+        if self.cliente_telefone:
+            from .models_mongo import ClienteMongo
+            ClienteMongo.registrar_estatisticas({
+                self.cliente_telefone: ClienteMongo.operacao_estatisticas(
+                    self.cliente_telefone, self.cliente_nome,
+                    compras=-1 if cancelamento or totalmente_devolvida else 0,
+                    valor=-valor
+                )
+            })
+        
+        self.reload()
+        return valor
+    
+    @classmethod
+    def vendas_periodo(cls, data_inicio, data_fim):
+        """Retorna vendas em um período específico"""
+        return cls.objects(
+            data_venda__gte=data_inicio,
+            data_venda__lte=data_fim
+        ).order_by('-data_venda')
+    
+    @classmethod
+    def vendas_hoje(cls):
+        """Retorna vendas do dia atual"""
+        from datetime import datetime, timedelta
+        hoje = datetime.now().date()
+        amanha = hoje + timedelta(days=1)
+        
+        return cls.objects(
+            data_venda__gte=datetime.combine(hoje, datetime.min.time()),
+            data_venda__lt=datetime.combine(amanha, datetime.min.time())
+        )
+    
+    @classmethod
+    def expandir_itens(cls, vendas, campos=ProdutoRoupa.CAMPOS_ITEM_VENDA):
+        """
+        Expande os itens de uma ou mais vendas com os dados dos produtos.
+
+        Todos os produtos são resolvidos em uma única consulta. Itens cujo produto
+        foi excluído continuam na lista com produto=None e produto_removido=True.
+        Retorna {id da venda: [itens expandidos]}.
+        """
+        if isinstance(vendas, VendaRoupa):
+            vendas = [vendas]
+        
+        produto_ids = {item.get('produto_id') for venda in vendas for item in venda.itens}
+        produtos = ProdutoRoupa.carregar_em_lote(produto_ids, campos=campos)
+        
+        itens_por_venda = {}
+        for venda in vendas:
+            itens = []
+            for item in venda.itens:
+                produto = produtos.get(str(item.get('produto_id')))
+                itens.append({
+                    'produto': produto,
+                    'produto_id': item.get('produto_id'),
+                    'produto_nome': item.get('produto_nome') or (produto.nome if produto else 'Produto removido'),
+                    'produto_removido': produto is None,
+                    'categoria': item.get('categoria') or (produto.categoria if produto else ''),
+                    'tamanho': item.get('tamanho'),
+                    'quantidade': item.get('quantidade'),
+                    'quantidade_devolvida': item.get('quantidade_devolvida') or 0,
+                    'preco_unitario': item.get('preco_unitario'),
+                    'preco_total': item.get('preco_total'),
+                })
+            itens_por_venda[str(venda.id)] = itens
+        
+        return itens_por_venda
+    
+    @property
+    def lucro_bruto(self):
+        """
+        Calcula o lucro bruto da venda usando o custo congelado em cada item.
+
+        O desconto da venda (manual e de promoções) é distribuído entre os itens
+        na proporção do valor de cada um, e as unidades devolvidas não contam.
+        Itens sem preco_custo (vendas antigas) não entram no cálculo; rode o
+        comando congelar_custo_vendas para preenchê-los.
+        """
+        lucro = 0
+        fator = self.fator_desconto
+        for item in self.itens:
+            custo = item.get('preco_custo')
+            if custo is None:
+                continue
+            quantidade = (item.get('quantidade') or 0) - (item.get('quantidade_devolvida') or 0)
+            preco_venda = item.get('preco_unitario', item.get('preco_venda', 0)) or 0
+            lucro += (float(preco_venda) * fator - float(custo)) * quantidade
+        
+        return lucro
+    
+    @property
+    def fator_desconto(self):
+        """Fração do subtotal efetivamente cobrada (1 - desconto / subtotal)"""
+        subtotal = float(self.subtotal or 0)
+        if subtotal <= 0:
+            return 1.0
+        return 1 - min(float(self.desconto or 0), subtotal) / subtotal
+    
+    # Chaves de agrupamento aceitas pelo relatório de margem
+    AGRUPAMENTOS_MARGEM = {
+        'produto': '$itens.produto_id',
+        'categoria': '$itens.categoria',
+        'vendedor': '$vendedor',
+        'dia': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$data_venda'}},
+    }
+    
+    @classmethod
+    def relatorio_margem(cls, data_inicio, data_fim, agrupar_por='produto'):
+        """
+        Relatório de margem (receita, custo e lucro) das vendas concluídas no período.
+
+        Tudo é calculado em uma única agregação sobre os itens das vendas, usando
+        o custo congelado no momento da venda. A receita de cada item já desconta
+        sua parte do desconto da venda (mesma regra de fator_desconto) e as devoluções.
+        """
+        if agrupar_por not in cls.AGRUPAMENTOS_MARGEM:
+            raise ValueError(f"Agrupamento inválido: {agrupar_por}")
+        
+        # Quantidade líquida: descontadas as devoluções parciais
+        quantidade_vendida = {'$ifNull': ['$itens.quantidade', 0]}
+        quantidade = {'$subtract': [quantidade_vendida, {'$ifNull': ['$itens.quantidade_devolvida', 0]}]}
+        receita_vendida = {'$ifNull': [
+            '$itens.preco_total',
+            {'$multiply': [{'$ifNull': ['$itens.preco_unitario', 0]}, quantidade_vendida]}
+        ]}
+        receita_item = {'$cond': [
+            {'$gt': [quantidade_vendida, 0]},
+            {'$multiply': [receita_vendida, {'$divide': [quantidade, quantidade_vendida]}, '$fator_desconto']},
+            0
+        ]}
+        custo_item = {'$multiply': [{'$ifNull': ['$itens.preco_custo', 0]}, quantidade]}
+        sem_custo = {'$in': [{'$type': '$itens.preco_custo'}, ['missing', 'null']]}
+        
+        pipeline = [
+            {'$match': {
+                'data_venda': {'$gte': data_inicio, '$lte': data_fim},
+                'status': 'concluida'
+            }},
+            # Desconto da venda distribuído entre os itens na proporção do valor
+            {'$addFields': {'fator_desconto': {'$cond': [
+                {'$gt': [{'$ifNull': ['$subtotal', 0]}, 0]},
+                {'$subtract': [1, {'$divide': [
+                    {'$min': [{'$ifNull': ['$desconto', 0]}, '$subtotal']}, '$subtotal'
+                ]}]},
+                1
+            ]}}},
+            {'$unwind': '$itens'},
+            {'$group': {
+                '_id': cls.AGRUPAMENTOS_MARGEM[agrupar_por],
+                'nome': {'$first': '$itens.produto_nome'},
+                'quantidade': {'$sum': quantidade},
+                'receita': {'$sum': receita_item},
+                'custo': {'$sum': custo_item},
+                'itens_sem_custo': {'$sum': {'$cond': [sem_custo, 1, 0]}},
+                'vendas': {'$addToSet': '$_id'},
+            }},
+            {'$project': {
+                'nome': 1,
+                'quantidade': 1,
+                'receita': 1,
+                'custo': 1,
+                'itens_sem_custo': 1,
+                'total_vendas': {'$size': '$vendas'},
+                'lucro': {'$subtract': ['$receita', '$custo']},
+            }},
+            {'$sort': {'lucro': -1}},
+        ]
+        
+        relatorio = []
+        for linha in cls.objects.aggregate(pipeline):
+            custo = float(linha['custo'])
+            lucro = float(linha['lucro'])
+            relatorio.append({
+                'chave': linha['_id'] if linha['_id'] is not None else 'Não informado',
+                'nome': linha['nome'] if agrupar_por == 'produto' else None,
+                'quantidade': int(linha['quantidade']),
+                'total_vendas': linha['total_vendas'],
+                'receita': round(float(linha['receita']), 2),
+                'custo': round(custo, 2),
+                'lucro': round(lucro, 2),
+                # Mesma base de ProdutoRoupa.margem_lucro (lucro sobre o custo)
+                'margem': round((lucro / custo) * 100, 2) if custo > 0 else 0,
+                'itens_sem_custo': linha['itens_sem_custo'],
+            })
+        
+        return relatorio
+
+
+class ResumoVendasDia(Document):
+    """
+    Totais das vendas de roupa de um dia, atualizados a cada venda, cancelamento ou devolução
+    """
+    dia = fields.StringField(max_length=10, primary_key=True, verbose_name="Dia")  # 'AAAA-MM-DD'
+    
+    quantidade_vendas = fields.IntField(default=0, verbose_name="Vendas")
+    quantidade_itens = fields.IntField(default=0, verbose_name="Itens Vendidos")
+    valor_bruto = fields.FloatField(default=0, verbose_name="Valor Bruto")  # soma dos subtotais
+    descontos = fields.FloatField(default=0, verbose_name="Descontos")
+    valor_vendido = fields.FloatField(default=0, verbose_name="Valor Vendido")  # soma dos valores totais
+    
+    # {forma: {'quantidade', 'valor'}}
+    por_forma_pagamento = fields.DictField(verbose_name="Por Forma de Pagamento")
+    # {chave: {'nome', 'quantidade', 'valor'}} (chave = vendedor sem '.')
+    por_vendedor = fields.DictField(verbose_name="Por Vendedor")
+    
+    # Estornos lançados no dia (de vendas deste ou de outros dias): {'quantidade', 'valor'}
+    cancelamentos = fields.DictField(verbose_name="Cancelamentos")
+    devolucoes = fields.DictField(verbose_name="Devoluções")
+    # {forma: valor} - o estorno sai na mesma forma de pagamento da venda
+    estornos_por_forma_pagamento = fields.DictField(verbose_name="Estornos por Forma de Pagamento")
+    
+    # Uma atualização do dia falhou: o resumo é recalculado a partir das vendas na próxima leitura
+    desatualizado = fields.BooleanField(default=False, verbose_name="Desatualizado")
+    
+    data_atualizacao = fields.DateTimeField(default=datetime.now, verbose_name="Última Atualização")
+    
+    meta = {
+        'collection': 'resumo_vendas_dia',
+        'ordering': ['-dia']
+    }
+    
+    def __str__(self):
+        return f"Resumo {self.dia}: {self.quantidade_vendas} vendas"
+    
+    @staticmethod
+    def chave_dia(data):
+        return data.strftime('%Y-%m-%d')
+    
+    @staticmethod
+    def chave_vendedor(vendedor):
+        """Nome do vendedor como chave de campo do MongoDB (sem '.')"""
+        return (vendedor or 'sem_vendedor').replace('.', '_')
+    
+    @classmethod
+    def registrar_vendas(cls, vendas):
+        """Soma vendas recém-criadas ao resumo dos seus dias (um bulk_write de $inc)"""
+        from pymongo import UpdateOne
+        
+        por_dia = {}
+        for venda in vendas:
+            if venda.status != 'concluida':
+                continue
+            incrementos, nomes = por_dia.setdefault(cls.chave_dia(venda.data_venda), ({}, {}))
+            
+            valor = float(venda.valor_total)
+            forma = venda.forma_pagamento or 'outro'
+            vendedor = cls.chave_vendedor(venda.vendedor)
+            for campo, quantidade in (
+                ('quantidade_vendas', 1),
+                ('quantidade_itens', sum(int(item.get('quantidade') or 0) for item in venda.itens)),
+                ('valor_bruto', float(venda.subtotal)),
+                ('descontos', float(venda.desconto or 0)),
+                ('valor_vendido', valor),
+                (f'por_forma_pagamento.{forma}.quantidade', 1),
+                (f'por_forma_pagamento.{forma}.valor', valor),
+                (f'por_vendedor.{vendedor}.quantidade', 1),
+                (f'por_vendedor.{vendedor}.valor', valor),
+            ):
+                incrementos[campo] = incrementos.get(campo, 0) + quantidade
+            nomes[f'por_vendedor.{vendedor}.nome'] = venda.vendedor or 'Sem vendedor'
+        
+        if not por_dia:
+            return
+        
+        agora = datetime.now()
+        cls._get_collection().bulk_write([
+            UpdateOne(
+                {'_id': dia},
+                {'$inc': incrementos, '$set': dict(nomes, data_atualizacao=agora)},
+                upsert=True
+            )
+            for dia, (incrementos, nomes) in por_dia.items()
+        ], ordered=False)
+    
+    @classmethod
+    def registrar_estorno(cls, venda, valor, cancelamento, data=None):
+        """Soma um cancelamento ou devolução ao resumo do dia em que foi feito"""
+        data = data or datetime.now()
+        grupo = 'cancelamentos' if cancelamento else 'devolucoes'
+        forma = venda.forma_pagamento or 'outro'
+        cls._get_collection().update_one(
+            {'_id': cls.chave_dia(data)},
+            {
+                '$inc': {
+                    f'{grupo}.quantidade': 1,
+                    f'{grupo}.valor': float(valor),
+                    f'estornos_por_forma_pagamento.{forma}': float(valor),
+                },
+                '$set': {'data_atualizacao': datetime.now()},
+            },
+            upsert=True
+        )
+    
+    @classmethod
+    def marcar_desatualizado(cls, data):
+        """Marca o dia para ser recalculado quando uma venda ou estorno não pôde ser somado ao resumo"""
+        cls._get_collection().update_one(
+            {'_id': cls.chave_dia(data)},
+            {'$set': {'desatualizado': True, 'data_atualizacao': datetime.now()}},
+            upsert=True
+        )
+    
+    @classmethod
+    def fechamento(cls, data=None, troco_inicial=0.0):
+        """
+        Fechamento de caixa de um dia, lido de um único documento.
+
+        O dinheiro esperado na gaveta é o troco inicial mais as vendas em
+        dinheiro, menos os estornos em dinheiro. Um dia marcado como
+        desatualizado é recalculado a partir das vendas antes da leitura.
+        """
+        data = data or datetime.now()
+        dia = cls.chave_dia(data)
+        colecao = cls._get_collection()
+        resumo = colecao.find_one({'_id': dia}) or {}
+        if resumo.get('desatualizado'):
+            dia_data = data.date() if isinstance(data, datetime) else data
+            cls.recalcular(dia_data, dia_data)
+            resumo = colecao.find_one({'_id': dia}) or {}
+        
+        estornos = resumo.get('estornos_por_forma_pagamento') or {}
+        formas = []
+        for forma, rotulo in VendaRoupa.forma_pagamento.choices:
+            totais = (resumo.get('por_forma_pagamento') or {}).get(forma) or {}
+            if totais or estornos.get(forma):
+                formas.append({
+                    'forma': forma,
+                    'rotulo': rotulo,
+                    'quantidade': totais.get('quantidade', 0),
+                    'valor': round(totais.get('valor', 0), 2),
+                    'estornos': round(estornos.get(forma, 0), 2),
+                    'liquido': round(totais.get('valor', 0) - estornos.get(forma, 0), 2),
+                })
+        
+        vendedores = sorted(
+            (
+                {'nome': v.get('nome'), 'quantidade': v.get('quantidade', 0), 'valor': round(v.get('valor', 0), 2)}
+                for v in (resumo.get('por_vendedor') or {}).values()
+            ),
+            key=lambda v: -v['valor']
+        )
+        
+        cancelamentos = resumo.get('cancelamentos') or {}
+        devolucoes = resumo.get('devolucoes') or {}
+        valor_estornado = cancelamentos.get('valor', 0) + devolucoes.get('valor', 0)
+        
+        return {
+            'dia': dia,
+            'quantidade_vendas': resumo.get('quantidade_vendas', 0),
+            'quantidade_itens': resumo.get('quantidade_itens', 0),
+            'valor_bruto': round(resumo.get('valor_bruto', 0), 2),
+            'descontos': round(resumo.get('descontos', 0), 2),
+            'valor_vendido': round(resumo.get('valor_vendido', 0), 2),
+            'cancelamentos': {'quantidade': cancelamentos.get('quantidade', 0), 'valor': round(cancelamentos.get('valor', 0), 2)},
+            'devolucoes': {'quantidade': devolucoes.get('quantidade', 0), 'valor': round(devolucoes.get('valor', 0), 2)},
+            'valor_liquido': round(resumo.get('valor_vendido', 0) - valor_estornado, 2),
+            'por_forma_pagamento': formas,
+            'por_vendedor': vendedores,
+            'troco_inicial': round(troco_inicial, 2),
+            'dinheiro_esperado': round(
+                troco_inicial
+                + ((resumo.get('por_forma_pagamento') or {}).get('dinheiro') or {}).get('valor', 0)
+                - estornos.get('dinheiro', 0),
+                2
+            ),
+            'data_atualizacao': resumo.get('data_atualizacao'),
+        }
+    
+    @classmethod
+    def recalcular(cls, inicio, fim):
+        """
+        Reconstrói os resumos dos dias entre 'inicio' e 'fim' (datas) a partir das vendas.
+
+        Usado para correções e para gerar o histórico anterior ao resumo.
+        Retorna quantos dias foram gravados.
+        """
+        from datetime import timedelta
+        
+        data_inicio = datetime.combine(inicio, datetime.min.time())
+        data_fim = datetime.combine(fim + timedelta(days=1), datetime.min.time())
+        dia = {'$dateToString': {'format': '%Y-%m-%d', 'date': '$data_venda'}}
+        
+        resumos = {}
+        
+        def resumo_do(chave):
+            return resumos.setdefault(chave, {
+                '_id': chave, 'quantidade_vendas': 0, 'quantidade_itens': 0, 'valor_bruto': 0.0,
+                'descontos': 0.0, 'valor_vendido': 0.0, 'por_forma_pagamento': {}, 'por_vendedor': {},
+                'cancelamentos': {}, 'devolucoes': {}, 'estornos_por_forma_pagamento': {},
+                'data_atualizacao': datetime.now(),
+            })
+        
+        # Vendas: toda venda criada conta no dia dela (estornos são lançados à parte)
+        vendas = VendaRoupa.objects.aggregate([
+            {'$match': {'data_venda': {'$gte': data_inicio, '$lt': data_fim}, 'status': {'$ne': 'pendente'}}},
+            {'$group': {
+                '_id': {'dia': dia, 'forma': '$forma_pagamento', 'vendedor': '$vendedor'},
+                'quantidade': {'$sum': 1},
+                'itens': {'$sum': {'$sum': '$itens.quantidade'}},
+                'bruto': {'$sum': '$subtotal'},
+                'descontos': {'$sum': {'$ifNull': ['$desconto', 0]}},
+                'valor': {'$sum': '$valor_total'},
+            }},
+        ])
+        for linha in vendas:
+            resumo = resumo_do(linha['_id']['dia'])
+            forma = linha['_id'].get('forma') or 'outro'
+            vendedor = linha['_id'].get('vendedor')
+            valor = float(linha['valor'])
+            resumo['quantidade_vendas'] += linha['quantidade']
+            resumo['quantidade_itens'] += linha['itens']
+            resumo['valor_bruto'] += float(linha['bruto'])
+            resumo['descontos'] += float(linha['descontos'])
+            resumo['valor_vendido'] += valor
+            totais = resumo['por_forma_pagamento'].setdefault(forma, {'quantidade': 0, 'valor': 0.0})
+            totais['quantidade'] += linha['quantidade']
+            totais['valor'] += valor
+            totais = resumo['por_vendedor'].setdefault(
+                cls.chave_vendedor(vendedor), {'nome': vendedor or 'Sem vendedor', 'quantidade': 0, 'valor': 0.0}
+            )
+            totais['quantidade'] += linha['quantidade']
+            totais['valor'] += valor
+        
+        # Estornos: no dia em que o cancelamento/devolução foi feito
+        estornos = VendaRoupa.objects.aggregate([
+            {'$match': {'devolucoes.data': {'$gte': data_inicio, '$lt': data_fim}}},
+            {'$unwind': '$devolucoes'},
+            {'$match': {'devolucoes.data': {'$gte': data_inicio, '$lt': data_fim}}},
+            {'$group': {
+                '_id': {
+                    'dia': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$devolucoes.data'}},
+                    'tipo': '$devolucoes.tipo',
+                    'forma': '$forma_pagamento',
+                },
+                'quantidade': {'$sum': 1},
+                'valor': {'$sum': '$devolucoes.valor'},
+            }},
+        ])
+        for linha in estornos:
+            resumo = resumo_do(linha['_id']['dia'])
+            grupo = resumo['cancelamentos' if linha['_id'].get('tipo') == 'cancelamento' else 'devolucoes']
+            forma = linha['_id'].get('forma') or 'outro'
+            grupo['quantidade'] = grupo.get('quantidade', 0) + linha['quantidade']
+            grupo['valor'] = grupo.get('valor', 0) + float(linha['valor'])
+            resumo['estornos_por_forma_pagamento'][forma] = (
+                resumo['estornos_por_forma_pagamento'].get(forma, 0) + float(linha['valor'])
+            )
+        
+        colecao = cls._get_collection()
+        colecao.delete_many({'_id': {'$gte': cls.chave_dia(inicio), '$lte': cls.chave_dia(fim)}})
+        if resumos:
+            colecao.insert_many(list(resumos.values()))
+        return len(resumos)
+
+class SugestaoReposicao(Document):
+    """
+    Sugestão de reposição de estoque de um produto, calculada a partir da velocidade de vendas
+    """
+    produto_id = fields.StringField(required=True, verbose_name="ID do Produto")
+    produto_nome = fields.StringField(verbose_name="Nome do Produto")
+    categoria = fields.StringField(verbose_name="Categoria")
+    
+    estoque_atual = fields.IntField(default=0, verbose_name="Estoque Atual")
+    estoque_minimo = fields.IntField(default=0, verbose_name="Estoque Mínimo")
+    
+    # Unidades/dia (média móvel) e variação em unidades/semana a cada semana
+    media_diaria = fields.FloatField(default=0, verbose_name="Média de Vendas por Dia")
+    tendencia_semanal = fields.FloatField(default=0, verbose_name="Tendência Semanal")
+    
+    # None quando o estoque não chega ao limite dentro do horizonte
+    dias_ate_minimo = fields.FloatField(null=True, verbose_name="Dias até o Estoque Mínimo")
+    dias_ate_ruptura = fields.FloatField(null=True, verbose_name="Dias até Zerar")
+    quantidade_sugerida = fields.IntField(default=0, verbose_name="Quantidade Sugerida")
+    
+    # Detalhe por tamanho: [{tamanho, estoque, media_diaria, tendencia_semanal, dias_ate_ruptura, quantidade_sugerida}]
+    tamanhos = fields.ListField(fields.DictField(), verbose_name="Por Tamanho")
+    
+    data_calculo = fields.DateTimeField(default=datetime.now, verbose_name="Data do Cálculo")
+    
+    meta = {
+        'collection': 'sugestoes_reposicao',
+        'ordering': ['dias_ate_minimo'],
+        'indexes': [
+            'produto_id',
+            'dias_ate_minimo',
+        ]
+    }
+    
+    MS_POR_SEMANA = 7 * 24 * 60 * 60 * 1000
+    # Limite da projeção: além disso não há previsão de ruptura
+    HORIZONTE_DIAS = 365
+    
+    def __str__(self):
+        return f"{self.produto_nome} - repor {self.quantidade_sugerida}"
+    
+    @staticmethod
+    def _tendencia(serie):
+        """Inclinação (mínimos quadrados) de uma série semanal, em unidades/semana por semana"""
+        n = len(serie)
+        if n < 2:
+            return 0.0
+        media_x = (n - 1) / 2
+        media_y = sum(serie) / n
+        covariancia = sum((x - media_x) * (y - media_y) for x, y in enumerate(serie))
+        variancia = sum((x - media_x) ** 2 for x in range(n))
+        return covariancia / variancia
+    
+    @classmethod
+    def _dias_para_consumir(cls, quantidade, media_diaria, tendencia_semanal):
+        """
+        Dias até vender 'quantidade' unidades com a demanda diária media + variação * t.
+
+        Resolve media*t + (variação/2)*t² = quantidade; None se não acontecer no horizonte.
+        """
+        if quantidade <= 0:
+            return 0.0
+        variacao = tendencia_semanal / 49  # unidades/dia a cada dia
+        
+        if abs(variacao) < 1e-9:
+            dias = quantidade / media_diaria if media_diaria > 0 else None
+        else:
+            discriminante = media_diaria ** 2 + 2 * variacao * quantidade
+            if discriminante < 0:
+                return None  # demanda em queda zera antes de consumir o estoque
+            dias = (-media_diaria + discriminante ** 0.5) / variacao
+            if dias <= 0:
+                return None
+        
+        if dias is None or dias > cls.HORIZONTE_DIAS:
+            return None
+        return round(dias, 1)
+    
+    @staticmethod
+    def _demanda_projetada(media_diaria, tendencia_semanal, dias):
+        """Unidades vendidas nos próximos 'dias' seguindo a média e a tendência (nunca negativa)"""
+        variacao = tendencia_semanal / 49
+        return max(0.0, media_diaria * dias + variacao * dias * (dias + 1) / 2)
+    
+    @classmethod
+    def vendas_semanais(cls, inicio, semanas):
+        """
+        Unidades vendidas por produto/tamanho em cada semana desde 'inicio'.
+
+        Uma única agregação agrupa o histórico inteiro; retorna {(produto_id, tamanho): [semana0, ...]}.
+        """
+        pipeline = [
+            {'$match': {'data_venda': {'$gte': inicio}, 'status': 'concluida'}},
+            {'$unwind': '$itens'},
+            # Vendas antigas do formulário gravavam o tamanho em maiúsculas
+            {'$set': {'itens.tamanho': {'$toLower': {'$ifNull': ['$itens.tamanho', '']}}}},
+            {'$match': {'itens.tamanho': {'$in': list(ProdutoRoupa.TAMANHOS)}}},
+            {'$group': {
+                '_id': {
+                    'produto': '$itens.produto_id',
+                    'tamanho': '$itens.tamanho',
+                    'semana': {'$floor': {'$divide': [
+                        {'$subtract': ['$data_venda', inicio]}, cls.MS_POR_SEMANA
+                    ]}},
+                },
+                'quantidade': {'$sum': {'$ifNull': ['$itens.quantidade', 0]}},
+            }},
+        ]
+        
+        series = {}
+        for linha in VendaRoupa.objects.aggregate(pipeline):
+            chave = (linha['_id']['produto'], linha['_id']['tamanho'])
+            semana = int(linha['_id']['semana'])
+            if 0 <= semana < semanas:
+                serie = series.setdefault(chave, [0] * semanas)
+                serie[semana] += linha['quantidade']
+        return series
+    
+    @classmethod
+    def gerar(cls, dias_historico=365, semanas_media=4, semanas_tendencia=12, dias_cobertura=30):
+        """
+        Recalcula as sugestões de reposição de todos os produtos ativos.
+
+        Média móvel das últimas 'semanas_media' semanas, tendência das últimas
+        'semanas_tendencia' e quantidade sugerida para cobrir 'dias_cobertura' dias
+        acima do estoque mínimo. Substitui as sugestões anteriores.
+        """
+        from datetime import timedelta
+        import math
+        
+        agora = datetime.now()
+        semanas = max(1, dias_historico // 7)
+        # Só semanas completas: a última termina agora
+        inicio = agora - timedelta(weeks=semanas)
+        series = cls.vendas_semanais(inicio, semanas)
+        
+        campos = {'nome': 1, 'categoria': 1, 'estoque_minimo': 1}
+        campos.update({f'estoque_{tamanho}': 1 for tamanho in ProdutoRoupa.TAMANHOS})
+        
+        sugestoes = []
+        for produto in ProdutoRoupa._get_collection().find({'ativo': True}, campos):
+            produto_id = str(produto['_id'])
+            estoque_minimo = produto.get('estoque_minimo') or 0
+            
+            tamanhos = []
+            for tamanho in ProdutoRoupa.TAMANHOS:
+                estoque = produto.get(f'estoque_{tamanho}') or 0
+                serie = series.get((produto_id, tamanho))
+                if not serie and not estoque:
+                    continue
+                
+                serie = serie or [0] * semanas
+                media_diaria = sum(serie[-semanas_media:]) / (min(semanas_media, semanas) * 7)
+                tendencia = cls._tendencia(serie[-semanas_tendencia:])
+                demanda = cls._demanda_projetada(media_diaria, tendencia, dias_cobertura)
+                
+                tamanhos.append({
+                    'tamanho': tamanho,
+                    'estoque': estoque,
+                    'media_diaria': round(media_diaria, 3),
+                    'tendencia_semanal': round(tendencia, 3),
+                    'dias_ate_ruptura': cls._dias_para_consumir(estoque, media_diaria, tendencia),
+                    'demanda_cobertura': demanda,
+                })
+            
+            if not tamanhos:
+                continue
+            
+            estoque_atual = sum(t['estoque'] for t in tamanhos)
+            media_diaria = sum(t['media_diaria'] for t in tamanhos)
+            tendencia = sum(t['tendencia_semanal'] for t in tamanhos)
+            demanda_total = sum(t['demanda_cobertura'] for t in tamanhos)
+            
+            # Mínimo distribuído entre os tamanhos na proporção da demanda
+            for t in tamanhos:
+                parcela = t.pop('demanda_cobertura') / demanda_total if demanda_total else 0
+                alvo = parcela * (demanda_total + estoque_minimo)
+                t['quantidade_sugerida'] = max(0, math.ceil(alvo - t['estoque']))
+            
+            sugestoes.append(cls(
+                produto_id=produto_id,
+                produto_nome=produto.get('nome'),
+                categoria=produto.get('categoria'),
+                estoque_atual=estoque_atual,
+                estoque_minimo=estoque_minimo,
+                media_diaria=round(media_diaria, 3),
+                tendencia_semanal=round(tendencia, 3),
+                dias_ate_minimo=cls._dias_para_consumir(estoque_atual - estoque_minimo, media_diaria, tendencia),
+                dias_ate_ruptura=cls._dias_para_consumir(estoque_atual, media_diaria, tendencia),
+                quantidade_sugerida=sum(t['quantidade_sugerida'] for t in tamanhos),
+                tamanhos=tamanhos,
+                data_calculo=agora,
+            ))
+        
+        cls.objects.delete()
+        if sugestoes:
+            cls.objects.insert(sugestoes, load_bulk=False)
+        return len(sugestoes)
+    
+    @classmethod
+    def para_repor(cls, limite=50):
+        """Produtos com reposição sugerida, os mais urgentes primeiro"""
+        sugestoes = list(cls.objects(quantidade_sugerida__gt=0))
+        sugestoes.sort(key=lambda s: (s.dias_ate_minimo is None, s.dias_ate_minimo or 0))
+        return sugestoes[:limite]
+
+
+class Promocao(Document):
+    """
+    Regra de promoção do vestuário (desconto percentual ou fixo)
+
+    Filtros vazios valem para qualquer produto; filtros preenchidos precisam
+    todos combinar (dentro de um mesmo filtro basta um dos valores).
+    """
+    nome = fields.StringField(max_length=200, required=True, verbose_name="Nome da Promoção")
+    
+    tipo = fields.StringField(
+        choices=[
+            ('percentual', 'Percentual (%)'),
+            ('fixo', 'Valor Fixo (R$)'),
+        ],
+        default='percentual',
+        verbose_name="Tipo"
+    )
+    valor = fields.FloatField(min_value=0, required=True, verbose_name="Valor do Desconto")
+    
+    # Filtros (nomes de categoria/marca como gravados em ProdutoRoupa)
+    categorias = fields.ListField(fields.StringField(max_length=100), verbose_name="Categorias")
+    marcas = fields.ListField(fields.StringField(max_length=100), verbose_name="Marcas")
+    tamanhos = fields.ListField(fields.StringField(max_length=10), verbose_name="Tamanhos")
+    produto_ids = fields.ListField(fields.StringField(max_length=24), verbose_name="Produtos")
+    
+    # Combo: o desconto vale para cada grupo completo de N unidades (1 = por unidade)
+    quantidade_minima = fields.IntField(min_value=1, default=1, verbose_name="Unidades por Combo")
+    
+    # Período de validade e janela de horário (opcionais); dias_semana: 0 = segunda ... 6 = domingo
+    data_inicio = fields.DateTimeField(verbose_name="Início")
+    data_fim = fields.DateTimeField(verbose_name="Fim")
+    dias_semana = fields.ListField(fields.IntField(min_value=0, max_value=6), verbose_name="Dias da Semana")
+    hora_inicio = fields.StringField(max_length=5, verbose_name="Hora Inicial")  # "HH:MM"
+    hora_fim = fields.StringField(max_length=5, verbose_name="Hora Final")
+    
+    ativo = fields.BooleanField(default=True, verbose_name="Ativa")
+    data_criacao = fields.DateTimeField(default=datetime.now, verbose_name="Data de Criação")
+    data_atualizacao = fields.DateTimeField(default=datetime.now, verbose_name="Última Atualização")
+    
+    meta = {
+        'collection': 'promocoes',
+        'ordering': ['nome'],
+        'indexes': ['ativo']
+    }
+    
+    # Contador (ContadorSequencia) incrementado a cada alteração nas regras
+    CONTADOR_VERSAO = 'promocoes'
+    
+    def __str__(self):
+        return self.nome
+    
+    def clean(self):
+        """Valida o percentual e o formato das horas"""
+        if self.tipo == 'percentual' and self.valor > 100:
+            raise ValidationError('O desconto percentual não pode passar de 100%')
+        for hora in (self.hora_inicio, self.hora_fim):
+            if hora:
+                try:
+                    datetime.strptime(hora, '%H:%M')
+                except ValueError:
+                    raise ValidationError(f'Hora inválida: {hora} (use HH:MM)')
+    
+    def save(self, *args, **kwargs):
+        """Salva e avisa os processos para recompilar as regras"""
+        self.data_atualizacao = datetime.now()
+        resultado = super().save(*args, **kwargs)
+        self.regras_alteradas()
+        return resultado
+    
+    def delete(self, *args, **kwargs):
+        """Remove e avisa os processos para recompilar as regras"""
+        resultado = super().delete(*args, **kwargs)
+        self.regras_alteradas()
+        return resultado
+    
+    @classmethod
+    def regras_alteradas(cls):
+        """Nova versão das regras: este processo recompila já, os demais na próxima verificação"""
+        from . import promocoes
+        
+        ContadorSequencia.proximo_valor(cls.CONTADOR_VERSAO)
+        promocoes.invalidar()
+
@@ -241,8 +241,97 @@ class ClienteMongo(Document):
     def __str__(self):
         return f"{self.nome} ({self.telefone})"
     
+    # Total de agendamentos + compras a partir do qual o cliente é considerado frequente
+    LIMITE_CLIENTE_FREQUENTE = 5
+    
+    @classmethod
+    def operacao_estatisticas(cls, telefone, nome, compras=0, valor=0.0, agendamentos=0,
+                              data_compra=None, data_agendamento=None):
+        """
+        Monta a atualização atômica ($inc/$max) das estatísticas de um cliente.
+
+        Cria o cliente se ainda não existir, exceto em estornos (valores negativos):
+        um estorno de quem não está cadastrado não deve criar cliente com totais
+        negativos. Use com registrar_estatisticas().
+        """
+        from pymongo import UpdateOne
+        
+        agora = datetime.now()
+        atualizacao = {
+            '$set': {'nome': nome, 'data_atualizacao': agora},
+            '$inc': {
+                'total_compras': compras,
+                'valor_total_gasto': float(valor),
+                'total_agendamentos': agendamentos,
+            },
+            '$setOnInsert': {
+                'data_criacao': agora,
+                'cliente_frequente': False,
+                'notificacoes_whatsapp': True,
+            },
+        }
+        maximos = {}
+        if data_compra:
+            maximos['ultima_compra'] = data_compra
+        if data_agendamento:
+            maximos['ultimo_agendamento'] = data_agendamento
+        if maximos:
+            atualizacao['$max'] = maximos
+        
+        estorno = compras < 0 or valor < 0 or agendamentos < 0
+        return UpdateOne({'telefone': telefone}, atualizacao, upsert=not estorno)
+    
+    @classmethod
+    def registrar_estatisticas(cls, operacoes):
+        """
+        Aplica as operações de estatística em lote e marca quem virou cliente frequente.
+
+        operacoes: dict {telefone: operacao_estatisticas(...)}
+        """
+        if not operacoes:
+            return
+        
+        colecao = cls._get_collection()
+        colecao.bulk_write(list(operacoes.values()), ordered=False)
+        
+        colecao.update_many(
+            {
+                'telefone': {'$in': list(operacoes)},
+                'cliente_frequente': {'$ne': True},
+                '$expr': {'$gte': [
+                    {'$add': [
+                        {'$ifNull': ['$total_agendamentos', 0]},
+                        {'$ifNull': ['$total_compras', 0]},
+                    ]},
+                    cls.LIMITE_CLIENTE_FREQUENTE
+                ]},
+            },
+            {'$set': {'cliente_frequente': True}}
+        )
+    
+    @classmethod
+    def registrar_compra(cls, telefone, nome, valor, data=None):
+        """Soma uma compra às estatísticas do cliente (sem reler o histórico)"""
+        if telefone:
+            cls.registrar_estatisticas({telefone: cls.operacao_estatisticas(
+                telefone, nome, compras=1, valor=valor, data_compra=data or datetime.now()
+            )})
+    
+    @classmethod
+    def registrar_agendamento(cls, telefone, nome, data=None):
+        """Soma um agendamento às estatísticas do cliente (sem reler o histórico)"""
+        if telefone:
+            cls.registrar_estatisticas({telefone: cls.operacao_estatisticas(
+                telefone, nome, agendamentos=1, data_agendamento=data or datetime.now()
+            )})
+    
     def atualizar_estatisticas(self):
-        """Atualiza as estatísticas do cliente"""
+        """
+        Recalcula as estatísticas do cliente a partir de todo o histórico.
+
+        O dia a dia usa registrar_compra/registrar_agendamento; este método serve
+        para correções (comando recalcular_estatisticas_clientes).
+        """
         try:
             from .models import VendaRoupa
             from .models_mongo import AgendamentoMongo
@@ -267,7 +356,7 @@ class ClienteMongo(Document):
                 self.ultimo_agendamento = ultimo_agend.data_criacao
             
             # Marcar como frequente se tiver mais de 5 agendamentos/compras
-            self.cliente_frequente = (self.total_agendamentos + self.total_compras) >= 5
+            self.cliente_frequente = (self.total_agendamentos + self.total_compras) >= self.LIMITE_CLIENTE_FREQUENTE
             
             self.save()
         except Exception as e:
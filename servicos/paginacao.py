@@ -0,0 +1,52 @@
+"""
+Paginação feita no banco: adaptadores para o Paginator do Django e cursores
+para paginação por chave (keyset)
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.core.paginator import Page, Paginator
+
+
+class ConsultaPaginada:
+    """
+    Adapta um QuerySet do MongoEngine ao Paginator com um total já conhecido.
+
+    O Paginator só pede len() e um fatiamento por página; o fatiamento vira
+    skip/limit na consulta, então só a página exibida é lida do banco.
+    """
+
+    def __init__(self, queryset, total):
+        self.queryset = queryset
+        self.total = total
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, fatia):
+        return list(self.queryset[fatia])
+
+
+def pagina_pronta(itens, total, numero, por_pagina):
+    """
+    Page do Django para uma página que a consulta já trouxe pronta (ex: $facet
+    com $skip/$limit), sem reler nada: o Paginator só precisa do total.
+    """
+    paginator = Paginator(range(total), por_pagina)
+    return Page(itens, numero, paginator)
+
+
+def codificar_cursor(valores):
+    """Cursor opaco (texto para URL) com os valores de ordenação do último item exibido"""
+    texto = json.dumps([v.isoformat() if isinstance(v, datetime) else str(v) for v in valores])
+    return base64.urlsafe_b64encode(texto.encode('utf-8')).decode('ascii')
+
+
+def decodificar_cursor(cursor):
+    """Lista de textos gravada por codificar_cursor; None se o cursor for inválido"""
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, AttributeError):
+        return None
+    return valores if isinstance(valores, list) else None
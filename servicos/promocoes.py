@@ -0,0 +1,232 @@
+"""
+Motor de promoções do vestuário
+
+As promoções ativas ficam compiladas em memória (um índice por processo) e um
+carrinho é precificado sem consultar o banco. Cada processo confere a versão
+das regras (ContadorSequencia 'promocoes') no máximo a cada
+INTERVALO_VERIFICACAO segundos e só recompila quando ela muda.
+"""
+import threading
+import time
+from datetime import datetime
+
+# Segundos entre verificações da versão das regras no banco
+INTERVALO_VERIFICACAO = 5
+
+_estado = {'indice': None, 'versao': None, 'verificado_em': 0.0}
+_trava = threading.Lock()
+
+
+def _normalizar(valor):
+    return (valor or '').strip().lower()
+
+
+def _minutos(hora):
+    """'HH:MM' -> minutos desde a meia-noite (None se vazio)"""
+    if not hora:
+        return None
+    horas, minutos = hora.split(':')
+    return int(horas) * 60 + int(minutos)
+
+
+class RegraCompilada:
+    """Promoção pronta para avaliação: filtros em frozensets e horários em minutos"""
+    __slots__ = ('id', 'nome', 'percentual', 'valor', 'combo', 'categorias', 'marcas', 'tamanhos',
+                 'produtos', 'inicio', 'fim', 'dias_semana', 'hora_inicio', 'hora_fim')
+
+    def __init__(self, promocao):
+        self.id = str(promocao.id)
+        self.nome = promocao.nome
+        self.percentual = promocao.tipo == 'percentual'
+        self.valor = float(promocao.valor)
+        self.combo = max(1, promocao.quantidade_minima or 1)
+        self.categorias = frozenset(_normalizar(c) for c in promocao.categorias)
+        self.marcas = frozenset(_normalizar(m) for m in promocao.marcas)
+        self.tamanhos = frozenset(_normalizar(t) for t in promocao.tamanhos)
+        self.produtos = frozenset(promocao.produto_ids)
+        self.inicio = promocao.data_inicio
+        self.fim = promocao.data_fim
+        self.dias_semana = frozenset(promocao.dias_semana)
+        self.hora_inicio = _minutos(promocao.hora_inicio)
+        self.hora_fim = _minutos(promocao.hora_fim)
+
+    def chave_indice(self):
+        """Filtro mais seletivo, usado para indexar a regra: (dimensão, valores) ou None"""
+        for dimensao, valores in (('produto', self.produtos), ('marca', self.marcas),
+                                  ('categoria', self.categorias), ('tamanho', self.tamanhos)):
+            if valores:
+                return dimensao, valores
+        return None
+
+    def vigente(self, agora):
+        if self.inicio and agora < self.inicio:
+            return False
+        if self.fim and agora > self.fim:
+            return False
+        if self.dias_semana and agora.weekday() not in self.dias_semana:
+            return False
+        if self.hora_inicio is not None or self.hora_fim is not None:
+            minuto = agora.hour * 60 + agora.minute
+            inicio = self.hora_inicio if self.hora_inicio is not None else 0
+            fim = self.hora_fim if self.hora_fim is not None else 24 * 60
+            # Janela que atravessa a meia-noite (ex: 22:00 às 02:00)
+            dentro = inicio <= minuto < fim if inicio <= fim else (minuto >= inicio or minuto < fim)
+            if not dentro:
+                return False
+        return True
+
+    def combina(self, produto_id, categoria, marca, tamanho):
+        return ((not self.produtos or produto_id in self.produtos)
+                and (not self.categorias or categoria in self.categorias)
+                and (not self.marcas or marca in self.marcas)
+                and (not self.tamanhos or tamanho in self.tamanhos))
+
+    def descontos(self, precos):
+        """
+        Desconto de cada unidade elegível (precos em ordem decrescente).
+
+        Só grupos completos de 'combo' unidades recebem desconto; o valor fixo é
+        por grupo, rateado entre as unidades proporcionalmente ao preço.
+        """
+        usadas = len(precos) - len(precos) % self.combo
+        descontos = []
+        for inicio in range(0, usadas, self.combo):
+            grupo = precos[inicio:inicio + self.combo]
+            total_grupo = sum(grupo)
+            if not total_grupo:
+                descontos.extend(0.0 for _ in grupo)
+                continue
+            desconto_grupo = (total_grupo * self.valor / 100) if self.percentual else min(self.valor, total_grupo)
+            descontos.extend(desconto_grupo * preco / total_grupo for preco in grupo)
+        return descontos
+
+
+class IndicePromocoes:
+    """Regras indexadas pelo filtro mais seletivo; regras sem filtro valem para todos os itens"""
+
+    def __init__(self, regras):
+        self.regras = regras
+        self.gerais = []
+        self.por_chave = {}
+        for regra in regras:
+            chave = regra.chave_indice()
+            if chave is None:
+                self.gerais.append(regra)
+                continue
+            dimensao, valores = chave
+            for valor in valores:
+                self.por_chave.setdefault((dimensao, valor), []).append(regra)
+
+    def candidatas(self, produto_id, categoria, marca, tamanho):
+        """Regras que combinam com o item (cada regra aparece no máximo uma vez)"""
+        regras = list(self.gerais)
+        for chave in (('produto', produto_id), ('marca', marca), ('categoria', categoria), ('tamanho', tamanho)):
+            regras.extend(self.por_chave.get(chave, ()))
+        return [regra for regra in regras if regra.combina(produto_id, categoria, marca, tamanho)]
+
+
+def invalidar():
+    """Força a verificação da versão das regras na próxima precificação"""
+    _estado['versao'] = None
+    _estado['verificado_em'] = 0.0
+
+
+def obter_indice():
+    """Índice compilado das promoções ativas, recompilado só quando a versão das regras muda"""
+    if _estado['indice'] is not None and time.monotonic() - _estado['verificado_em'] < INTERVALO_VERIFICACAO:
+        return _estado['indice']
+
+    with _trava:
+        if _estado['indice'] is not None and time.monotonic() - _estado['verificado_em'] < INTERVALO_VERIFICACAO:
+            return _estado['indice']
+
+        from .models import ContadorSequencia, Promocao
+
+        # Lê a versão antes das regras: uma alteração no meio do caminho gera nova recompilação
+        versao = ContadorSequencia.valor_atual(Promocao.CONTADOR_VERSAO)
+        if _estado['indice'] is None or versao != _estado['versao']:
+            _estado['indice'] = IndicePromocoes([RegraCompilada(p) for p in Promocao.objects(ativo=True)])
+            _estado['versao'] = versao
+        _estado['verificado_em'] = time.monotonic()
+
+    return _estado['indice']
+
+
+def precificar(itens, agora=None):
+    """
+    Aplica as promoções vigentes a um carrinho.
+
+    itens: [{'produto_id', 'categoria', 'marca', 'tamanho', 'quantidade', 'preco'}].
+    Cada unidade recebe no máximo uma promoção; as regras são escolhidas pela
+    que dá o maior desconto entre as unidades ainda livres. Retorna
+    {'itens': [{'subtotal', 'desconto', 'total', 'promocoes'}], 'subtotal',
+    'desconto', 'total', 'promocoes': [{'id', 'nome', 'desconto'}]}.
+    """
+    indice = obter_indice()
+    agora = agora or datetime.now()
+
+    unidades = []    # preço de cada unidade do carrinho
+    item_da_unidade = []
+    elegiveis = {}   # regra -> posições das unidades elegíveis
+    for posicao, item in enumerate(itens):
+        preco = float(item.get('preco') or 0)
+        quantidade = int(item.get('quantidade') or 0)
+        inicio = len(unidades)
+        unidades.extend([preco] * quantidade)
+        item_da_unidade.extend([posicao] * quantidade)
+
+        regras = indice.candidatas(
+            str(item.get('produto_id') or ''),
+            _normalizar(item.get('categoria')),
+            _normalizar(item.get('marca')),
+            _normalizar(item.get('tamanho')),
+        )
+        for regra in regras:
+            if regra.vigente(agora):
+                elegiveis.setdefault(regra, []).extend(range(inicio, inicio + quantidade))
+
+    desconto_unidade = [0.0] * len(unidades)
+    promocoes_item = [[] for _ in itens]
+    aplicadas = []
+    livres = set(range(len(unidades)))
+
+    while elegiveis:
+        melhor = None
+        for regra, posicoes in elegiveis.items():
+            disponiveis = sorted((p for p in posicoes if p in livres), key=lambda p: -unidades[p])
+            descontos = regra.descontos([unidades[p] for p in disponiveis])
+            total = sum(descontos)
+            if total > 0 and (melhor is None or total > melhor[0]):
+                melhor = (total, regra, list(zip(disponiveis, descontos)))
+        if melhor is None:
+            break
+
+        total, regra, por_unidade = melhor
+        for posicao, desconto in por_unidade:
+            livres.discard(posicao)
+            desconto_unidade[posicao] = desconto
+            if regra.nome not in promocoes_item[item_da_unidade[posicao]]:
+                promocoes_item[item_da_unidade[posicao]].append(regra.nome)
+        aplicadas.append({'id': regra.id, 'nome': regra.nome, 'desconto': round(total, 2)})
+        del elegiveis[regra]
+
+    resultado_itens = [{'subtotal': 0.0, 'desconto': 0.0} for _ in itens]
+    for posicao, preco in enumerate(unidades):
+        resultado = resultado_itens[item_da_unidade[posicao]]
+        resultado['subtotal'] += preco
+        resultado['desconto'] += desconto_unidade[posicao]
+    for resultado, nomes in zip(resultado_itens, promocoes_item):
+        resultado['subtotal'] = round(resultado['subtotal'], 2)
+        resultado['desconto'] = round(resultado['desconto'], 2)
+        resultado['total'] = round(resultado['subtotal'] - resultado['desconto'], 2)
+        resultado['promocoes'] = nomes
+
+    subtotal = round(sum(r['subtotal'] for r in resultado_itens), 2)
+    desconto = round(sum(r['desconto'] for r in resultado_itens), 2)
+    return {
+        'itens': resultado_itens,
+        'subtotal': subtotal,
+        'desconto': desconto,
+        'total': round(subtotal - desconto, 2),
+        'promocoes': aplicadas,
+    }
@@ -0,0 +1,37 @@
+"""
+Respostas JSON com validação condicional (ETag / If-None-Match)
+
+Usadas pelas APIs consultadas com frequência pelo agente do WhatsApp: quando o
+cliente já tem a versão atual, a resposta é um 304 sem corpo.
+"""
+import hashlib
+import json
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+
+def serializar(dados):
+    """JSON compacto em bytes, sem escapar acentos"""
+    return json.dumps(dados, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def etag(corpo):
+    """ETag forte a partir do conteúdo"""
+    return '"%s"' % hashlib.md5(corpo).hexdigest()
+
+
+def json_condicional(request, corpo, etag_corpo=None, max_age=0):
+    """
+    Resposta para um corpo JSON já serializado.
+
+    Responde 304 se o If-None-Match do cliente bate com a ETag; max_age=0 obriga
+    o cliente a revalidar a cada uso, o que custa só o 304 quando nada mudou.
+    """
+    etag_corpo = etag_corpo or etag(corpo)
+    resposta = get_conditional_response(request, etag=etag_corpo)
+    if resposta is None:
+        resposta = HttpResponse(corpo, content_type='application/json')
+    resposta['ETag'] = etag_corpo
+    patch_cache_control(resposta, max_age=max_age, must_revalidate=True)
+    return resposta
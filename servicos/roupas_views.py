@@ -5,58 +5,72 @@ from django.contrib.admin.views.decorators import staff_member_required as staff
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 from django.contrib.auth.decorators import login_required
-from django.http import Http404, JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.core.paginator import Paginator
+from mongoengine import NotUniqueError, ValidationError
 from datetime import datetime, timedelta
+import csv
 import json
 
-from .models import ProdutoRoupa, VendaRoupa
+from .models import (
+    ProdutoRoupa, VendaRoupa, CategoriaRoupa, MovimentacaoEstoque, SugestaoReposicao, ContagemEstoque,
+    Promocao, ResumoVendasDia,
+)
+from .models_mongo import ClienteMongo
+from .importacao import ler_csv, ler_linhas
+from .paginacao import pagina_pronta
 
 # ============================================
 # VIEWS PARA PRODUTOS DE ROUPA
 # ============================================
 
+def _filtros_busca_produtos(request):
+    """Filtros da busca facetada de produtos a partir da query string"""
+    return {
+        'termo': request.GET.get('busca', '').strip() or None,
+        'categoria': request.GET.get('categoria') or None,
+        'marca': request.GET.get('marca') or None,
+        'cor': request.GET.get('cor') or None,
+        'tamanho': request.GET.get('tamanho') or None,
+        'faixa_preco': request.GET.get('faixa_preco') or None,
+        'estoque_baixo': bool(request.GET.get('estoque_baixo')),
+    }
+
 @login_required
 @staff_required
 def produtos_lista(request):
     """Lista todos os produtos de roupa"""
     try:
-        # Parâmetros de filtro
-        categoria_id = request.GET.get('categoria')
-        busca = request.GET.get('busca', '').strip()
-        estoque_baixo = request.GET.get('estoque_baixo', False)
-        
-        # Buscar produtos
-        if categoria_id:
-            produtos = ProdutoRoupa.objects(categoria=categoria_id)
-        else:
-            produtos = ProdutoRoupa.objects.all()
-        
-        # Filtro de busca
-        if busca:
-            produtos = produtos.filter(nome__icontains=busca)
-        
-        # Filtro de estoque baixo
-        if estoque_baixo:
-            produtos = [p for p in produtos if p.estoque_baixo]
-        
-        # Ordenar
-        produtos = sorted(produtos, key=lambda x: (x.categoria.nome if x.categoria else '', x.nome))
-        
-        # Paginação
-        paginator = Paginator(produtos, 20)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
-        
-        # Buscar categorias
-        categorias = CategoriaRoupa.objects(ativo=True).order_by('nome')
+        filtros = _filtros_busca_produtos(request)
+        try:
+            pagina = max(1, int(request.GET.get('page') or 1))
+        except ValueError:
+            pagina = 1
+        
+        # Produtos da página e contagens das facetas numa única agregação; a lista
+        # administrativa inclui os inativos, para que possam ser editados e reativados
+        resultado = ProdutoRoupa.buscar_facetado(pagina=pagina, por_pagina=20, apenas_ativos=False, **filtros)
+        ultima = max(1, -(-resultado['total'] // 20))
+        if pagina > ultima:
+            resultado = ProdutoRoupa.buscar_facetado(pagina=ultima, por_pagina=20, apenas_ativos=False, **filtros)
+        
+        # Filtros atuais, para manter nos links de paginação e das facetas
+        parametros = request.GET.copy()
+        parametros.pop('page', None)
         
         context = {
-            'produtos': page_obj,
-            'categorias': categorias,
-            'categoria_selecionada': categoria_id,
-            'busca': busca,
-            'estoque_baixo': estoque_baixo,
+            'produtos': pagina_pronta(resultado['produtos'], resultado['total'], resultado['pagina'], 20),
+            'total': resultado['total'],
+            'facetas': resultado['facetas'],
+            'categorias': CategoriaRoupa.objects(ativo=True).order_by('nome'),
+            'categoria_selecionada': filtros['categoria'],
+            'filtros': filtros,
+            'refinamentos': {
+                campo: filtros[campo] for campo in ('marca', 'cor', 'tamanho', 'faixa_preco') if filtros[campo]
+            },
+            'busca': filtros['termo'] or '',
+            'estoque_baixo': filtros['estoque_baixo'],
+            'parametros': parametros.urlencode(),
             'page_title': 'Produtos de Roupa'
         }
         
@@ -70,19 +84,64 @@ def produtos_lista(request):
             'page_title': 'Produtos de Roupa'
         })
 
+
+@login_required
+@staff_required
+def produtos_busca_api(request):
+    """
+    Busca facetada de produtos (JSON) para o navegador da loja.
+
+    Mesmos filtros de produtos_lista (busca, categoria, marca, cor, tamanho,
+    faixa_preco, estoque_baixo, page); devolve a página de produtos e as
+    contagens de cada faceta calculadas na mesma agregação.
+    """
+    try:
+        try:
+            pagina = max(1, int(request.GET.get('page') or 1))
+            por_pagina = min(100, max(1, int(request.GET.get('por_pagina') or 20)))
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Paginação inválida'}, status=400)
+        
+        resultado = ProdutoRoupa.buscar_facetado(
+            pagina=pagina, por_pagina=por_pagina, **_filtros_busca_produtos(request)
+        )
+        produtos = []
+        for produto in resultado['produtos']:
+            dados = ProdutoRoupa.serializar_pdv(produto.to_mongo())
+            dados.update(
+                cor=produto.cor or '',
+                imagem=produto.imagem or '',
+                estoque_total=produto.estoque_total,
+                estoque_baixo=produto.estoque_baixo,
+            )
+            produtos.append(dados)
+        
+        return JsonResponse({
+            'success': True,
+            'produtos': produtos,
+            'total': resultado['total'],
+            'pagina': resultado['pagina'],
+            'facetas': resultado['facetas'],
+        })
+    except Exception as e:
+        print(f"❌ Erro na busca de produtos: {str(e)}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
 @login_required
 @staff_required
 def produto_form(request, pk=None):
     """Cria ou edita um produto de roupa"""
     try:
         produto = None
+        error = None
         if pk:
             produto = ProdutoRoupa.objects.get(id=pk)
         
         if request.method == 'POST':
             # Processar formulário
             nome = request.POST.get('nome')
-            categoria_id = request.POST.get('categoria')
+            # A categoria é gravada pelo nome (mesma chave usada no vestuário)
+            categoria_nome = request.POST.get('categoria', '')
             preco = float(request.POST.get('preco', 0))
             preco_custo = float(request.POST.get('preco_custo', 0))
             estoque_minimo = int(request.POST.get('estoque_minimo', 5))
@@ -100,12 +159,15 @@ def produto_form(request, pk=None):
             ativo = request.POST.get('ativo') == 'on'
             em_destaque = request.POST.get('em_destaque') == 'on'
             
+            # Estoque antes da alteração, para registrar as movimentações
+            estoque_anterior = produto.estoque_por_tamanho if produto else {}
+            tipo_movimento = 'ajuste' if produto else 'entrada'
+            
             # Criar ou atualizar produto
             if not produto:
-                categoria = CategoriaRoupa.objects.get(id=categoria_id)
                 produto = ProdutoRoupa(
                     nome=nome,
-                    categoria=categoria,
+                    categoria=categoria_nome,
                     preco=preco,
                     preco_custo=preco_custo,
                     estoque_minimo=estoque_minimo,
@@ -122,7 +184,7 @@ def produto_form(request, pk=None):
                 )
             else:
                 produto.nome = nome
-                produto.categoria = CategoriaRoupa.objects.get(id=categoria_id)
+                produto.categoria = categoria_nome
                 produto.preco = preco
                 produto.preco_custo = preco_custo
                 produto.estoque_minimo = estoque_minimo
@@ -137,6 +199,13 @@ def produto_form(request, pk=None):
                 produto.ativo = ativo
                 produto.em_destaque = em_destaque
             
+            # Códigos de barras (EAN) por tamanho; vazio remove o código
+            produto.completar_variantes()
+            for variante in produto.variantes:
+                ean = request.POST.get(f'ean_{variante.tamanho}')
+                if ean is not None:
+                    variante.ean = ean.strip() or None
+            
             # Processar imagem se houver
             if 'imagem' in request.FILES:
                 arquivo = request.FILES['imagem']
@@ -144,17 +213,33 @@ def produto_form(request, pk=None):
                 filename = default_storage.save(f'{pasta}/{arquivo.name}', arquivo)
                 produto.imagem = filename
             
-            produto.save()
-            
-            return redirect('servicos:produtos_lista')
+            try:
+                produto.save()
+            except NotUniqueError:
+                # Índices únicos de variantes.sku / variantes.ean: volta ao formulário com os dados digitados
+                em_uso = produto.codigos_em_uso()
+                if em_uso:
+                    error = 'Código já usado por outro produto: ' + ', '.join(
+                        f'{codigo} ({nome})' for codigo, nome in em_uso.items()
+                    )
+                else:
+                    error = 'Código (SKU/EAN) já usado por outro produto'
+            else:
+                MovimentacaoEstoque.registrar(MovimentacaoEstoque.por_diferenca(
+                    produto.id, estoque_anterior, produto.estoque_por_tamanho, tipo_movimento,
+                    usuario=request.user.username, observacao='Cadastro de produto'
+                ))
+                
+                return redirect('servicos:produtos_lista')
         
-        # GET - mostrar formulário
+        # GET (ou POST com erro) - mostrar formulário
         categorias = CategoriaRoupa.objects(ativo=True).order_by('nome')
         
         context = {
             'produto': produto,
             'categorias': categorias,
-            'page_title': f'{"Editar" if produto else "Novo"} Produto'
+            'error': error,
+            'page_title': f'{"Editar" if pk else "Novo"} Produto'
         }
         
         return render(request, 'servicos/roupas/produto_form.html', context)
@@ -210,10 +295,9 @@ def vendas_lista(request):
         page_number = request.GET.get('page')
         page_obj = paginator.get_page(page_number)
         
-        # Estatísticas
+        # Estatísticas (o total de hoje vem do resumo diário, uma leitura)
         total_vendas = len(vendas)
-        vendas_hoje = VendaRoupa.vendas_hoje()
-        total_hoje = sum(float(v.valor_total) for v in vendas_hoje)
+        total_hoje = ResumoVendasDia.fechamento()['valor_liquido']
         
         context = {
             'vendas': page_obj,
@@ -252,6 +336,10 @@ def venda_nova(request):
             itens_json = request.POST.get('itens', '[]')
             itens = json.loads(itens_json)
             
+            # Tamanhos gravados em minúsculas, como no vestuário (pp, p, m, g, gg)
+            for item in itens:
+                item['tamanho'] = (item.get('tamanho') or '').strip().lower()
+            
             # Calcular valores
             subtotal = sum(float(item['preco_total']) for item in itens)
             desconto = float(request.POST.get('desconto', 0))
@@ -273,26 +361,48 @@ def venda_nova(request):
             )
             
             # Atualizar estoque
+            movimentos = []
             for item in itens:
                 produto = ProdutoRoupa.objects.get(id=item['produto_id'])
+                estoque_anterior = produto.estoque_por_tamanho
                 tamanho = item['tamanho']
                 quantidade = int(item['quantidade'])
                 
+                # Congelar o custo no item para o cálculo de margem
+                item['preco_custo'] = float(produto.preco_custo) if produto.preco_custo else None
+                
                 # Atualizar estoque por tamanho
-                if tamanho == 'PP':
+                if tamanho == 'pp':
                     produto.estoque_pp = max(0, produto.estoque_pp - quantidade)
-                elif tamanho == 'P':
+                elif tamanho == 'p':
                     produto.estoque_p = max(0, produto.estoque_p - quantidade)
-                elif tamanho == 'M':
+                elif tamanho == 'm':
                     produto.estoque_m = max(0, produto.estoque_m - quantidade)
-                elif tamanho == 'G':
+                elif tamanho == 'g':
                     produto.estoque_g = max(0, produto.estoque_g - quantidade)
-                elif tamanho == 'GG':
+                elif tamanho == 'gg':
                     produto.estoque_gg = max(0, produto.estoque_gg - quantidade)
                 
                 produto.save()
+                movimentos.extend(MovimentacaoEstoque.por_diferenca(
+                    produto.id, estoque_anterior, produto.estoque_por_tamanho, 'venda',
+                    referencia=numero_venda, usuario=venda.vendedor
+                ))
             
             venda.save()
+            MovimentacaoEstoque.registrar(movimentos)
+            
+            try:
+                ResumoVendasDia.registrar_vendas([venda])
+            except Exception as e:
+                print(f"⚠️ Erro ao atualizar resumo do dia: {str(e)}")
+                # O fechamento recalcula o dia a partir das vendas
+                ResumoVendasDia.marcar_desatualizado(venda.data_venda)
+            
+            try:
+                ClienteMongo.registrar_compra(cliente_telefone, cliente_nome, venda.valor_total, venda.data_venda)
+            except Exception as e:
+                print(f"⚠️ Erro ao atualizar cliente: {str(e)}")
             
             return JsonResponse({
                 'success': True,
@@ -326,21 +436,8 @@ def venda_detalhe(request, pk):
     try:
         venda = VendaRoupa.objects.get(id=pk)
         
-        # Buscar informações dos produtos
-        produtos_detalhe = []
-        for item in venda.itens:
-            produto_id = item.get('produto_id')
-            try:
-                produto = ProdutoRoupa.objects.get(id=produto_id)
-                produtos_detalhe.append({
-                    'produto': produto,
-                    'tamanho': item.get('tamanho'),
-                    'quantidade': item.get('quantidade'),
-                    'preco_unitario': item.get('preco_unitario'),
-                    'preco_total': item.get('preco_total'),
-                })
-            except:
-                pass
+        # Buscar informações dos produtos (uma única consulta para todos os itens)
+        produtos_detalhe = VendaRoupa.expandir_itens(venda)[str(venda.id)]
         
         context = {
             'venda': venda,
@@ -354,6 +451,113 @@ def venda_detalhe(request, pk):
         print(f"❌ Erro ao visualizar venda: {str(e)}")
         return redirect('servicos:vendas_lista')
 
+@login_required
+@staff_required
+def venda_cancelar(request, pk):
+    """Cancela uma venda e devolve os itens ao estoque"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método não permitido'}, status=405)
+    
+    try:
+        venda = VendaRoupa.objects.get(id=pk)
+        venda.cancelar(usuario=request.user.username, motivo=request.POST.get('motivo', ''))
+        return JsonResponse({
+            'success': True,
+            'message': f'Venda #{venda.numero_venda} cancelada e estoque reposto!'
+        })
+    except VendaRoupa.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Venda não encontrada'}, status=404)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        print(f"❌ Erro ao cancelar venda: {str(e)}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+@login_required
+@staff_required
+def venda_devolver(request, pk):
+    """
+    Devolve parte dos itens de uma venda.
+
+    Espera campos 'devolver_<índice do item>' com a quantidade devolvida de cada item.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método não permitido'}, status=405)
+    
+    try:
+        venda = VendaRoupa.objects.get(id=pk)
+        quantidades = {
+            chave[len('devolver_'):]: int(valor or 0)
+            for chave, valor in request.POST.items()
+            if chave.startswith('devolver_')
+        }
+        valor = venda.devolver(quantidades, usuario=request.user.username, motivo=request.POST.get('motivo', ''))
+        return JsonResponse({
+            'success': True,
+            'message': f'Devolução registrada: R$ {valor:.2f}',
+            'status': venda.status
+        })
+    except VendaRoupa.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Venda não encontrada'}, status=404)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        print(f"❌ Erro ao registrar devolução: {str(e)}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+@login_required
+@staff_required
+def vendas_exportar_csv(request):
+    """Exporta os itens das vendas em CSV (uma linha por item)"""
+    # Filtros (mesmos da lista de vendas)
+    status = request.GET.get('status', '')
+    data_inicio = request.GET.get('data_inicio', '')
+    data_fim = request.GET.get('data_fim', '')
+    
+    vendas = VendaRoupa.objects.all()
+    
+    if status:
+        vendas = vendas.filter(status=status)
+    
+    if data_inicio and data_fim:
+        inicio = datetime.strptime(data_inicio, '%Y-%m-%d')
+        fim = datetime.strptime(data_fim, '%Y-%m-%d') + timedelta(days=1)
+        vendas = vendas.filter(data_venda__gte=inicio, data_venda__lt=fim)
+    
+    vendas = list(vendas.order_by('-data_venda'))
+    itens_por_venda = VendaRoupa.expandir_itens(vendas)
+    
+    response = HttpResponse(content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="vendas_roupa.csv"'
+    
+    writer = csv.writer(response, delimiter=';')
+    writer.writerow([
+        'Número', 'Data', 'Cliente', 'Telefone', 'Produto', 'Categoria', 'Marca',
+        'Tamanho', 'Quantidade', 'Preço Unitário', 'Total Item', 'Pagamento', 'Status', 'Vendedor'
+    ])
+    
+    for venda in vendas:
+        for item in itens_por_venda[str(venda.id)]:
+            produto = item['produto']
+            writer.writerow([
+                venda.numero_venda,
+                venda.data_venda.strftime('%d/%m/%Y %H:%M') if venda.data_venda else '',
+                venda.cliente_nome,
+                venda.cliente_telefone or '',
+                item['produto_nome'] + (' (removido)' if item['produto_removido'] else ''),
+                item['categoria'] or '',
+                (produto.marca if produto else '') or '',
+                item['tamanho'] or '',
+                item['quantidade'],
+                item['preco_unitario'],
+                item['preco_total'],
+                venda.get_forma_pagamento_display(),
+                venda.get_status_display(),
+                venda.vendedor or '',
+            ])
+    
+    return response
+
 @login_required
 @staff_required
 def categorias_lista(request):
@@ -361,19 +565,22 @@ def categorias_lista(request):
     try:
         categorias = CategoriaRoupa.objects.all().order_by('nome')
         
-        # Estatísticas por categoria
-        stats = {}
-        for cat in categorias:
-            total_produtos = ProdutoRoupa.objects(categoria=cat).count()
-            produtos_ativos = ProdutoRoupa.objects(categoria=cat, ativo=True).count()
-            stats[str(cat.id)] = {
-                'total': total_produtos,
-                'ativos': produtos_ativos
-            }
+        # Estatísticas de todas as categorias em uma única agregação
+        stats = ProdutoRoupa.estatisticas_por_categoria()
+        vazio = {'total': 0, 'ativos': 0, 'estoque': 0, 'valor_estoque': 0.0}
+        
+        categorias_stats = [
+            {'categoria': cat, 'nome': cat.nome, 'stats': stats.pop(cat.nome, vazio)}
+            for cat in categorias
+        ]
+        
+        # Categorias usadas nos produtos mas não cadastradas (ex: digitadas no vestuário)
+        for nome in sorted(stats):
+            categorias_stats.append({'categoria': None, 'nome': nome or 'Sem categoria', 'stats': stats[nome]})
         
         context = {
             'categorias': categorias,
-            'stats': stats,
+            'categorias_stats': categorias_stats,
             'page_title': 'Categorias de Roupa'
         }
         
@@ -407,9 +614,18 @@ def categoria_form(request, pk=None):
                     ativo=ativo
                 )
             else:
+                nome_anterior = categoria.nome
                 categoria.nome = nome
                 categoria.descricao = descricao
                 categoria.ativo = ativo
+                
+                # Produtos guardam o nome da categoria; manter a chave consistente
+                if nome_anterior != nome:
+                    with ProdutoRoupa.reservar_versao() as versao:
+                        ProdutoRoupa.objects(categoria=nome_anterior).update(
+                            set__categoria=nome,
+                            set__versao=versao
+                        )
             
             categoria.save()
             
@@ -441,9 +657,13 @@ def estoque_controle(request):
         total_estoque = sum(p.estoque_total for p in produtos)
         valor_total_estoque = sum(p.estoque_total * float(p.preco) for p in produtos)
         
+        # Calculadas pelo comando gerar_sugestoes_reposicao
+        sugestoes_reposicao = SugestaoReposicao.para_repor()
+        
         context = {
             'produtos': produtos,
             'estoque_baixo': estoque_baixo,
+            'sugestoes_reposicao': sugestoes_reposicao,
             'total_produtos': total_produtos,
             'total_estoque': total_estoque,
             'valor_total_estoque': valor_total_estoque,
@@ -459,3 +679,205 @@ def estoque_controle(request):
             'page_title': 'Controle de Estoque'
         })
 
+@login_required
+@staff_required
+def estoque_contagem(request):
+    """Envio do CSV de contagem de estoque (colunas: sku, tamanho, contagem)"""
+    if request.method == 'POST':
+        arquivo = request.FILES.get('arquivo')
+        if not arquivo:
+            return render(request, 'servicos/roupas/estoque_contagem.html', {
+                'error': 'Selecione o arquivo da contagem',
+                'page_title': 'Contagem de Estoque'
+            })
+        
+        try:
+            contagem = ContagemEstoque.analisar(
+                ler_csv(arquivo.file), usuario=request.user.username, arquivo=arquivo.name
+            )
+            return redirect('servicos:estoque_contagem_detalhe', pk=str(contagem.id))
+        except Exception as e:
+            print(f"❌ Erro ao ler contagem de estoque: {str(e)}")
+            return render(request, 'servicos/roupas/estoque_contagem.html', {
+                'error': f'Erro ao ler o arquivo: {str(e)}',
+                'page_title': 'Contagem de Estoque'
+            })
+    
+    context = {
+        'contagens': ContagemEstoque.objects.exclude('itens', 'erros')[:10],
+        'page_title': 'Contagem de Estoque'
+    }
+    return render(request, 'servicos/roupas/estoque_contagem.html', context)
+
+@login_required
+@staff_required
+def estoque_contagem_detalhe(request, pk):
+    """Conferência das divergências de uma contagem; POST aplica ou descarta"""
+    try:
+        contagem = ContagemEstoque.objects.get(id=pk)
+    except ContagemEstoque.DoesNotExist:
+        raise Http404("Contagem não encontrada")
+    
+    context = {
+        'contagem': contagem,
+        'divergencias': contagem.divergencias,
+        'page_title': 'Conferência da Contagem'
+    }
+    
+    if request.method == 'POST':
+        try:
+            if request.POST.get('acao') == 'descartar':
+                ContagemEstoque.objects(id=contagem.id, status='pendente').update(set__status='descartada')
+                contagem.reload()
+                context['message'] = 'Contagem descartada.'
+            else:
+                ajustes = contagem.aplicar(usuario=request.user.username)
+                context['message'] = f'{ajustes} ajustes de estoque aplicados!'
+        except ValueError as e:
+            context['error'] = str(e)
+        except Exception as e:
+            print(f"❌ Erro ao aplicar contagem: {str(e)}")
+            context['error'] = str(e)
+    
+    return render(request, 'servicos/roupas/estoque_contagem.html', context)
+
+@login_required
+@staff_required
+def produtos_importar(request):
+    """Importação de produtos em massa a partir de um arquivo CSV ou JSON"""
+    context = {'page_title': 'Importar Produtos'}
+    
+    if request.method == 'POST':
+        arquivo = request.FILES.get('arquivo')
+        if not arquivo:
+            context['error'] = 'Selecione o arquivo de produtos'
+            return render(request, 'servicos/roupas/produtos_importar.html', context)
+        
+        try:
+            tamanho_lote = max(1, int(request.POST.get('lote') or 500))
+            context['relatorio'] = ProdutoRoupa.importar(
+                ler_linhas(arquivo.file, arquivo.name),
+                tamanho_lote=tamanho_lote,
+                usuario=request.user.username
+            )
+            context['arquivo'] = arquivo.name
+        except Exception as e:
+            print(f"❌ Erro ao importar produtos: {str(e)}")
+            context['error'] = f'Erro ao importar: {str(e)}'
+    
+    return render(request, 'servicos/roupas/produtos_importar.html', context)
+
+@login_required
+@staff_required
+def promocoes_lista(request):
+    """Lista as promoções do vestuário"""
+    context = {
+        'promocoes': Promocao.objects.all(),
+        'page_title': 'Promoções'
+    }
+    return render(request, 'servicos/roupas/promocoes_lista.html', context)
+
+@login_required
+@staff_required
+def promocao_form(request, pk=None):
+    """Cria, edita ou exclui uma promoção"""
+    promocao = None
+    if pk:
+        try:
+            promocao = Promocao.objects.get(id=pk)
+        except Promocao.DoesNotExist:
+            raise Http404("Promoção não encontrada")
+    
+    context = {
+        'promocao': promocao,
+        'categorias': CategoriaRoupa.objects(ativo=True),
+        'tamanhos': ProdutoRoupa.TAMANHOS_VARIANTE,
+        'dias_semana': ['Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom'],
+        'page_title': f'{"Editar" if promocao else "Nova"} Promoção'
+    }
+    
+    if request.method == 'POST':
+        if promocao and request.POST.get('acao') == 'excluir':
+            promocao.delete()
+            return redirect('servicos:promocoes_lista')
+        
+        def lista(campo):
+            return [valor.strip() for valor in request.POST.get(campo, '').split(',') if valor.strip()]
+        
+        def data(campo):
+            valor = request.POST.get(campo)
+            return datetime.strptime(valor, '%Y-%m-%dT%H:%M') if valor else None
+        
+        try:
+            promocao = promocao or Promocao()
+            promocao.nome = request.POST.get('nome')
+            promocao.tipo = request.POST.get('tipo', 'percentual')
+            promocao.valor = float((request.POST.get('valor') or '0').replace(',', '.'))
+            promocao.categorias = request.POST.getlist('categorias')
+            promocao.marcas = lista('marcas')
+            promocao.tamanhos = request.POST.getlist('tamanhos')
+            promocao.produto_ids = lista('produto_ids')
+            promocao.quantidade_minima = int(request.POST.get('quantidade_minima') or 1)
+            promocao.data_inicio = data('data_inicio')
+            promocao.data_fim = data('data_fim')
+            promocao.dias_semana = [int(dia) for dia in request.POST.getlist('dias_semana')]
+            promocao.hora_inicio = request.POST.get('hora_inicio') or None
+            promocao.hora_fim = request.POST.get('hora_fim') or None
+            promocao.ativo = request.POST.get('ativo') == 'on'
+            promocao.save()
+            return redirect('servicos:promocoes_lista')
+        except (ValueError, ValidationError) as e:
+            context.update(promocao=promocao, error=str(e))
+        except Exception as e:
+            print(f"❌ Erro ao salvar promoção: {str(e)}")
+            context.update(promocao=promocao, error=str(e))
+    
+    return render(request, 'servicos/roupas/promocao_form.html', context)
+
+@login_required
+@staff_required
+def fechamento_caixa(request):
+    """Fechamento de caixa do dia (?data=AAAA-MM-DD, ?troco_inicial=, ?formato=csv)"""
+    try:
+        data = datetime.strptime(request.GET['data'], '%Y-%m-%d') if request.GET.get('data') else datetime.now()
+        troco_inicial = float((request.GET.get('troco_inicial') or '0').replace(',', '.'))
+    except ValueError:
+        data, troco_inicial = datetime.now(), 0.0
+    
+    fechamento = ResumoVendasDia.fechamento(data, troco_inicial)
+    
+    if request.GET.get('formato') == 'csv':
+        response = HttpResponse(content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="fechamento_caixa_{fechamento["dia"]}.csv"'
+        
+        writer = csv.writer(response, delimiter=';')
+        writer.writerow(['Fechamento de Caixa', data.strftime('%d/%m/%Y')])
+        writer.writerow([])
+        writer.writerow(['Vendas', fechamento['quantidade_vendas']])
+        writer.writerow(['Itens Vendidos', fechamento['quantidade_itens']])
+        writer.writerow(['Valor Bruto', f"{fechamento['valor_bruto']:.2f}"])
+        writer.writerow(['Descontos', f"{fechamento['descontos']:.2f}"])
+        writer.writerow(['Valor Vendido', f"{fechamento['valor_vendido']:.2f}"])
+        writer.writerow(['Cancelamentos', fechamento['cancelamentos']['quantidade'], f"{fechamento['cancelamentos']['valor']:.2f}"])
+        writer.writerow(['Devoluções', fechamento['devolucoes']['quantidade'], f"{fechamento['devolucoes']['valor']:.2f}"])
+        writer.writerow(['Valor Líquido', f"{fechamento['valor_liquido']:.2f}"])
+        writer.writerow([])
+        writer.writerow(['Forma de Pagamento', 'Vendas', 'Valor', 'Estornos', 'Líquido'])
+        for forma in fechamento['por_forma_pagamento']:
+            writer.writerow([forma['rotulo'], forma['quantidade'], f"{forma['valor']:.2f}",
+                             f"{forma['estornos']:.2f}", f"{forma['liquido']:.2f}"])
+        writer.writerow([])
+        writer.writerow(['Vendedor', 'Vendas', 'Valor'])
+        for vendedor in fechamento['por_vendedor']:
+            writer.writerow([vendedor['nome'], vendedor['quantidade'], f"{vendedor['valor']:.2f}"])
+        writer.writerow([])
+        writer.writerow(['Troco Inicial', f"{fechamento['troco_inicial']:.2f}"])
+        writer.writerow(['Dinheiro Esperado no Caixa', f"{fechamento['dinheiro_esperado']:.2f}"])
+        return response
+    
+    context = {
+        'fechamento': fechamento,
+        'data': data,
+        'page_title': 'Fechamento de Caixa'
+    }
+    return render(request, 'servicos/roupas/fechamento_caixa.html', context)
@@ -38,6 +38,7 @@ urlpatterns = [
     # Dashboard administrativo
     path('dashboard/', admin_views.estatisticas_dashboard, name='dashboard'),
     path('dashboard/estatisticas-vendas/', admin_views.estatisticas_vendas_json, name='estatisticas_vendas_json'),
+    path('dashboard/relatorio-margem/', admin_views.relatorio_margem_json, name='relatorio_margem_json'),
     
     # Gestão de Profissionais
     path('profissionais/', admin_views.profissionais_admin_list, name='profissionais_admin_list'),
@@ -67,4 +68,20 @@ urlpatterns = [
     path('vestuario/', vestuario_views.vestuario_view, name='vestuario_view'),
     path('vestuario/produto/adicionar/', vestuario_views.produto_vestuario_adicionar, name='produto_vestuario_adicionar'),
     path('vestuario/venda/registrar/', vestuario_views.venda_vestuario, name='venda_vestuario'),
+    path('vestuario/api/catalogo/', vestuario_views.catalogo_vestuario_api, name='catalogo_vestuario_api'),
+    path('vestuario/api/estoque-em/', vestuario_views.estoque_em_data_api, name='estoque_em_data_api'),
+    path('vestuario/api/codigo/<str:codigo>/', vestuario_views.produto_por_codigo_api, name='produto_por_codigo_api'),
+    path('vestuario/api/produtos/busca/', roupas_views.produtos_busca_api, name='produtos_busca_api'),
+    path('vestuario/api/precificar/', vestuario_views.precificar_carrinho_api, name='precificar_carrinho_api'),
+    path('vestuario/api/vendas/sincronizar/', vestuario_views.sincronizar_vendas_api, name='sincronizar_vendas_api'),
+    path('vestuario/caixa/fechamento/', roupas_views.fechamento_caixa, name='fechamento_caixa'),
+    path('vestuario/vendas/exportar/', roupas_views.vendas_exportar_csv, name='vendas_exportar_csv'),
+    path('vestuario/vendas/<str:pk>/cancelar/', roupas_views.venda_cancelar, name='venda_cancelar'),
+    path('vestuario/vendas/<str:pk>/devolver/', roupas_views.venda_devolver, name='venda_devolver'),
+    path('vestuario/promocoes/', roupas_views.promocoes_lista, name='promocoes_lista'),
+    path('vestuario/promocoes/nova/', roupas_views.promocao_form, name='promocao_nova'),
+    path('vestuario/promocoes/<str:pk>/editar/', roupas_views.promocao_form, name='promocao_editar'),
+    path('vestuario/produtos/importar/', roupas_views.produtos_importar, name='produtos_importar'),
+    path('vestuario/estoque/contagem/', roupas_views.estoque_contagem, name='estoque_contagem'),
+    path('vestuario/estoque/contagem/<str:pk>/', roupas_views.estoque_contagem_detalhe, name='estoque_contagem_detalhe'),
 ]
\ No newline at end of file
@@ -3,13 +3,13 @@
 from django.shortcuts import render, redirect
 from django.contrib.admin.views.decorators import staff_member_required as staff_required
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import HttpResponseNotModified, JsonResponse
 from datetime import datetime
 import json
 
-from .models import ProdutoRoupa, VendaRoupa
+from .models import ProdutoRoupa, VendaRoupa, MovimentacaoEstoque, ResumoVendasDia
 from .models_mongo import ClienteMongo
-from django.utils import timezone
+from . import promocoes
 
 @login_required
 @staff_required
@@ -19,25 +19,16 @@ def vestuario_view(request):
         # Buscar todos os produtos ativos
         produtos = ProdutoRoupa.objects(ativo=True).order_by('categoria', 'nome')
         
+        # Versão lida antes dos produtos: mudanças feitas durante a leitura voltam na próxima sincronização
+        versao_catalogo = ProdutoRoupa.versao_catalogo()
+        
         # Preparar dados dos produtos para JavaScript de forma segura
-        produtos_json = []
-        for produto in produtos:
-            produtos_json.append({
-                'id': str(produto.id),
-                'nome': produto.nome,
-                'categoria': produto.categoria or '',
-                'preco': float(produto.preco) if produto.preco else 0.0,
-                'estoque_pp': int(produto.estoque_pp) if produto.estoque_pp else 0,
-                'estoque_p': int(produto.estoque_p) if produto.estoque_p else 0,
-                'estoque_m': int(produto.estoque_m) if produto.estoque_m else 0,
-                'estoque_g': int(produto.estoque_g) if produto.estoque_g else 0,
-                'estoque_gg': int(produto.estoque_gg) if produto.estoque_gg else 0,
-            })
+        produtos_json = [ProdutoRoupa.serializar_pdv(produto.to_mongo()) for produto in produtos]
         
-        import json
         context = {
             'produtos': produtos,
             'produtos_json': json.dumps(produtos_json),
+            'versao_catalogo': versao_catalogo,
             'page_title': 'Vestuário'
         }
         
@@ -46,14 +37,103 @@ def vestuario_view(request):
     except Exception as e:
         print(f"❌ Erro ao carregar vestuário: {str(e)}")
         import traceback
-        import json
         traceback.print_exc()
         return render(request, 'servicos/roupas/vestuario.html', {
             'produtos': [],
             'produtos_json': json.dumps([]),
+            'versao_catalogo': 0,
             'page_title': 'Vestuário'
         })
 
+@login_required
+@staff_required
+def catalogo_vestuario_api(request):
+    """
+    Catálogo de produtos para o PDV do vestuário.
+
+    Sem parâmetros retorna o catálogo completo; com ?since=<versão> retorna apenas
+    os produtos alterados e removidos depois daquela versão. Responde 304 quando
+    o ETag enviado em If-None-Match ainda corresponde à versão atual.
+    """
+    try:
+        versao_atual = ProdutoRoupa.versao_catalogo()
+        etag = f'"catalogo-{versao_atual}"'
+        
+        if request.headers.get('If-None-Match') == etag:
+            resposta = HttpResponseNotModified()
+            resposta['ETag'] = etag
+            return resposta
+        
+        desde = request.GET.get('since')
+        try:
+            desde = int(desde) if desde not in (None, '') else None
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Parâmetro since inválido'}, status=400)
+        
+        # Versão do cliente à frente do servidor (contador reiniciado): manda tudo
+        if desde is not None and desde > versao_atual:
+            desde = None
+        
+        catalogo = ProdutoRoupa.catalogo_pdv(desde=desde)
+        
+        resposta = JsonResponse({
+            'success': True,
+            'versao': versao_atual,
+            **catalogo
+        })
+        resposta['ETag'] = etag
+        resposta['Cache-Control'] = 'private, no-cache'
+        return resposta
+        
+    except Exception as e:
+        print(f"❌ Erro ao carregar catálogo do vestuário: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+@login_required
+@staff_required
+def produto_por_codigo_api(request, codigo):
+    """Busca produto, variante e estoque atual pelo SKU ou código de barras (leitor do PDV)"""
+    try:
+        resultado = ProdutoRoupa.buscar_por_codigo(codigo)
+        if not resultado:
+            return JsonResponse({'success': False, 'error': f'Código {codigo} não encontrado'}, status=404)
+        
+        return JsonResponse({'success': True, **resultado})
+        
+    except Exception as e:
+        print(f"❌ Erro ao buscar código {codigo}: {str(e)}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+@login_required
+@staff_required
+def estoque_em_data_api(request):
+    """Estoque por produto/tamanho em uma data (?data=AAAA-MM-DD[&produto=<id>])"""
+    try:
+        data_str = request.GET.get('data', '')
+        try:
+            # Estoque ao final do dia informado
+            data = datetime.strptime(data_str, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Informe a data no formato AAAA-MM-DD'}, status=400)
+        
+        produto_id = request.GET.get('produto')
+        estoque = MovimentacaoEstoque.estoque_em(data, produto_ids=[produto_id] if produto_id else None)
+        
+        return JsonResponse({
+            'success': True,
+            'data': data.isoformat(),
+            'estoque': {
+                pid: {**tamanhos, 'total': sum(tamanhos.values())}
+                for pid, tamanhos in estoque.items()
+            }
+        })
+        
+    except Exception as e:
+        print(f"❌ Erro ao calcular estoque por data: {str(e)}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
 @login_required
 @staff_required
 def produto_vestuario_adicionar(request):
@@ -92,6 +172,11 @@ def produto_vestuario_adicionar(request):
             )
             produto.save()
             
+            MovimentacaoEstoque.registrar(MovimentacaoEstoque.por_diferenca(
+                produto.id, {}, produto.estoque_por_tamanho, 'entrada',
+                usuario=request.user.username, observacao='Cadastro pelo vestuário'
+            ))
+            
             return JsonResponse({'success': True, 'message': 'Produto adicionado com sucesso!'})
             
         except Exception as e:
@@ -120,7 +205,6 @@ def venda_vestuario(request):
             cliente_telefone = request.POST.get('cliente_telefone', '')
             forma_pagamento = request.POST.get('forma_pagamento')
             valor_desconto = get_float(request.POST.get('valor_desconto', 0))
-            valor_total = get_float(request.POST.get('valor_total'))
             valor_pago = get_float(request.POST.get('valor_pago'))
             
             # Parse dos itens
@@ -138,6 +222,8 @@ def venda_vestuario(request):
             
             # Preparar itens para salvar e atualizar estoque
             itens_venda = []
+            itens_precificacao = []
+            movimentos = []
             for item in itens:
                 produto_id = item['produto_id']
                 tamanho = item.get('tamanho', 'unico')
@@ -148,6 +234,8 @@ def venda_vestuario(request):
                 except ProdutoRoupa.DoesNotExist:
                     return JsonResponse({'success': False, 'error': f'Produto {produto_id} não encontrado'})
                 
+                estoque_anterior = produto.estoque_por_tamanho
+                
                 itens_venda.append({
                     'produto_id': str(produto_id),
                     'produto_nome': item['produto_nome'],
@@ -155,7 +243,18 @@ def venda_vestuario(request):
                     'tamanho': tamanho,
                     'quantidade': quantidade,
                     'preco_unitario': item['preco'],
-                    'preco_total': item['preco'] * quantidade
+                    'preco_total': item['preco'] * quantidade,
+                    # Custo congelado no momento da venda (usado no cálculo de margem)
+                    'preco_custo': float(produto.preco_custo) if produto.preco_custo else None
+                })
+                # Promoções avaliadas com os dados do cadastro, não os enviados pelo PDV
+                itens_precificacao.append({
+                    'produto_id': str(produto.id),
+                    'categoria': produto.categoria,
+                    'marca': produto.marca,
+                    'tamanho': tamanho,
+                    'quantidade': quantidade,
+                    'preco': item['preco'],
                 })
                 
                 # Atualizar estoque por tamanho
@@ -173,6 +272,19 @@ def venda_vestuario(request):
                 
                 # Salvar produto com estoque atualizado
                 produto.save()
+                movimentos.extend(MovimentacaoEstoque.por_diferenca(
+                    produto.id, estoque_anterior, produto.estoque_por_tamanho, 'venda',
+                    referencia=numero_venda, usuario=request.user.username
+                ))
+            
+            # Promoções vigentes + desconto manual do vendedor
+            precos = promocoes.precificar(itens_precificacao)
+            for item_venda, preco_item in zip(itens_venda, precos['itens']):
+                if preco_item['desconto']:
+                    item_venda['desconto_promocao'] = preco_item['desconto']
+                    item_venda['promocoes'] = preco_item['promocoes']
+            valor_desconto = round(precos['desconto'] + valor_desconto, 2)
+            valor_total = max(0, round(subtotal - valor_desconto, 2))
             
             # Criar venda
             venda = VendaRoupa(
@@ -188,35 +300,22 @@ def venda_vestuario(request):
             )
             venda.save()
             
-            # Criar ou atualizar cliente (só se tiver telefone)
-            if cliente_telefone:
-                try:
-                    # No MongoEngine, get_or_create funciona diretamente no manager
-                    cliente_existente = ClienteMongo.objects(telefone=cliente_telefone).first()
-                    
-                    if cliente_existente:
-                        # Atualizar cliente existente
-                        cliente_existente.nome = cliente_nome
-                        cliente_existente.ultima_compra = timezone.now()
-                        cliente_existente.save()
-                        try:
-                            cliente_existente.atualizar_estatisticas()
-                        except:
-                            pass  # Se der erro, continua mesmo assim
-                    else:
-                        # Criar novo cliente
-                        novo_cliente = ClienteMongo(
-                            nome=cliente_nome,
-                            telefone=cliente_telefone,
-                            ultima_compra=timezone.now()
-                        )
-                        novo_cliente.save()
-                        
-                except Exception as e:
-                    print(f"⚠️ Erro ao criar/atualizar cliente: {str(e)}")
-                    import traceback
-                    traceback.print_exc()
-                    # Não bloqueia a venda se der erro no cliente
+            # Uma única inserção com todas as saídas de estoque da venda
+            MovimentacaoEstoque.registrar(movimentos)
+            
+            try:
+                ResumoVendasDia.registrar_vendas([venda])
+            except Exception as e:
+                print(f"⚠️ Erro ao atualizar resumo do dia: {str(e)}")
+                # O fechamento recalcula o dia a partir das vendas
+                ResumoVendasDia.marcar_desatualizado(venda.data_venda)
+            
+            # Somar a compra às estatísticas do cliente (só se tiver telefone)
+            try:
+                ClienteMongo.registrar_compra(cliente_telefone, cliente_nome, valor_total, venda.data_venda)
+            except Exception as e:
+                print(f"⚠️ Erro ao atualizar cliente: {str(e)}")
+                # Não bloqueia a venda se der erro no cliente
             
             # Redirecionar para a mesma página
             return JsonResponse({
@@ -232,3 +331,66 @@ def venda_vestuario(request):
     
     return JsonResponse({'success': False, 'error': 'Método não permitido'})
 
+# Limite de vendas por requisição de sincronização
+MAX_VENDAS_POR_LOTE = 500
+
+@login_required
+@staff_required
+def sincronizar_vendas_api(request):
+    """
+    Recebe um lote de vendas feitas offline no PDV.
+
+    Corpo JSON: {"vendas": [{"chave_idempotencia": "...", "itens": [...], ...}]}.
+    Reenviar o mesmo lote é seguro: vendas já registradas voltam como 'duplicada'.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método não permitido'}, status=405)
+    
+    try:
+        dados = json.loads(request.body)
+        vendas = dados.get('vendas') if isinstance(dados, dict) else None
+        
+        if not isinstance(vendas, list) or not vendas:
+            return JsonResponse({'success': False, 'error': 'Envie uma lista de vendas'}, status=400)
+        
+        if len(vendas) > MAX_VENDAS_POR_LOTE:
+            return JsonResponse({
+                'success': False,
+                'error': f'Máximo de {MAX_VENDAS_POR_LOTE} vendas por lote'
+            }, status=400)
+        
+        resultados = VendaRoupa.registrar_lote(vendas, vendedor=request.user.username)
+        
+        return JsonResponse({
+            'success': True,
+            'criadas': sum(1 for r in resultados if r['status'] == 'criada'),
+            'duplicadas': sum(1 for r in resultados if r['status'] == 'duplicada'),
+            'erros': sum(1 for r in resultados if r['status'] == 'erro'),
+            'resultados': resultados
+        })
+        
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'JSON inválido'}, status=400)
+    except Exception as e:
+        print(f"❌ Erro ao sincronizar vendas: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+@login_required
+@staff_required
+def precificar_carrinho_api(request):
+    """
+    Aplica as promoções vigentes a um carrinho do PDV (POST JSON {"itens": [...]}).
+
+    Usa as regras compiladas em memória, sem consultar o banco; o PDV chama a
+    cada item adicionado ou alterado.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método não permitido'}, status=405)
+    
+    try:
+        itens = json.loads(request.body or b'{}').get('itens') or []
+        return JsonResponse({'success': True, **promocoes.precificar(itens)})
+    except (ValueError, TypeError, AttributeError) as e:
+        return JsonResponse({'success': False, 'error': f'Carrinho inválido: {str(e)}'}, status=400)
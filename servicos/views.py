@@ -4,6 +4,11 @@ from django.core.paginator import Paginator
 from django.views.decorators.http import require_http_methods
 from mongoengine import DoesNotExist
 from .models import Servico, Agendamento, Profissional, ConfiguracaoBarbearia, HorarioDisponivel
+from .models_mongo import ClienteMongo
+from . import busca, catalogo
+from .paginacao import ConsultaPaginada
+from .respostas import json_condicional, serializar
+from bson import ObjectId
 import json
 from datetime import datetime, timedelta
 
@@ -27,32 +32,34 @@ def lista_servicos(request):
     
     # Parâmetros de filtro
     categoria = request.GET.get('categoria')
-    busca = request.GET.get('busca', '').strip()
+    termo = request.GET.get('busca', '').strip()
     
-    # Busca serviços
-    servicos = Servico.buscar_servicos(
-        termo_busca=busca if busca else None,
-        categoria=categoria,
-        apenas_disponiveis=True
-    )
-    
-    # Converte QuerySet do MongoEngine para lista para paginação
-    servicos_list = list(servicos)
+    # Sem termo de busca a lista sai do catálogo em memória; com termo, a consulta
+    # usa o índice de termos e só a página exibida é lida do banco (skip/limit)
+    resumo = catalogo.resumo_servicos()
+    if termo:
+        servicos = Servico.buscar_servicos(
+            termo_busca=termo,
+            categoria=categoria,
+            apenas_disponiveis=True
+        )
+        total_servicos = servicos.count()
+        servicos = ConsultaPaginada(servicos, total_servicos)
+    else:
+        servicos = catalogo.servicos_disponiveis(categoria)
+        total_servicos = len(servicos)
     
     # Paginação - 12 serviços por página
-    paginator = Paginator(servicos_list, 12)
+    paginator = Paginator(servicos, 12)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
-    # Busca categorias disponíveis
-    categorias = Servico.get_categorias()
-    
     context = {
         'servicos': page_obj,
-        'categorias': categorias,
+        'categorias': resumo['categorias'],
         'categoria_atual': categoria,
-        'busca_atual': busca,
-        'total_servicos': len(servicos_list),
+        'busca_atual': termo,
+        'total_servicos': total_servicos,
         'page_title': 'Serviços Disponíveis'
     }
     
@@ -63,8 +70,10 @@ def servico_detalhe(request, servico_id):
     View que exibe os detalhes de um serviço específico
     """
     try:
-        # Buscar serviço
-        servico = Servico.objects.get(id=servico_id)
+        # Buscar serviço no catálogo em memória
+        servico = catalogo.servico(servico_id)
+        if servico is None:
+            raise Servico.DoesNotExist()
         
         # Preparar contexto com tratamento de tipos
         context = {
@@ -135,6 +144,11 @@ def agendar_servico(request):
             
             agendamento.save()
             
+            try:
+                ClienteMongo.registrar_agendamento(cliente_telefone, cliente_nome)
+            except Exception as e:
+                print(f"⚠️ Erro ao atualizar cliente: {str(e)}")
+            
             return JsonResponse({
                 'success': True,
                 'message': 'Agendamento realizado com sucesso!',
@@ -154,14 +168,16 @@ def agendar_servico(request):
         servico = None
         
         if servico_id:
-            servico = Servico.objects.get(id=servico_id)
-            profissionais = servico.profissionais_habilitados if servico.profissionais_habilitados else Profissional.objects(ativo=True)
+            servico = catalogo.servico(servico_id)
+            if servico is None:
+                raise Servico.DoesNotExist()
+            profissionais = catalogo.profissionais_do_servico(servico)
         else:
             # Se não especificou serviço, mostrar todos os profissionais
-            profissionais = Profissional.objects(ativo=True)
+            profissionais = catalogo.profissionais_ativos()
         
-        # Buscar todos os serviços para seleção
-        servicos = Servico.objects.filter(ativo=True).order_by('nome')
+        # Serviços disponíveis para seleção (catálogo em memória)
+        servicos = catalogo.servicos_disponiveis(ordem='nome')
         
         context = {
             'servico': servico,
@@ -197,25 +213,12 @@ def buscar_servicos_ajax(request):
                 'servicos': []
             })
         
-        # Buscar serviços
-        servicos = Servico.buscar_servicos(
-            termo_busca=termo,
-            apenas_disponiveis=True
-        )
-        
-        # Converter para JSON
-        servicos_data = []
-        for servico in servicos[:10]:  # Limitar a 10 resultados
-            servicos_data.append({
-                'id': str(servico.id),
-                'nome': servico.nome,
-                'descricao': servico.descricao,
-                'preco': float(servico.preco),
-                'categoria': servico.categoria.nome if servico.categoria else 'Outros'
-            })
+        # Sugestões vindas da árvore de prefixos em memória (sem consulta ao banco)
+        sugestoes = busca.sugerir(termo, limite=10)
         
         return JsonResponse({
-            'servicos': servicos_data
+            'servicos': [s for s in sugestoes if s['tipo'] == 'servico'],
+            'categorias': [s['nome'] for s in sugestoes if s['tipo'] == 'categoria']
         })
         
     except Exception as e:
@@ -242,37 +245,38 @@ def buscar_horarios_disponiveis(request):
         # Converter string para date
         data_obj = datetime.strptime(data_agendamento, '%Y-%m-%d').date()
         
-        # Buscar profissional
-        profissional = Profissional.objects.get(id=profissional_id)
-        
-        # Buscar horários disponíveis
-        horarios = HorarioDisponivel.get_horarios_disponiveis(profissional, data_obj)
-        
-        # Converter para JSON
-        horarios_data = []
-        for horario in horarios:
-            horarios_data.append({
-                'id': str(horario.id),
-                'hora_inicio': horario.hora_inicio,
-                'hora_fim': horario.hora_fim,
-                'disponivel': horario.disponivel,
-                'observacoes': horario.observacoes or ''
+        # Buscar profissional no catálogo em memória
+        profissional = catalogo.profissional(profissional_id)
+        if profissional is None:
+            return JsonResponse({
+                'horarios': [],
+                'message': 'Profissional não encontrado'
             })
         
-        return JsonResponse({
-            'horarios': horarios_data,
+        # Buscar horários disponíveis, lendo só os campos da resposta
+        horarios = HorarioDisponivel.get_horarios_disponiveis(ObjectId(profissional.id), data_obj).only(
+            'hora_inicio', 'hora_fim', 'disponivel', 'observacoes'
+        ).as_pymongo()
+        
+        corpo = serializar({
+            'horarios': [
+                {
+                    'id': str(horario['_id']),
+                    'hora_inicio': horario.get('hora_inicio'),
+                    'hora_fim': horario.get('hora_fim'),
+                    'disponivel': horario.get('disponivel', True),
+                    'observacoes': horario.get('observacoes') or ''
+                }
+                for horario in horarios
+            ],
             'profissional': {
-                'id': str(profissional.id),
+                'id': profissional.id,
                 'nome': profissional.nome_completo,
-                'especialidades': profissional.especialidades
+                'especialidades': list(profissional.especialidades)
             }
         })
+        return json_condicional(request, corpo)
         
-    except Profissional.DoesNotExist:
-        return JsonResponse({
-            'horarios': [],
-            'message': 'Profissional não encontrado'
-        })
     except Exception as e:
         print(f"❌ Erro ao buscar horários: {str(e)}")
         return JsonResponse({